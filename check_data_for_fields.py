@@ -4,15 +4,13 @@ This script will count how many records within an app have a value for a field
 """
 
 import argparse
-import builtins
 import json
 import logging
 import os
 
-from dotenv import load_dotenv
 from fulcrum import Fulcrum
 
-load_dotenv()
+from fulcrum_helpers.config import configure_logging, load_env
 
 parser = argparse.ArgumentParser()
 
@@ -27,57 +25,44 @@ parser.add_argument(
 # Debug argument
 parser.add_argument("--debug", help="Print debug statements", action="store_true")
 
-# Parse the arguments
-args = parser.parse_args()
+# The parsed arguments, set by configure()
+args = None  # type: argparse.Namespace
 
-# Get the Fulcrum API key from the environment variables
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-# Create the Fulcrum API object
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
+# The Fulcrum API key from the environment variables
+FULCRUM_API_KEY = None  # type: str
+# The Fulcrum API object
+FULCRUM = None  # type: Fulcrum
 # Store the name of the app to duplicate
 APP_NAME = None
-# The file containing the mappings
-TARGET_DATA_NAMES = args.data_names
+# The data names of the fields to check, comma-separated
+TARGET_DATA_NAMES = None  # type: str
 
 # The list of files created
 FILES_CREATED = []
 
-# Logging format of: [LEVEL]::[FUNCTION]::[HH:MM:SS] - [MESSAGE]
-# Where the level is colored based on the level and the rest except from the message is grey
-start = "\033["
-end = "\033[0m"
-colors = {
-    "GREEN": "32m",
-    "ORANGE": "33m",
-    "RED": "31m",
-    "GREY": "90m",
-}
-for color in colors:
-    # Add the start to the color
-    colors[color] = start + colors[color]
-
-logging.addLevelName(logging.DEBUG, f"{colors['GREEN']}DEBUG{colors['GREY']}")  # Green
-logging.addLevelName(logging.INFO, f"{colors['GREEN']}INFO{colors['GREY']}")  # Green
-logging.addLevelName(
-    logging.WARNING, f"{colors['ORANGE']}WARNING{colors['GREY']}"
-)  # Orange
-logging.addLevelName(logging.ERROR, f"{colors['RED']}ERROR{colors['GREY']}")  # Red
-logging.addLevelName(
-    logging.CRITICAL, f"{colors['RED']}CRITICAL{colors['GREY']}"
-)  # Red
-
-# Define the format of the logging
-logging.basicConfig(
-    format=f"%(levelname)s::%(funcName)s::%(asctime)s - {end}%(message)s",
-    datefmt="%H:%M:%S",
-)
-
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
 
-# If the name argument was passed, use it
-if args.name:
-    APP_NAME = args.name
+
+def configure(parsed_args):
+    """
+    Set the arguments, the constants and the API client
+    """
+    global args, FULCRUM_API_KEY, FULCRUM, APP_NAME, TARGET_DATA_NAMES
+
+    args = parsed_args
+
+    # Get the Fulcrum API key from the environment variables
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    # Create the Fulcrum API object
+    FULCRUM = Fulcrum(FULCRUM_API_KEY)
+    TARGET_DATA_NAMES = args.data_names
+
+    configure_logging()
+    logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
+
+    # If the name argument was passed, use it
+    if args.name:
+        APP_NAME = args.name
 
 
 def list_apps():
@@ -158,7 +143,7 @@ def get_data_name_field_key(app: dict, data_name: str):
     elements = flatten_app_elements(app)
 
     if args.debug:
-        with open("elements.json", "w") as f:
+        with create_file("elements.json", "w") as f:
             json.dump(elements, f, indent=4)
             logger.debug("Wrote elements to elements.json")
 
@@ -169,14 +154,14 @@ def get_data_name_field_key(app: dict, data_name: str):
     raise Exception(f"Could not find field with data name {data_name}")
 
 
-def open(filename, mode):
+def create_file(filename, mode):
     """
-    Override builtin "open" function to open file but add filename to the global list of files
+    Open a file and add the filename to the global list of files
     This is so we can delete them later
     """
     global FILES_CREATED
     FILES_CREATED.append(filename)
-    return builtins.open(filename, mode)
+    return open(filename, mode)
 
 
 def cleanup():
@@ -192,7 +177,10 @@ def split_data_names(data_names: str):
     return data_names.split(",")
 
 
-def main():
+def main(argv=None):
+    load_env()
+    configure(parser.parse_args(argv))
+
     # If the app name is not passed, list all apps and get the user to select one
     app = None
     if not APP_NAME:
@@ -202,7 +190,7 @@ def main():
         app = get_app(APP_NAME)
 
     if args.debug:
-        with open("app.json", "w") as f:
+        with create_file("app.json", "w") as f:
             json.dump(app, f, indent=4)
             logger.debug("Wrote app to app.json")
 
@@ -214,7 +202,7 @@ def main():
     logger.info(f"Found {len(app_records)} records")
 
     if args.debug:
-        with open("app_records.json", "w") as f:
+        with create_file("app_records.json", "w") as f:
             json.dump(app_records, f, indent=4)
             logger.debug("Wrote app records to app_records.json")
 
@@ -10,10 +10,9 @@ import json
 import logging
 import os
 
-from dotenv import load_dotenv
 from fulcrum import Fulcrum
 
-load_dotenv()
+from fulcrum_helpers.config import configure_logging, load_env
 
 parser = argparse.ArgumentParser()
 
@@ -26,56 +25,43 @@ parser.add_argument(
 # Debug argument
 parser.add_argument("--debug", help="Print debug statements", action="store_true")
 
-# Parse the arguments
-args = parser.parse_args()
+# The parsed arguments, set by configure()
+args = None  # type: argparse.Namespace
 
-# Get the Fulcrum API key from the environment variables
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-# Create the Fulcrum API object
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
+# The Fulcrum API key from the environment variables
+FULCRUM_API_KEY = None  # type: str
+# The Fulcrum API object
+FULCRUM = None  # type: Fulcrum
 # Store the name of the app to duplicate
 APP_NAME = None
 # The file containing the mappings
-MAPPING_FILE = args.target_mappings
+MAPPING_FILE = None  # type: str
 # The postfix to add to the new app name
 NEW_APP_POSTFIX = " - COPY (DO NOT USE)"
 
-# Logging format of: [LEVEL]::[FUNCTION]::[HH:MM:SS] - [MESSAGE]
-# Where the level is colored based on the level and the rest except from the message is grey
-start = "\033["
-end = "\033[0m"
-colors = {
-    "GREEN": "32m",
-    "ORANGE": "33m",
-    "RED": "31m",
-    "GREY": "90m",
-}
-for color in colors:
-    # Add the start to the color
-    colors[color] = start + colors[color]
-
-logging.addLevelName(logging.DEBUG, f"{colors['GREEN']}DEBUG{colors['GREY']}")  # Green
-logging.addLevelName(logging.INFO, f"{colors['GREEN']}INFO{colors['GREY']}")  # Green
-logging.addLevelName(
-    logging.WARNING, f"{colors['ORANGE']}WARNING{colors['GREY']}"
-)  # Orange
-logging.addLevelName(logging.ERROR, f"{colors['RED']}ERROR{colors['GREY']}")  # Red
-logging.addLevelName(
-    logging.CRITICAL, f"{colors['RED']}CRITICAL{colors['GREY']}"
-)  # Red
-
-# Define the format of the logging
-logging.basicConfig(
-    format=f"%(levelname)s::%(funcName)s::%(asctime)s - {end}%(message)s",
-    datefmt="%H:%M:%S",
-)
-
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
 
-# If the name argument was passed, use it
-if args.name:
-    APP_NAME = args.name
+
+def configure(parsed_args):
+    """
+    Set the arguments, the constants and the API client
+    """
+    global args, FULCRUM_API_KEY, FULCRUM, APP_NAME, MAPPING_FILE
+
+    args = parsed_args
+
+    # Get the Fulcrum API key from the environment variables
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    # Create the Fulcrum API object
+    FULCRUM = Fulcrum(FULCRUM_API_KEY)
+    MAPPING_FILE = args.target_mappings
+
+    configure_logging()
+    logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
+
+    # If the name argument was passed, use it
+    if args.name:
+        APP_NAME = args.name
 
 
 def list_apps():
@@ -151,7 +137,10 @@ def get_conditional_elements(elements: list):
     return conditional_elements
 
 
-def main():
+def main(argv=None):
+    load_env()
+    configure(parser.parse_args(argv))
+
     # If the app name is not passed, list all apps and get the user to select one
     app = None
     if not APP_NAME:
@@ -17,103 +17,109 @@ parser.add_argument(
     "--client_name_col", type=str, help="Client name column name", required=True
 )
 
-args = parser.parse_args()
 
-# Constants
+def main(argv=None):
+    args = parser.parse_args(argv)
 
-EXISTING_CLIENTELE = args.existing_clientele
-TARGET_FILE = args.target_file
-REF_COL_NAME = args.ref_col
-CLIENT_NAME_COL = args.client_name_col
-ID_COL = "fulcrum_id"
+    # Constants
 
-EXISTING_CLIENT_COL_NAME = "client_name"
+    EXISTING_CLIENTELE = args.existing_clientele
+    TARGET_FILE = args.target_file
+    REF_COL_NAME = args.ref_col
+    CLIENT_NAME_COL = args.client_name_col
+    ID_COL = "fulcrum_id"
 
-MISSING_CLIENT_NAMES_FILE = (
-    "new_files\\empty_client_names_"
-    + re.sub(r"\.csv", "", TARGET_FILE.split("\\")[-1])
-    + ".txt"
-)
+    EXISTING_CLIENT_COL_NAME = "client_name"
+
+    MISSING_CLIENT_NAMES_FILE = (
+        "new_files\\empty_client_names_"
+        + re.sub(r"\.csv", "", TARGET_FILE.split("\\")[-1])
+        + ".txt"
+    )
+
+    # Main
+
+    if not os.path.exists("new_files"):
+        os.makedirs("new_files")
 
-# Main
+    if os.path.exists(MISSING_CLIENT_NAMES_FILE):
+        os.remove(MISSING_CLIENT_NAMES_FILE)
 
-if not os.path.exists("new_files"):
-    os.makedirs("new_files")
+    client_names = []
+    acc_refs = []
+    existing_names = []
 
-if os.path.exists(MISSING_CLIENT_NAMES_FILE):
-    os.remove(MISSING_CLIENT_NAMES_FILE)
+    client_details = {}
 
-client_names = []
-acc_refs = []
-existing_names = []
+    # Read the existing clientele file
+    if (
+        EXISTING_CLIENTELE
+        and os.path.exists(EXISTING_CLIENTELE)
+        and os.path.getsize(EXISTING_CLIENTELE) > 0
+    ):
+        with open(EXISTING_CLIENTELE, "r") as f:
+            reader = csv.DictReader(f)
 
-client_details = {}
+            for row in reader:
+                existing_names.append(row[EXISTING_CLIENT_COL_NAME])
 
-# Read the existing clientele file
-if (
-    EXISTING_CLIENTELE
-    and os.path.exists(EXISTING_CLIENTELE)
-    and os.path.getsize(EXISTING_CLIENTELE) > 0
-):
-    with open(EXISTING_CLIENTELE, "r") as f:
+    # Read the file using csv
+    with open(TARGET_FILE, "r") as f:
         reader = csv.DictReader(f)
 
         for row in reader:
-            existing_names.append(row[EXISTING_CLIENT_COL_NAME])
-
-# Read the file using csv
-with open(TARGET_FILE, "r") as f:
-    reader = csv.DictReader(f)
-
-    for row in reader:
-        # Find account reference and client name
-        # Highlight duplicates
-        client_name = row[CLIENT_NAME_COL].strip()
-
-        if client_name in existing_names:
-            # This client name already exists
-            # This is not important
-            print(
-                f"ID: {row[ID_COL]}, Client name already exists: {client_name}, Account reference: {row[REF_COL_NAME]}"
-            )
-            continue
-
-        if not client_name:
-            # This is important
-            print(
-                f"ID: {row[ID_COL]}, Client name is empty, Account reference: {row[REF_COL_NAME]}"
-            )
-            open(MISSING_CLIENT_NAMES_FILE, "a").write(
-                f"Account reference: {row[REF_COL_NAME]}: Missing client name\n"
-            )
-
-        if client_name in client_names:
-            # This is not important
-            print(
-                f"ID: {row[ID_COL]}, Duplicate client name: {client_name}, Account reference: {row[REF_COL_NAME]}"
-            )
-        else:
-            client_names.append(client_name)
-
-        if row[REF_COL_NAME] in acc_refs:
-            # This is not important
-            print(
-                f"ID: {row[ID_COL]}, Duplicate account reference: {row[REF_COL_NAME]}, Client: {client_name}"
-            )
-        else:
-            acc_refs.append(row[REF_COL_NAME])
-
-        if client_name not in client_details:
-            client_details[client_name] = [row[REF_COL_NAME]]
-        else:
-            client_details[client_name].append(row[REF_COL_NAME])
-
-# Print the client details
-# for client in client_details:
-#     print(f"Client: {client}, Account references: {client_details[client]}")
-
-# Write the client names to a file
-with open("new_files\\new_client_names.csv", "w", newline="") as f:
-    writer = csv.writer(f)
-    writer.writerow(["client_name"])
-    writer.writerows([[client] for client in client_names])
+            # Find account reference and client name
+            # Highlight duplicates
+            client_name = row[CLIENT_NAME_COL].strip()
+
+            if client_name in existing_names:
+                # This client name already exists
+                # This is not important
+                print(
+                    f"ID: {row[ID_COL]}, Client name already exists: {client_name}, Account reference: {row[REF_COL_NAME]}"
+                )
+                continue
+
+            if not client_name:
+                # This is important
+                print(
+                    f"ID: {row[ID_COL]}, Client name is empty, Account reference: {row[REF_COL_NAME]}"
+                )
+                open(MISSING_CLIENT_NAMES_FILE, "a").write(
+                    f"Account reference: {row[REF_COL_NAME]}: Missing client name\n"
+                )
+
+            if client_name in client_names:
+                # This is not important
+                print(
+                    f"ID: {row[ID_COL]}, Duplicate client name: {client_name}, Account reference: {row[REF_COL_NAME]}"
+                )
+            else:
+                client_names.append(client_name)
+
+            if row[REF_COL_NAME] in acc_refs:
+                # This is not important
+                print(
+                    f"ID: {row[ID_COL]}, Duplicate account reference: {row[REF_COL_NAME]}, Client: {client_name}"
+                )
+            else:
+                acc_refs.append(row[REF_COL_NAME])
+
+            if client_name not in client_details:
+                client_details[client_name] = [row[REF_COL_NAME]]
+            else:
+                client_details[client_name].append(row[REF_COL_NAME])
+
+    # Print the client details
+    # for client in client_details:
+    #     print(f"Client: {client}, Account references: {client_details[client]}")
+
+    # Write the client names to a file
+    with open("new_files\\new_client_names.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["client_name"])
+        writer.writerows([[client] for client in client_names])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,13 @@
 import argparse
 import os
-import time
 
-from dotenv import load_dotenv
 from fulcrum import Fulcrum
 from tqdm import tqdm
 
-load_dotenv()
+from fulcrum_helpers.bulk_delete import DEFAULT_WORKERS, BulkDeleter, DeletionManifest
+from fulcrum_helpers.config import configure_logging, load_env
+from fulcrum_helpers.schema import SchemaRegistry
+from fulcrum_helpers.transport import Transport, use_transport
 
 parser = argparse.ArgumentParser(description="Update records.")
 parser.add_argument(
@@ -15,45 +16,61 @@ parser.add_argument(
 parser.add_argument(
     "--record_mappings_file", "-r", help="The file containing the record mappings."
 )
-args = parser.parse_args()
+parser.add_argument(
+    "--manifest_dir",
+    "-m",
+    help="The directory the deletion manifest is kept in (deletions/<form_id> by default), an existing manifest is resumed.",
+)
+parser.add_argument(
+    "--no_backup",
+    action="store_true",
+    help="Whether to skip the snapshot of the full records taken before they are deleted.",
+)
+parser.add_argument(
+    "--workers",
+    "-w",
+    type=int,
+    default=DEFAULT_WORKERS,
+    help="The number of deletes to run at once.",
+)
+parser.add_argument(
+    "--dry_run",
+    "-d",
+    action="store_true",
+    help="Whether to only write the manifest without deleting records.",
+)
+parser.add_argument(
+    "--yes", "-y", action="store_true", help="Whether to skip the confirmation."
+)
+# Set from the arguments by configure()
+
+args = None  # type: argparse.Namespace
 
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
+FULCRUM_API_KEY = None  # type: str
+TRANSPORT = None  # type: Transport
+FULCRUM = None  # type: Fulcrum
+SCHEMAS = None  # type: SchemaRegistry
 
-FORM_NAME = args.form_name
-RECORD_MAPPINGS_FILE = args.record_mappings_file
+FORM_NAME = None  # type: str
+RECORD_MAPPINGS_FILE = None  # type: str
 
 
-def rate_limited(max_per_second):
+def configure(parsed_args):
     """
-    Decorator to limit the rate of function calls.
+    Set the arguments, the API clients and the constants
     """
-    minimum_interval = 1.0 / float(max_per_second)
-
-    def decorate(func):
-        last_time_called = [0.0]
-
-        def rate_limited_function(*args, **kargs):
-            elapsed = time.perf_counter() - last_time_called[0]
-            left_to_wait = minimum_interval - elapsed
-            if left_to_wait > 0:
-                time.sleep(left_to_wait)
-            ret = func(*args, **kargs)
-            last_time_called[0] = time.perf_counter()
-            return ret
-
-        return rate_limited_function
+    global args, FULCRUM_API_KEY, TRANSPORT, FULCRUM, SCHEMAS, FORM_NAME
+    global RECORD_MAPPINGS_FILE
 
-    return decorate
+    args = parsed_args
 
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    TRANSPORT = Transport(FULCRUM_API_KEY, pool_size=args.workers)
+    FULCRUM = use_transport(Fulcrum(FULCRUM_API_KEY), TRANSPORT)
+    SCHEMAS = SchemaRegistry(TRANSPORT)
 
-# Rate limited for 4000 calls per hour (actual limit is 5000/h but we want to be safe)
-@rate_limited(4000 / 3600)
-def delete_record(record_id: str):
-    """
-    Delete a record by ID
-    """
-    FULCRUM.records.delete(record_id)
+    FORM_NAME = args.form_name
+    RECORD_MAPPINGS_FILE = args.record_mappings_file
 
 
 def should_delete_record(record: dict):
@@ -63,34 +80,66 @@ def should_delete_record(record: dict):
     return True
 
 
-def main():
+def main(argv=None):
+    load_env()
+    configure(parser.parse_args(argv))
+
+    configure_logging()
+
     target_form = None
 
-    forms = FULCRUM.forms.search()
+    if not args.manifest_dir:
+        target_form = SCHEMAS.get_app(FORM_NAME)
+
+        if not target_form:
+            print("Form not found")
+            return
+
+    manifest = DeletionManifest(
+        args.manifest_dir or os.path.join("deletions", target_form["id"])
+    )
+
+    if manifest.exists():
+        manifest.load()
+
+    # A manifest that has been deleted in full is replaced by a new one
+    if manifest.exists() and manifest.pending():
+        print(f"Resuming the deletion manifest in {manifest.directory}")
+    else:
+        target_form = target_form or SCHEMAS.get_app(FORM_NAME)
+
+        if not target_form:
+            print("Form not found")
+            return
+
+        manifest.build(
+            TRANSPORT, target_form["id"], should_delete_record, not args.no_backup
+        )
 
-    for form in forms["forms"]:
-        if form["name"] == FORM_NAME:
-            target_form = form
-            break
+    pending = manifest.pending()
+    print(f"Records to delete: {len(pending)} (manifest: {manifest.manifest_path})")
 
-    if not target_form:
-        print("Form not found")
+    if not pending or args.dry_run:
         return
 
-    all_form_records = FULCRUM.records.search(url_params={"form_id": target_form["id"]})
+    if not args.yes:
+        answer = input(f"Delete {len(pending)} records? (y/n): ")
+        if answer.lower() != "y":
+            print("Exiting...")
+            return
 
-    progress_bar = tqdm(
-        all_form_records["records"],
-        total=len(all_form_records["records"]),
-        desc="Deleting records",
-    )
+    progress_bar = tqdm(total=len(pending), desc="Deleting records")
+
+    def on_result(record_id: str, deleted: bool):
+        progress_bar.update(1)
+        progress_bar.set_description(
+            f"{'Deleted' if deleted else 'Failed to delete'} record: {record_id}"
+        )
+
+    deleted_count = BulkDeleter(FULCRUM, manifest, args.workers).run(on_result)
+    progress_bar.close()
 
-    for record in progress_bar:
-        if should_delete_record(record):
-            # delete_record(record["id"])
-            progress_bar.set_description(f"Deleting record: {record['id']}")
-        else:
-            progress_bar.set_description(f"Skipping record: {record['id']}")
+    print(f"Deleted {deleted_count} of {len(pending)} records")
 
 
 if __name__ == "__main__":
@@ -10,11 +10,9 @@ import os
 from copy import deepcopy
 from enum import Enum
 
-from dotenv import load_dotenv
 from fulcrum import Fulcrum
 
-# * Configuration
-load_dotenv()
+from fulcrum_helpers.config import configure_logging, load_env
 
 # * Arguments
 parser = argparse.ArgumentParser()
@@ -27,18 +25,12 @@ parser.add_argument(
     "--verbose", "-v", help="Print debug statements", action="store_true"
 )
 
-# Parse the arguments
-args = parser.parse_args()
+# * Set global variables, from the arguments by configure()
+FULCRUM_API_KEY = None  # type: str
+FULCRUM = None  # type: Fulcrum
 
-
-# * Set global variables
-# Get the Fulcrum API key from the environment variables
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-# Create the Fulcrum API object
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
-
-APP_1_NAME = args.app_1
-APP_2_NAME = args.app_2
+APP_1_NAME = None  # type: str
+APP_2_NAME = None  # type: str
 
 TEMP_DIR_NAME = "differences_between_apps"
 
@@ -47,39 +39,28 @@ PARENT_ELEMENT_TYPES = [
     "Repeatable",
 ]
 
-# * Configure logging
-# Logging format of: [LEVEL]::[FUNCTION]::[HH:MM:SS] - [MESSAGE]
-# Where the level is colored based on the level and the rest except from the message is grey
-start = "\033["
-end = "\033[0m"
-colors = {
-    "GREEN": "32m",
-    "ORANGE": "33m",
-    "RED": "31m",
-    "GREY": "90m",
-}
-for color in colors:
-    # Add the start to the color
-    colors[color] = start + colors[color]
-
-logging.addLevelName(logging.DEBUG, f"{colors['GREEN']}DEBUG{colors['GREY']}")  # Green
-logging.addLevelName(logging.INFO, f"{colors['GREEN']}INFO{colors['GREY']}")  # Green
-logging.addLevelName(
-    logging.WARNING, f"{colors['ORANGE']}WARNING{colors['GREY']}"
-)  # Orange
-logging.addLevelName(logging.ERROR, f"{colors['RED']}ERROR{colors['GREY']}")  # Red
-logging.addLevelName(
-    logging.CRITICAL, f"{colors['RED']}CRITICAL{colors['GREY']}"
-)  # Red
-
-# Define the format of the logging
-logging.basicConfig(
-    format=f"%(levelname)s::%(funcName)s::%(asctime)s - {end}%(message)s",
-    datefmt="%H:%M:%S",
-)
-
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+
+
+def configure(args):
+    """
+    Set the global variables, the API client and the logging from the parsed
+    arguments
+    """
+    global FULCRUM_API_KEY, FULCRUM, APP_1_NAME, APP_2_NAME
+
+    # Get the Fulcrum API key from the environment variables
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    # Create the Fulcrum API object
+    FULCRUM = Fulcrum(FULCRUM_API_KEY)
+
+    APP_1_NAME = args.app_1
+    APP_2_NAME = args.app_2
+
+    # * Configure logging
+    configure_logging()
+
+    logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
 
 
 # * Functions
@@ -471,7 +452,10 @@ def find_differences_between_apps(app_1, app_2):
 
 
 # * Main
-def main():
+def main(argv=None):
+    load_env()
+    configure(parser.parse_args(argv))
+
     app_1, app_2 = get_both_apps()
     write_json_to_file(f"app_1_{app_1['name']}.json", app_1)
     write_json_to_file(f"app_2_{app_2['name']}.json", app_2)
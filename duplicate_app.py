@@ -4,13 +4,15 @@ import json
 import logging
 import os
 import random
-import time
 
-from dotenv import load_dotenv
 from fulcrum import Fulcrum
 from tqdm import tqdm
 
-load_dotenv()
+from fulcrum_helpers.config import configure_logging, load_env
+from fulcrum_helpers.helpers import rate_limited
+from fulcrum_helpers.media import MediaCopier, rewrite_media_references
+from fulcrum_helpers.resilience import ResilientWriter, find_created_record
+from fulcrum_helpers.transport import Transport, use_transport
 
 parser = argparse.ArgumentParser()
 
@@ -32,64 +34,76 @@ parser.add_argument(
     help="Progressively duplicate the app. Helpful when an existing duplication has failed.",
     action="store_true",
 )
-# Parse the arguments
-args = parser.parse_args()
-
-# Get the Fulcrum API key from the environment variables
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-# Create the Fulcrum API object
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
+parser.add_argument(
+    "--copy-media",
+    help="Copy the photos, videos, audio and signatures of the records instead of referencing the source app's media",
+    action="store_true",
+)
+parser.add_argument(
+    "--media-workers",
+    help="The number of parallel workers used to copy media",
+    type=int,
+    default=8,
+)
+# The parsed arguments, set by configure()
+args = None  # type: argparse.Namespace
+
+# The Fulcrum API key from the environment variables
+FULCRUM_API_KEY = None  # type: str
+# The Fulcrum API object
+FULCRUM = None  # type: Fulcrum
+# Retries writes and keeps the ones that fail for good in a dead letter file,
+# the records that have been created are journaled so a rerun skips them
+WRITER = None  # type: ResilientWriter
 # Store the name of the app to duplicate
 APP_NAME = None
 # The postfix to add to the new app name
-NEW_APP_POSTFIX = args.postfix or " - COPY (DO NOT USE)"
+NEW_APP_POSTFIX = " - COPY (DO NOT USE)"
 # If the user has confirmed all prompts
-CONFIRMED = args.yes
+CONFIRMED = False
 # If the user wants to progressively duplicate the app
-PROGRESSIVE = args.progressive
-
-# Logging format of: [LEVEL]::[FUNCTION]::[HH:MM:SS] - [MESSAGE]
-# Where the level is colored based on the level and the rest except from the message is grey
-start = "\033["
-end = "\033[0m"
-colors = {
-    "GREEN": "32m",
-    "ORANGE": "33m",
-    "RED": "31m",
-    "GREY": "90m",
-}
-for color in colors:
-    # Add the start to the color
-    colors[color] = start + colors[color]
-
-logging.addLevelName(logging.DEBUG, f"{colors['GREEN']}DEBUG{colors['GREY']}")  # Green
-logging.addLevelName(logging.INFO, f"{colors['GREEN']}INFO{colors['GREY']}")  # Green
-logging.addLevelName(
-    logging.WARNING, f"{colors['ORANGE']}WARNING{colors['GREY']}"
-)  # Orange
-logging.addLevelName(logging.ERROR, f"{colors['RED']}ERROR{colors['GREY']}")  # Red
-logging.addLevelName(
-    logging.CRITICAL, f"{colors['RED']}CRITICAL{colors['GREY']}"
-)  # Red
-
-# Define the format of the logging
-logging.basicConfig(
-    format=f"%(levelname)s::%(funcName)s::%(asctime)s - {end}%(message)s",
-    datefmt="%H:%M:%S",
-)
+PROGRESSIVE = False
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
 
-# If the name argument was passed, use it
-if args.name:
-    APP_NAME = args.name
 
-if args.dry_run:
-    logger.info("Dry run enabled")
+def configure(parsed_args):
+    """
+    Set the arguments, the constants and the API client
+    """
+    global args, FULCRUM_API_KEY, FULCRUM, WRITER, APP_NAME, NEW_APP_POSTFIX
+    global CONFIRMED, PROGRESSIVE
+
+    args = parsed_args
+
+    # Get the Fulcrum API key from the environment variables
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    # Create the Fulcrum API object
+    FULCRUM = use_transport(Fulcrum(FULCRUM_API_KEY), Transport(FULCRUM_API_KEY))
+    WRITER = ResilientWriter(
+        dead_letter_path="duplicate_app_dead_letter.jsonl",
+        journal_path="duplicate_app_journal.jsonl",
+    )
+    NEW_APP_POSTFIX = args.postfix or " - COPY (DO NOT USE)"
+    CONFIRMED = args.yes
+    PROGRESSIVE = args.progressive
+
+    configure_logging()
+
+    logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
 
+    # If the name argument was passed, use it
+    if args.name:
+        APP_NAME = args.name
+
+    if args.dry_run:
+        logger.info("Dry run enabled")
+
+
+def main(argv=None):
+    load_env()
+    configure(parser.parse_args(argv))
 
-def main():
     # If the app name is not passed, list all apps and get the user to select one
     app = None
     if not APP_NAME:
@@ -278,6 +292,20 @@ def duplicate_app(app: dict, app_already_exists: bool = False):
     # Get the records to duplicate
     records_to_duplicate = records[:number_of_records_to_duplicate]
 
+    # Copy the media before creating the records so the references can be rewritten
+    media_id_map = {}
+    if args.copy_media:
+        logger.info("Copying record media")
+        media_copier = MediaCopier(
+            FULCRUM_API_KEY, workers=args.media_workers, dry_run=args.dry_run
+        )
+        try:
+            media_id_map = media_copier.copy(records_to_duplicate, app["id"])
+        except Exception as e:
+            logger.error("Failed to copy record media", exc_info=e)
+            exit(1)
+        logger.info(f"Copied {len(media_id_map)} media files")
+
     # Create the new records
     logger.debug(
         f"Creating {len(records_to_duplicate)} records for app: {new_app_name}"
@@ -298,6 +326,10 @@ def duplicate_app(app: dict, app_already_exists: bool = False):
                 continue
 
         record = correct_record(app, record)
+        if media_id_map:
+            record["form_values"] = rewrite_media_references(
+                record["form_values"], media_id_map
+            )
         progress_records.set_description(f"Creating record: {record['id']}")
 
         try:
@@ -352,29 +384,6 @@ def get_app_records(app_id: str):
     return records
 
 
-def rate_limited(max_per_second):
-    """
-    Decorator to limit the rate of function calls.
-    """
-    minimum_interval = 1.0 / float(max_per_second)
-
-    def decorate(func):
-        last_time_called = [0.0]
-
-        def rate_limited_function(*args, **kargs):
-            elapsed = time.perf_counter() - last_time_called[0]
-            left_to_wait = minimum_interval - elapsed
-            if left_to_wait > 0:
-                time.sleep(left_to_wait)
-            ret = func(*args, **kargs)
-            last_time_called[0] = time.perf_counter()
-            return ret
-
-        return rate_limited_function
-
-    return decorate
-
-
 # Rate limited for 4000 calls per hour (actual limit is 5000/h but we want to be safe)
 @rate_limited(4000 / 3600)
 def create_app_record(record: dict, app_id: str):
@@ -388,18 +397,30 @@ def create_app_record(record: dict, app_id: str):
 
     # Create the record
     if not args.dry_run:
-        new_record = FULCRUM.records.create(
-            {
-                "record": {
-                    "form_id": app_id,
-                    "status": record_status,
-                    "form_values": record_form_values,
-                    "longitude": record_longitude,
-                    "latitude": record_latitude,
-                }
+        payload = {
+            "record": {
+                "form_id": app_id,
+                "status": record_status,
+                "form_values": record_form_values,
+                "longitude": record_longitude,
+                "latitude": record_latitude,
             }
+        }
+        new_record = WRITER.create(
+            "create_record",
+            FULCRUM.records.create,
+            payload,
+            # The same app can be duplicated more than once
+            key=f"{app_id}:{record_id}",
+            payload=payload,
+            # A create that timed out may still have reached Fulcrum
+            find_existing=find_created_record(FULCRUM, payload),
         )
 
+        if not new_record:
+            # Written to the dead letter file, carry on with the next record
+            return
+
         # Get the new record id
         new_record_id = (
             new_record["record"]["id"] if "id" in new_record["record"] else None
@@ -17,6 +17,8 @@ import os
 import re
 import shutil
 
+from fulcrum_helpers.config import configure_logging
+
 # Arguments
 parser = argparse.ArgumentParser(description="Find differences between 2 csv files")
 
@@ -35,63 +37,52 @@ parser.add_argument(
     required=False,
 )
 
-args = parser.parse_args()
-
 # Logging
 
-# Logging format of: [LEVEL]::[FUNCTION]::[HH:MM:SS] - [MESSAGE]
-# Where the level is colored based on the level and the rest except from the message is grey
-start = "\033["
-end = "\033[0m"
-colors = {
-    "GREEN": "32m",
-    "ORANGE": "33m",
-    "RED": "31m",
-    "GREY": "90m",
-}
-for color in colors:
-    # Add the start to the color
-    colors[color] = start + colors[color]
-
-logging.addLevelName(logging.DEBUG, f"{colors['GREEN']}DEBUG{colors['GREY']}")  # Green
-logging.addLevelName(logging.INFO, f"{colors['GREEN']}INFO{colors['GREY']}")  # Green
-logging.addLevelName(
-    logging.WARNING, f"{colors['ORANGE']}WARNING{colors['GREY']}"
-)  # Orange
-logging.addLevelName(logging.ERROR, f"{colors['RED']}ERROR{colors['GREY']}")  # Red
-logging.addLevelName(
-    logging.CRITICAL, f"{colors['RED']}CRITICAL{colors['GREY']}"
-)  # Red
-
-# Define the format of the logging
-logging.basicConfig(
-    format=f"%(levelname)s::%(funcName)s::%(asctime)s - {end}%(message)s",
-    datefmt="%H:%M:%S",
-)
-
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
 
 
-# Constants
+# Constants, set from the arguments by configure()
 
 
-PARENT_DIR = args.parent_dir
+PARENT_DIR = None  # type: str
 
-BASE_PARENT_DIR = f"new_files\\{PARENT_DIR}"
+BASE_PARENT_DIR = None  # type: str
 
-BASE_DIR = args.base_dir
-BASE_PREFIX = args.base_prefix
+BASE_DIR = None  # type: str
+BASE_PREFIX = None  # type: str
 
-TARGET_DIR = args.target_dir
-TARGET_PREFIX = args.target_prefix
+TARGET_DIR = None  # type: str
+TARGET_PREFIX = None  # type: str
 
-SKIP_PROMPT_MATCHING = args.skip_prompt_matching
+SKIP_PROMPT_MATCHING = False
 
 
 # Functions
 
 
+def configure(args):
+    """
+    Set the constants and the log level from the parsed arguments
+    """
+    global PARENT_DIR, BASE_PARENT_DIR, BASE_DIR, BASE_PREFIX, TARGET_DIR
+    global TARGET_PREFIX, SKIP_PROMPT_MATCHING
+
+    logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
+
+    PARENT_DIR = args.parent_dir
+
+    BASE_PARENT_DIR = os.path.join("new_files", PARENT_DIR)
+
+    BASE_DIR = args.base_dir
+    BASE_PREFIX = args.base_prefix
+
+    TARGET_DIR = args.target_dir
+    TARGET_PREFIX = args.target_prefix
+
+    SKIP_PROMPT_MATCHING = args.skip_prompt_matching
+
+
 def read_csv_columns(file_path):
     """Read a csv file and return a list of rows"""
     # Open the file
@@ -105,12 +96,12 @@ def create_table(rows):
 
 
 def delete_mismatch_file():
-    if os.path.exists(f"{BASE_PARENT_DIR}\\repeatable_mismatches.txt"):
-        os.remove(f"{BASE_PARENT_DIR}\\repeatable_mismatches.txt")
+    if os.path.exists(os.path.join(BASE_PARENT_DIR, "repeatable_mismatches.txt")):
+        os.remove(os.path.join(BASE_PARENT_DIR, "repeatable_mismatches.txt"))
 
 
 def write_file_no_match(filepath):
-    with open(f"{BASE_PARENT_DIR}\\repeatable_mismatches.txt", "a") as f:
+    with open(os.path.join(BASE_PARENT_DIR, "repeatable_mismatches.txt"), "a") as f:
         f.write(filepath + "\n")
 
 
@@ -885,10 +876,10 @@ def find_and_write_diffs(base, target, prefix):
     # Create table
     table = create_table(rows)
 
-    dest_dir = f"{BASE_PARENT_DIR}\\differences\\{prefix}"
+    dest_dir = os.path.join(BASE_PARENT_DIR, "differences", prefix)
     clear_and_create_dir(dest_dir)
 
-    diff_file_dest = f"{dest_dir}\\differences.csv"
+    diff_file_dest = os.path.join(dest_dir, "differences.csv")
 
     # Save table to file
     with open(diff_file_dest, "w", newline="") as f:
@@ -898,12 +889,12 @@ def find_and_write_diffs(base, target, prefix):
     mappings = {}
     mappings_exist = False
 
-    mappings_dir = f"{BASE_PARENT_DIR}\\mappings\\{prefix}"
+    mappings_dir = os.path.join(BASE_PARENT_DIR, "mappings", prefix)
 
     if not os.path.exists(mappings_dir):
         os.makedirs(mappings_dir)
 
-    mappings_file = f"{mappings_dir}\\mappings.json"
+    mappings_file = os.path.join(mappings_dir, "mappings.json")
 
     if os.path.exists(mappings_file):
         with open(mappings_file, "r") as f:
@@ -972,7 +963,7 @@ def find_and_write_diffs(base, target, prefix):
     with open(mappings_file, "w") as f:
         json.dump(mappings, f, indent=2)
 
-    unmatched_file_dest = f"{dest_dir}\\unmatched_columns.csv"
+    unmatched_file_dest = os.path.join(dest_dir, "unmatched_columns.csv")
 
     # Write unmatched columns to file
     with open(unmatched_file_dest, "w", newline="") as f:
@@ -992,106 +983,112 @@ def get_correct_file_name(f):
     return f
 
 
-# Main
+def main(argv=None):
+    configure(parser.parse_args(argv))
+    configure_logging()
 
-if not os.path.exists(f"{BASE_PARENT_DIR}"):
-    os.makedirs(f"{BASE_PARENT_DIR}")
+    if not os.path.exists(f"{BASE_PARENT_DIR}"):
+        os.makedirs(f"{BASE_PARENT_DIR}")
 
-delete_mismatch_file()
+    delete_mismatch_file()
 
-if PARENT_DIR == "JKMR":
-    # This re-writes some repeatables so it can match the survey
-    transform_knotweed_survey_repeatable_jkmr()
-    transform_knotweed_survey_stand_details_jkmr()
+    if PARENT_DIR == "JKMR":
+        # This re-writes some repeatables so it can match the survey
+        transform_knotweed_survey_repeatable_jkmr()
+        transform_knotweed_survey_stand_details_jkmr()
 
-if PARENT_DIR == "JKMR_SV":
-    transform_site_visits_jkmr()
+    if PARENT_DIR == "JKMR_SV":
+        transform_site_visits_jkmr()
 
-if PARENT_DIR == "IPMR":
-    transform_base_ipmr()
-    transform_stand_details_ipmr()
+    if PARENT_DIR == "IPMR":
+        transform_base_ipmr()
+        transform_stand_details_ipmr()
 
-if PARENT_DIR == "IPMR_SV":
-    transform_base_for_service_visits_ipmr()
-    transform_service_visits_ipmr()
+    if PARENT_DIR == "IPMR_SV":
+        transform_base_for_service_visits_ipmr()
+        transform_service_visits_ipmr()
 
-# Read all the files in the base & target directory
-base_files = get_files(BASE_DIR, BASE_PREFIX)
+    # Read all the files in the base & target directory
+    base_files = get_files(BASE_DIR, BASE_PREFIX)
 
-target_files = []
+    target_files = []
 
-if re.search(r"_SV$", PARENT_DIR):
-    # We only check the base and the re-written site visits when we are doing a site visits comparison
-    target_files = [
-        f"{TARGET_PREFIX}.csv",
-        f"{TARGET_PREFIX}_site_visits_re_written.csv"
-        if PARENT_DIR == "JKMR"
-        else f"{TARGET_PREFIX}_service_visit_records_re_written.csv",
-    ]
-else:
-    target_files = get_files(TARGET_DIR, TARGET_PREFIX)
-
-# Loop through each target file, find the base equivalent and compare
-for f in target_files:
-    # Skip these files
-    if (
-        PARENT_DIR == "JKMR"
-        and (
-            # ? Not sure why we skip on the re-written base file
-            # ? Anyways, this work is done so maybe we can ignore this
-            # ? logic
-            f == f"{TARGET_PREFIX}_base_re_written.csv"
-            or f == f"{TARGET_PREFIX}_knotweed_survey.csv"
-        )
-    ) or (PARENT_DIR == "IPMR" and f == f"{TARGET_PREFIX}_stand_details.csv"):
-        continue
+    if re.search(r"_SV$", PARENT_DIR):
+        # We only check the base and the re-written site visits when we are doing a site visits comparison
+        target_files = [
+            f"{TARGET_PREFIX}.csv",
+            f"{TARGET_PREFIX}_site_visits_re_written.csv"
+            if PARENT_DIR == "JKMR"
+            else f"{TARGET_PREFIX}_service_visit_records_re_written.csv",
+        ]
+    else:
+        target_files = get_files(TARGET_DIR, TARGET_PREFIX)
+
+    # Loop through each target file, find the base equivalent and compare
+    for f in target_files:
+        # Skip these files
+        if (
+            PARENT_DIR == "JKMR"
+            and (
+                # ? Not sure why we skip on the re-written base file
+                # ? Anyways, this work is done so maybe we can ignore this
+                # ? logic
+                f == f"{TARGET_PREFIX}_base_re_written.csv"
+                or f == f"{TARGET_PREFIX}_knotweed_survey.csv"
+            )
+        ) or (PARENT_DIR == "IPMR" and f == f"{TARGET_PREFIX}_stand_details.csv"):
+            continue
 
-    # Sometimes we want to use a different file name, this functions provides those mappings
-    target_f = get_correct_file_name(f)
+        # Sometimes we want to use a different file name, this functions provides those mappings
+        target_f = get_correct_file_name(f)
 
-    # If the file is the prefix then this is the parent file
-    if f == f"{TARGET_PREFIX}.csv":
-        new_postfix, base_filepath = get_matching_file()
+        # If the file is the prefix then this is the parent file
+        if f == f"{TARGET_PREFIX}.csv":
+            new_postfix, base_filepath = get_matching_file()
 
-        does_base_file_exist = does_file_exist(base_filepath)
+            does_base_file_exist = does_file_exist(base_filepath)
 
-        # If the base file doesn't exist then raise an exception
-        if not does_base_file_exist:
-            write_file_no_match(base_filepath)
+            # If the base file doesn't exist then raise an exception
+            if not does_base_file_exist:
+                write_file_no_match(base_filepath)
 
-        # Read the files
-        base_rows = read_csv_columns(base_filepath) if does_base_file_exist else []
-        target_rows = read_csv_columns(os.path.join(TARGET_DIR, target_f))
+            # Read the files
+            base_rows = read_csv_columns(base_filepath) if does_base_file_exist else []
+            target_rows = read_csv_columns(os.path.join(TARGET_DIR, target_f))
+
+            # Find and write differences
+            find_and_write_diffs(
+                base_rows, target_rows, "base" if does_base_file_exist else "NO_MATCH_base"
+            )
+        else:
+            # These are the child repeatables
+            # Grab the postfix
+            postfix = f.replace(f"{TARGET_PREFIX}_", "").replace(".csv", "")
+
+            # Base filepath
+            new_postfix, base_filepath = get_matching_file(postfix)
+
+            does_base_file_exist = does_file_exist(base_filepath)
+
+            # If the base file doesn't exist then raise an exception
+            if not does_base_file_exist:
+                write_file_no_match(base_filepath)
+
+            # Read the files
+            base_rows = read_csv_columns(base_filepath) if does_base_file_exist else []
+            target_rows = read_csv_columns(os.path.join(TARGET_DIR, target_f))
+
+            # Find and write differences
+            find_and_write_diffs(
+                base_rows,
+                target_rows,
+                new_postfix.lower()
+                if does_base_file_exist
+                else "NO_MATCH_" + new_postfix.lower(),
+            )
+
+    logger.info("Success")
 
-        # Find and write differences
-        find_and_write_diffs(
-            base_rows, target_rows, "base" if does_base_file_exist else "NO_MATCH_base"
-        )
-    else:
-        # These are the child repeatables
-        # Grab the postfix
-        postfix = f.replace(f"{TARGET_PREFIX}_", "").replace(".csv", "")
-
-        # Base filepath
-        new_postfix, base_filepath = get_matching_file(postfix)
-
-        does_base_file_exist = does_file_exist(base_filepath)
-
-        # If the base file doesn't exist then raise an exception
-        if not does_base_file_exist:
-            write_file_no_match(base_filepath)
-
-        # Read the files
-        base_rows = read_csv_columns(base_filepath) if does_base_file_exist else []
-        target_rows = read_csv_columns(os.path.join(TARGET_DIR, target_f))
-
-        # Find and write differences
-        find_and_write_diffs(
-            base_rows,
-            target_rows,
-            new_postfix.lower()
-            if does_base_file_exist
-            else "NO_MATCH_" + new_postfix.lower(),
-        )
 
-logger.info("Success")
+if __name__ == "__main__":
+    main()
@@ -5,19 +5,16 @@ We do this by checking whether the conditional is being met or not.
 If the conditional to show the data is not met, we print the record ID, data_name of the field and the value of the field.
 """
 import argparse
-import builtins
 import json
 import logging
 import os
 import typing as t
 
-from dotenv import load_dotenv
-from fulcrum import Fulcrum
-
+from fulcrum_helpers.config import configure_logging, load_env
+from fulcrum_helpers.helpers import iter_record_pages
+from fulcrum_helpers.transport import Transport, use_transport
 from fulcrum_helpers.types import AddressValue, AppElement, DictValue, PhotoValue
 
-load_dotenv()
-
 parser = argparse.ArgumentParser(description="Find hidden data in an app")
 
 # The name of the app to match on, not required
@@ -27,56 +24,41 @@ parser.add_argument(
     "--debug", help="Whether we should run in debug mode or not", action="store_true"
 )
 
-# Parse the arguments
-args = parser.parse_args()
-
 APP_NAME = None
-DEBUG = args.debug
+DEBUG = False
 
-# Get the Fulcrum API key from the environment variables
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-# Create the Fulcrum API object
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
+# Set from the arguments by configure()
+FULCRUM_API_KEY = None  # type: str
+TRANSPORT = None  # type: Transport
+FULCRUM = None  # type: Fulcrum
 
 # The list of files created
 FILES_CREATED = []
 
-# Logging format of: [LEVEL]::[FUNCTION]::[HH:MM:SS] - [MESSAGE]
-# Where the level is colored based on the level and the rest except from the message is grey
-start = "\033["
-end = "\033[0m"
-colors = {
-    "GREEN": "32m",
-    "ORANGE": "33m",
-    "RED": "31m",
-    "GREY": "90m",
-}
-for color in colors:
-    # Add the start to the color
-    colors[color] = start + colors[color]
-
-logging.addLevelName(logging.DEBUG, f"{colors['GREEN']}DEBUG{colors['GREY']}")  # Green
-logging.addLevelName(logging.INFO, f"{colors['GREEN']}INFO{colors['GREY']}")  # Green
-logging.addLevelName(
-    logging.WARNING, f"{colors['ORANGE']}WARNING{colors['GREY']}"
-)  # Orange
-logging.addLevelName(logging.ERROR, f"{colors['RED']}ERROR{colors['GREY']}")  # Red
-logging.addLevelName(
-    logging.CRITICAL, f"{colors['RED']}CRITICAL{colors['GREY']}"
-)  # Red
-
-# Define the format of the logging
-logging.basicConfig(
-    format=f"%(levelname)s::%(funcName)s::%(asctime)s - {end}%(message)s",
-    datefmt="%H:%M:%S",
-)
-
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
 
-# If the name argument was passed, use it
-if args.app_name:
-    APP_NAME = args.name
+
+def configure(args):
+    """
+    Set the constants and create the Fulcrum API object from the parsed arguments
+    """
+    from fulcrum import Fulcrum
+
+    global APP_NAME, DEBUG, FULCRUM_API_KEY, TRANSPORT, FULCRUM
+
+    DEBUG = args.debug
+
+    # Get the Fulcrum API key from the environment variables
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    # Create the Fulcrum API object
+    TRANSPORT = Transport(FULCRUM_API_KEY)
+    FULCRUM = use_transport(Fulcrum(FULCRUM_API_KEY), TRANSPORT)
+
+    logger.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+
+    # If the name argument was passed, use it
+    if args.app_name:
+        APP_NAME = args.app_name
 
 
 def list_apps():
@@ -119,21 +101,23 @@ def select_app(apps: list):
     return apps[int(selection) - 1]
 
 
-def open(filename, mode):
+def create_file(filename, mode):
     """
-    Override builtin "open" function to open file but add filename to the global list of files
+    Open a file and add the filename to the global list of files
     This is so we can delete them later
     """
     global FILES_CREATED
     FILES_CREATED.append(filename)
-    return builtins.open(filename, mode)
+    return open(filename, mode)
 
 
 def get_app_records(app: dict):
     """
     Get the records of a specific app
     """
-    records = FULCRUM.records.search({"form_id": app["id"]})["records"]
+    records = []
+    for page in iter_record_pages(TRANSPORT, app["id"]):
+        records.extend(page)
     return records
 
 
@@ -192,8 +176,8 @@ def flatten_app_elements(app: dict):
 def get_data_name_field_key(app: dict, data_name: str):
     elements = flatten_app_elements(app)
 
-    if args.debug:
-        with open("elements.json", "w") as f:
+    if DEBUG:
+        with create_file("elements.json", "w") as f:
             json.dump(elements, f, indent=4)
             logger.debug("Wrote elements to elements.json")
 
@@ -289,10 +273,13 @@ def filter_out_field_types(
     return [field for field in fields if field["type"] not in field_types]
 
 
-def main():
+def main(argv=None):
     """
     The main function of the script
     """
+    load_env()
+    configure(parser.parse_args(argv))
+    configure_logging()
 
     # Get the app defined
     app = None
@@ -303,8 +290,8 @@ def main():
     else:
         app = get_app(APP_NAME)
 
-    if args.debug:
-        with open("app.json", "w") as f:
+    if DEBUG:
+        with create_file("app.json", "w") as f:
             json.dump(app, f, indent=4)
             logger.debug("Wrote app to app.json")
 
@@ -314,8 +301,8 @@ def main():
         fields_with_conditionals, ["CalculatedField"]
     )
 
-    if args.debug:
-        with open("fields_with_conditionals.json", "w") as f:
+    if DEBUG:
+        with create_file("fields_with_conditionals.json", "w") as f:
             json.dump(fields_with_conditionals, f, indent=4)
             logger.debug(
                 "Wrote fields with conditionals to fields_with_conditionals.json"
@@ -324,8 +311,8 @@ def main():
     # Get the records of the app, we will search through these to find the hidden data
     records = get_app_records(app)
 
-    if args.debug:
-        with open("records.json", "w") as f:
+    if DEBUG:
+        with create_file("records.json", "w") as f:
             json.dump(records, f, indent=4)
             logger.debug("Wrote records to records.json")
 
@@ -413,8 +400,8 @@ def main():
                         }
                     )
 
-    if args.debug:
-        with open("records_with_hidden_data.json", "w") as f:
+    if DEBUG:
+        with create_file("records_with_hidden_data.json", "w") as f:
             json.dump(records_with_hidden_data, f, indent=4)
             logger.debug(
                 "Wrote records with hidden data to records_with_hidden_data.json"
@@ -3,13 +3,10 @@ import logging
 import os
 import typing as t
 
-from dotenv import load_dotenv
-
+from fulcrum_helpers.config import configure_logging, load_env
 from fulcrum_helpers.helpers import FulcrumApp, find_key_code
 from fulcrum_helpers.types import RepeatableValue
 
-load_dotenv()
-
 parser = argparse.ArgumentParser(
     description="Import all the 'Other' visit types from the old JKMR app to the new SITE VISIT RECORDS app."
 )
@@ -17,63 +14,47 @@ parser.add_argument(
     "--debug", help="Whether we should run in debug mode or not", action="store_true"
 )
 
-# Parse the arguments
-args = parser.parse_args()
-
-# Logging format of: [LEVEL]::[FUNCTION]::[HH:MM:SS] - [MESSAGE]
-# Where the level is colored based on the level and the rest except from the message is grey
-start = "\033["
-end = "\033[0m"
-colors = {
-    "GREEN": "32m",
-    "ORANGE": "33m",
-    "RED": "31m",
-    "GREY": "90m",
-}
-for color in colors:
-    # Add the start to the color
-    colors[color] = start + colors[color]
-
-logging.addLevelName(logging.DEBUG, f"{colors['GREEN']}DEBUG{colors['GREY']}")  # Green
-logging.addLevelName(logging.INFO, f"{colors['GREEN']}INFO{colors['GREY']}")  # Green
-logging.addLevelName(
-    logging.WARNING, f"{colors['ORANGE']}WARNING{colors['GREY']}"
-)  # Orange
-logging.addLevelName(logging.ERROR, f"{colors['RED']}ERROR{colors['GREY']}")  # Red
-logging.addLevelName(
-    logging.CRITICAL, f"{colors['RED']}CRITICAL{colors['GREY']}"
-)  # Red
-
-# Define the format of the logging
-logging.basicConfig(
-    format=f"%(levelname)s::%(funcName)s::%(asctime)s - {end}%(message)s",
-    datefmt="%H:%M:%S",
-)
-
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
 
-# Add a file handler to the logger
-file_handler = logging.FileHandler(
-    os.path.dirname(os.path.realpath(__file__)) + "/import_other_visits.log",
-    mode="w+",
-)
-file_handler.setLevel(logging.DEBUG)
-file_handler.setFormatter(
-    logging.Formatter(
-        f"%(levelname)s::%(funcName)s::%(asctime)s - %(message)s", datefmt="%H:%M:%S"
+# The Fulcrum API key and object, set by configure()
+FULCRUM_API_KEY = None  # type: str
+FULCRUM = None  # type: FulcrumApp
+
+
+def configure(args):
+    """
+    Set up the logging and the API client from the parsed arguments
+    """
+    global FULCRUM_API_KEY, FULCRUM
+
+    configure_logging()
+
+    logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
+
+    # Add a file handler to the logger
+    file_handler = logging.FileHandler(
+        os.path.dirname(os.path.realpath(__file__)) + "/import_other_visits.log",
+        mode="w+",
     )
-)
-logger.addHandler(file_handler)
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(
+        logging.Formatter(
+            f"%(levelname)s::%(funcName)s::%(asctime)s - %(message)s", datefmt="%H:%M:%S"
+        )
+    )
+    logger.addHandler(file_handler)
 
-# Get the Fulcrum API key from the environment variables
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-# Create the Fulcrum API object
-FULCRUM = FulcrumApp(FULCRUM_API_KEY)
+    # Get the Fulcrum API key from the environment variables
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    # Create the Fulcrum API object
+    FULCRUM = FulcrumApp(FULCRUM_API_KEY)
 
 
 # MARK: Main
-def main():
+def main(argv=None):
+    load_env()
+    configure(parser.parse_args(argv))
+
     sv_app = FULCRUM.get_app("SITE VISIT RECORDS")
 
     sv_records_key = find_key_code(sv_app["elements"], "service_visit_records")
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import typing as t
+
+from .rate_limit import RateLimiter, get_rate_limiter
+from .transport import Transport
+from .types import App, Record
+
+logger = logging.getLogger(__name__)
+
+# The number of requests that can be in flight at once
+DEFAULT_CONCURRENCY = 8
+
+
+class AsyncFulcrumApp:
+    """
+    An asyncio counterpart of FulcrumApp for read-only workloads.
+
+    Requests are made through the pooled Transport on worker threads, with at
+    most `concurrency` in flight and all of them drawing from the rate limiter
+    of the API key, so fan-out reads are bound by the rate limit rather than
+    by the round trip of each request. The limiter is shared with the
+    synchronous helpers (see rate_limit.get_rate_limiter) so a script using
+    both stays within the limit.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        rate_limiter: RateLimiter | None = None,
+        transport: Transport | None = None,
+    ):
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.transport = transport or Transport(api_key, pool_size=concurrency)
+        self.rate_limiter = rate_limiter or get_rate_limiter(api_key)
+        self._semaphore = None  # type: asyncio.Semaphore | None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so that it belongs to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def get_json(self, path: str, params: t.Optional[dict] = None) -> dict:
+        """
+        GET an API path and return the JSON body
+        """
+        async with self.semaphore:
+            await self.rate_limiter.acquire()
+            resp = await asyncio.to_thread(
+                self.transport.request, "get", path, params=params
+            )
+
+        if resp.status_code != 200:
+            logger.error(resp)
+            raise Exception(f"Request failed ({resp.status_code}): {path}")
+
+        return resp.json()
+
+    async def get_all_pages(
+        self, path: str, key: str, params: t.Optional[dict] = None, per_page: int = 1000
+    ) -> t.List[dict]:
+        """
+        Get every item of a paginated endpoint. The first page is used to find
+        the number of pages, the rest are fetched concurrently.
+        """
+        params = {**(params or {}), "per_page": per_page}
+
+        first_page = await self.get_json(path, {**params, "page": 1})
+        items = list(first_page.get(key, []))
+        total_pages = first_page.get("total_pages", 1) or 1
+
+        pages = await asyncio.gather(
+            *[
+                self.get_json(path, {**params, "page": page})
+                for page in range(2, total_pages + 1)
+            ]
+        )
+        for page in pages:
+            items.extend(page.get(key, []))
+
+        logger.debug(f"Found {len(items)} {key} in {total_pages} pages")
+        return items
+
+    async def list_apps(self) -> t.List[App]:
+        """
+        List all the apps in the Fulcrum account
+        """
+        apps = (await self.get_json("forms.json"))["forms"]
+        logger.debug(f"Found {len(apps)} apps")
+        return apps
+
+    async def get_app(self, name: str) -> App | None:
+        """
+        Get an app by name
+        """
+        for app in await self.list_apps():
+            if app["name"] == name:
+                return app
+
+        return None
+
+    async def get_form(self, form_id: str) -> App:
+        """
+        Get an app by ID
+        """
+        return (await self.get_json(f"forms/{form_id}.json"))["form"]
+
+    async def get_app_records(self, app: App, per_page: int = 1000) -> t.List[Record]:
+        """
+        Get all the records of an app
+        """
+        return await self.get_all_pages(
+            "records.json", "records", {"form_id": app["id"]}, per_page
+        )
+
+    async def get_record(self, record_id: str) -> Record:
+        """
+        Get a record by ID
+        """
+        return (await self.get_json(f"records/{record_id}.json"))["record"]
+
+    async def get_records(self, record_ids: t.List[str]) -> t.List[Record]:
+        """
+        Get many records by ID
+        """
+        return await asyncio.gather(*[self.get_record(x) for x in record_ids])
+
+    async def get_record_attachments(self, record_id: str) -> dict:
+        """
+        Get the attachments of a record
+        """
+        return await self.get_json("attachments", {"record_id": record_id})
+
+    async def get_attachment(self, attachment_id: str) -> dict:
+        """
+        Get an attachment
+        """
+        return await self.get_json(f"attachments/{attachment_id}")
+
+    async def get_attachments(self, attachment_ids: t.List[str]) -> t.List[dict]:
+        """
+        Get many attachments by ID
+        """
+        return await asyncio.gather(*[self.get_attachment(x) for x in attachment_ids])
+
+    async def list_projects(self) -> t.List[dict]:
+        """
+        List all the projects in the Fulcrum account
+        """
+        return await self.get_all_pages("projects.json", "projects")
+
+    async def list_memberships(self) -> t.List[dict]:
+        """
+        List all the memberships in the Fulcrum account
+        """
+        return await self.get_all_pages("memberships.json", "memberships")
+
+
+class SyncFulcrumApp:
+    """
+    A synchronous facade over AsyncFulcrumApp so scripts can use the concurrent
+    reads without being rewritten with asyncio. Every AsyncFulcrumApp method is
+    available and runs to completion on a private event loop.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.client = AsyncFulcrumApp(*args, **kwargs)
+        self.loop = asyncio.new_event_loop()
+
+    def run(self, coroutine: t.Awaitable):
+        """
+        Run a coroutine, e.g. a gather of several client calls
+        """
+        return self.loop.run_until_complete(coroutine)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.client, name)
+
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        def run_method(*args, **kwargs):
+            return self.run(attr(*args, **kwargs))
+
+        return run_method
+
+    def close(self):
+        self.loop.close()
@@ -0,0 +1,538 @@
+import csv
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+from datetime import datetime, timezone
+
+from .fake_api import FakeFulcrumServer, FakeFulcrumStore
+from .rate_limit import NO_RATE_LIMIT_VARIABLE
+from .synthetic import DATASETS, LAYOUT_IMPORT, generate_export
+from .transport import API_URL_VARIABLE
+
+logger = logging.getLogger(__name__)
+
+# The scripts are run from the root of the repository
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# In pipeline order, each stage is run in its own process
+STAGES = [
+    "csv_load",
+    "column_mapping",
+    "transform",
+    "record_build",
+    "upload",
+    "analysis_scan",
+]
+
+# Stages that need the output of an earlier stage, which is run (but not
+# recorded) when only the later stage is benchmarked
+REQUIRED_STAGES = {"transform": "column_mapping", "analysis_scan": "upload"}
+
+DEFAULT_SIZES = [500, 2000]
+
+# Uploads are capped, they take far longer than the other stages
+DEFAULT_UPLOAD_LIMIT = 1000
+
+# A stage regresses when it takes this fraction more time or memory than the
+# baseline, or makes more API calls
+DEFAULT_THRESHOLD = 0.25
+
+# Shorter stages are mostly interpreter start up, their times aren't compared
+MIN_SECONDS = 0.5
+
+# Records are exported from JKMR and compared against and imported into SURVEY
+EXPORT_DATASET = "JKMR"
+IMPORT_DATASET = "SURVEY"
+
+# find_differences.py only reads the columns of the SURVEY export
+BASE_RECORDS = 20
+
+# The stages run by this module print their own timings on a line like this
+RESULT_PREFIX = "BENCHMARK_RESULT "
+
+# The columns that transform.py matches site locations on
+SITE_ADDRESS_COLUMNS = [
+    "site_address_postal_code",
+    "site_address_thoroughfare",
+    "site_address_sub_thoroughfare",
+    "site_address_locality",
+    "site_address_admin_area",
+    "site_address_country",
+]
+
+
+def write_site_locations(export_dir: str, dataset: str, path: str) -> int:
+    """
+    Write the Site Locations export that transform.py expects for an export,
+    one site location for each client, reference and address
+    """
+    export = DATASETS[dataset]
+
+    with open(os.path.join(export_dir, f"{export.prefix}.csv"), "r") as f:
+        rows = list(csv.DictReader(f))
+
+    site_locations = {}  # type: t.Dict[tuple, str]
+    for row in rows:
+        site = (
+            row[export.client_name_column].strip(),
+            row[export.reference_column],
+            *[row[column] for column in SITE_ADDRESS_COLUMNS],
+        )
+        site_locations.setdefault(site, f"site-location-{len(site_locations) + 1}")
+
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["fulcrum_id", "client_name", "job_id", *SITE_ADDRESS_COLUMNS])
+        for site, fulcrum_id in site_locations.items():
+            writer.writerow([fulcrum_id, *site])
+
+    return len(site_locations)
+
+
+def run_process(command: t.List[str], cwd: str, env: dict, log_path: str) -> dict:
+    """
+    Run a command to completion, its output is written to `log_path`.
+    Returns its wall time, peak memory (None where it can't be measured) and
+    any result it reported.
+    """
+    with open(log_path, "w") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+
+        peak_rss_mb = None
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # Bytes on macOS, kilobytes everywhere else
+            peak_rss_mb = usage.ru_maxrss / (
+                1024 * 1024 if sys.platform == "darwin" else 1024
+            )
+        else:
+            process.wait()
+
+        seconds = time.perf_counter() - start
+
+    if process.returncode != 0:
+        raise Exception(
+            f"{' '.join(command)} exited with {process.returncode}, see {log_path}"
+        )
+
+    reported = {}
+    with open(log_path, "r", errors="replace") as f:
+        for line in f:
+            if line.startswith(RESULT_PREFIX):
+                reported = json.loads(line[len(RESULT_PREFIX) :])
+
+    return {
+        "seconds": reported.get("seconds", seconds),
+        "peak_rss_mb": round(peak_rss_mb, 1) if peak_rss_mb is not None else None,
+        "records": reported.get("records"),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class PipelineBenchmark:
+    """
+    Runs the stages of the pipeline against synthetic exports of each size:
+
+    - csv_load: reading every file of the export
+    - column_mapping: find_differences.py --skip_prompt_matching
+    - transform: transform.py
+    - record_build: import_api.build_records (reading base.csv and building
+      the records)
+    - upload: import_api.upload_records for the first `upload_limit` records
+    - analysis_scan: find_hidden_data.py over the uploaded records
+
+    Requests go to a local fake API without rate limits. Each stage is run in
+    its own process, its seconds are the wall time of the process, or of the
+    measured part for csv_load, record_build and upload.
+    """
+
+    def __init__(
+        self,
+        sizes: t.List[int] = DEFAULT_SIZES,
+        stages: t.List[str] | None = None,
+        seed: int = 0,
+        upload_limit: int = DEFAULT_UPLOAD_LIMIT,
+        work_dir: str | None = None,
+        keep: bool = False,
+    ):
+        stages = stages or STAGES
+        for stage in stages:
+            if stage not in STAGES:
+                raise Exception(f"Unknown stage: {stage} (one of {', '.join(STAGES)})")
+
+        self.sizes = sizes
+        self.stages = stages
+        self.seed = seed
+        self.upload_limit = upload_limit
+        self.work_dir = work_dir
+        self.keep = keep
+
+    def run(self) -> dict:
+        run = {
+            "started_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": self.seed,
+            "upload_limit": self.upload_limit,
+            "results": [],
+        }
+
+        for size in self.sizes:
+            run["results"].extend(self.run_size(size))
+
+        return run
+
+    def stages_to_run(self) -> t.List[str]:
+        required = set(self.stages)
+        for stage in self.stages:
+            if stage in REQUIRED_STAGES:
+                required.add(REQUIRED_STAGES[stage])
+
+        return [stage for stage in STAGES if stage in required]
+
+    def prepare(self, directory: str, size: int) -> t.Dict[str, str]:
+        """
+        Generate the exports for a size, returns their paths
+        """
+        paths = {
+            "export": os.path.join(directory, "export"),
+            "base": os.path.join(directory, "base"),
+            "import": os.path.join(directory, "import"),
+            "site_locations": os.path.join(directory, "site_locations.csv"),
+        }
+
+        generate_export(EXPORT_DATASET, size, paths["export"], seed=self.seed)
+        generate_export(IMPORT_DATASET, BASE_RECORDS, paths["base"], seed=self.seed)
+        generate_export(
+            IMPORT_DATASET,
+            size,
+            paths["import"],
+            seed=self.seed,
+            layout=LAYOUT_IMPORT,
+        )
+        write_site_locations(paths["export"], EXPORT_DATASET, paths["site_locations"])
+
+        return paths
+
+    def command(self, stage: str, paths: t.Dict[str, str]) -> t.List[str]:
+        export = DATASETS[EXPORT_DATASET]
+        form_name = DATASETS[IMPORT_DATASET].form_name
+
+        if stage == "csv_load":
+            return [sys.executable, "-m", __name__, stage, paths["export"]]
+        if stage == "column_mapping":
+            return [
+                sys.executable,
+                os.path.join(ROOT_DIR, "find_differences.py"),
+                "--parent_dir",
+                EXPORT_DATASET,
+                "--base_dir",
+                paths["base"],
+                "--base_prefix",
+                DATASETS[IMPORT_DATASET].prefix,
+                "--target_dir",
+                paths["export"],
+                "--target_prefix",
+                export.prefix,
+                "--skip_prompt_matching",
+            ]
+        if stage == "transform":
+            return [
+                sys.executable,
+                os.path.join(ROOT_DIR, "transform.py"),
+                "--parent_dir",
+                EXPORT_DATASET,
+                "--target_dir",
+                paths["export"],
+                "--target_prefix",
+                export.prefix,
+                "--site_location_file",
+                paths["site_locations"],
+                "--client_name_col",
+                export.client_name_column,
+                "--acc_ref_col",
+                export.reference_column,
+                "--transform_type",
+                "survey",
+            ]
+        if stage in ("record_build", "upload"):
+            return [
+                sys.executable,
+                "-m",
+                __name__,
+                stage,
+                paths["import"],
+                form_name,
+                str(self.upload_limit),
+            ]
+        if stage == "analysis_scan":
+            return [
+                sys.executable,
+                os.path.join(ROOT_DIR, "find_hidden_data.py"),
+                "--app-name",
+                form_name,
+            ]
+
+        raise Exception(f"Unknown stage: {stage}")
+
+    def run_size(self, size: int) -> t.List[dict]:
+        if self.work_dir:
+            os.makedirs(self.work_dir, exist_ok=True)
+        directory =tempfile.mkdtemp(prefix=f"benchmark_{size}_", dir=self.work_dir)
+        logger.info(f"Benchmarking {size} records in {directory}")
+
+        results = []
+        keep = self.keep
+        try:
+            paths = self.prepare(directory, size)
+
+            store = FakeFulcrumStore()
+            with open(os.path.join(paths["import"], "fake_api_seed.json"), "r") as f:
+                store.load(json.load(f))
+
+            with FakeFulcrumServer(store, rate_limit=0) as server:
+                env = {
+                    **os.environ,
+                    API_URL_VARIABLE: server.base_url,
+                    "FULCRUM_API_KEY": "benchmark",
+                    NO_RATE_LIMIT_VARIABLE: "1",
+                    "PYTHONPATH": os.pathsep.join(
+                        filter(None, [ROOT_DIR, os.getenv("PYTHONPATH")])
+                    ),
+                }
+
+                for stage in self.stages_to_run():
+                    server.reset_stats()
+                    result = run_process(
+                        self.command(stage, paths),
+                        directory,
+                        env,
+                        os.path.join(directory, f"{stage}.log"),
+                    )
+
+                    if stage not in self.stages:
+                        continue
+
+                    records = result["records"] or size
+                    if stage == "analysis_scan":
+                        records = min(size, self.upload_limit)
+
+                    result = {
+                        "stage": stage,
+                        "size": size,
+                        "records": records,
+                        "seconds": round(result["seconds"], 3),
+                        "peak_rss_mb": result["peak_rss_mb"],
+                        "api_calls": sum(server.calls.values()),
+                        "records_per_second": (
+                            round(records / result["seconds"], 1)
+                            if result["seconds"]
+                            else None
+                        ),
+                    }
+                    logger.info(
+                        f"{stage} ({size}): {result['seconds']}s, {result['peak_rss_mb']} MB, {result['api_calls']} calls"
+                    )
+                    results.append(result)
+        except Exception:
+            # Keep the files and logs of the failed stage to look at
+            keep = True
+            logger.error(f"The benchmark failed, its files are kept in {directory}")
+            raise
+        finally:
+            if not keep:
+                shutil.rmtree(directory, ignore_errors=True)
+
+        return results
+
+
+def load_runs(path: str) -> t.List[dict]:
+    if not os.path.exists(path):
+        return []
+
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def append_history(path: str, run: dict):
+    runs = load_runs(path)
+    runs.append(run)
+
+    with open(path, "w") as f:
+        json.dump(runs, f, indent=2)
+
+
+def load_baseline(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, run: dict):
+    with open(path, "w") as f:
+        json.dump(run, f, indent=2)
+
+
+def _baseline_results(baseline: dict | None) -> t.Dict[t.Tuple[str, int], dict]:
+    if not baseline:
+        return {}
+
+    return {(result["stage"], result["size"]): result for result in baseline["results"]}
+
+
+def find_regressions(
+    run: dict, baseline: dict | None, threshold: float = DEFAULT_THRESHOLD
+) -> t.List[str]:
+    """
+    Describe each stage of a run that is slower, uses more memory or makes
+    more API calls than in the baseline
+    """
+    baseline_results = _baseline_results(baseline)
+    regressions = []
+
+    for result in run["results"]:
+        name = f"{result['stage']} ({result['size']} records)"
+        base = baseline_results.get((result["stage"], result["size"]))
+        if not base:
+            continue
+
+        if result["seconds"] >= MIN_SECONDS and result["seconds"] > base["seconds"] * (
+            1 + threshold
+        ):
+            regressions.append(
+                f"{name} took {result['seconds']}s, {base['seconds']}s in the baseline"
+            )
+
+        if (
+            result["peak_rss_mb"]
+            and base["peak_rss_mb"]
+            and result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + threshold)
+        ):
+            regressions.append(
+                f"{name} used {result['peak_rss_mb']} MB, {base['peak_rss_mb']} MB in the baseline"
+            )
+
+        # The same seed always makes the same calls
+        if result["api_calls"] > base["api_calls"]:
+            regressions.append(
+                f"{name} made {result['api_calls']} API calls, {base['api_calls']} in the baseline"
+            )
+
+    return regressions
+
+
+def _change(value: float | None, base_value: float | None) -> str:
+    if value is None or not base_value:
+        return ""
+
+    return f"{(value - base_value) / base_value:+.0%}"
+
+
+def format_results(run: dict, baseline: dict | None = None) -> str:
+    """
+    A table of the results of a run, with the change from the baseline
+    """
+    baseline_results = _baseline_results(baseline)
+
+    rows = [["Stage", "Size", "Seconds", "", "Peak MB", "", "API calls", "Records/s"]]
+    for result in run["results"]:
+        base = baseline_results.get((result["stage"], result["size"])) or {}
+        rows.append(
+            [
+                result["stage"],
+                str(result["size"]),
+                f"{result['seconds']:.2f}",
+                _change(result["seconds"], base.get("seconds")),
+                str(result["peak_rss_mb"] or ""),
+                _change(result["peak_rss_mb"], base.get("peak_rss_mb")),
+                str(result["api_calls"]),
+                str(result["records_per_second"] or ""),
+            ]
+        )
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join(
+        "  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip()
+        for row in rows
+    )
+
+
+# Stages run in their own process by PipelineBenchmark
+
+
+def _report(**result):
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+
+
+def _csv_load(export_dir: str):
+    start = time.perf_counter()
+
+    rows = 0
+    for name in sorted(os.listdir(export_dir)):
+        if name.endswith(".csv"):
+            with open(os.path.join(export_dir, name), "r", encoding="utf-8") as f:
+                rows += len(list(csv.DictReader(f)))
+
+    _report(seconds=time.perf_counter() - start, rows=rows)
+
+
+def _import_stage(stage: str, source_dir: str, form_name: str, upload_limit: int):
+    import import_api
+
+    args = import_api.parser.parse_args(
+        [
+            "--type",
+            "survey",
+            "--form_name",
+            form_name,
+            "--source_dir",
+            source_dir,
+            "--yes",
+        ]
+    )
+    import_api.configure(args)
+
+    target_form = import_api.SCHEMAS.get_app(form_name)
+
+    start = time.perf_counter()
+    records = import_api.build_records(target_form)
+
+    if stage == "upload":
+        records = records[:upload_limit]
+        start = time.perf_counter()
+        import_api.upload_records(records)
+
+    _report(seconds=time.perf_counter() - start, records=len(records))
+
+
+if __name__ == "__main__":
+    if sys.argv[1] == "csv_load":
+        _csv_load(sys.argv[2])
+    else:
+        _import_stage(sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4]))
@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from fulcrum.exceptions import NotFoundException
+
+from .helpers import iter_record_pages, rate_limited
+from .resilience import JsonLinesFile, ResilientWriter
+from .snapshot import SnapshotWriter
+from .transport import Transport
+from .types import Record
+
+logger = logging.getLogger(__name__)
+
+# The number of deletes that can be in flight at once
+DEFAULT_WORKERS = 8
+
+
+class DeletionManifest:
+    """
+    The records chosen for deletion, written before anything is deleted.
+
+    {directory}/manifest.json          - the form and the IDs of the records to delete
+    {directory}/backup-{time}.jsonl.gz - a snapshot of the full records (optional)
+    {directory}/deleted.jsonl          - the IDs that have been deleted so far
+
+    A manifest built again in the same directory never overwrites the
+    backups of the earlier ones, their records may already be deleted.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.backup_path = None  # type: str | None
+        self.deleted = JsonLinesFile(os.path.join(directory, "deleted.jsonl"))
+
+        self.form_id = None  # type: str | None
+        self.record_ids = []  # type: t.List[str]
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def load(self):
+        with open(self.manifest_path, "r") as f:
+            manifest = json.load(f)
+
+        self.form_id = manifest["form_id"]
+        self.record_ids = manifest["record_ids"]
+        # Manifests written before the backups were timestamped
+        self.backup_path = manifest.get("backup_path") or (
+            os.path.join(self.directory, "backup.jsonl.gz")
+            if manifest.get("backup")
+            else None
+        )
+
+    def _new_backup_path(self) -> str:
+        created_at = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        path = os.path.join(self.directory, f"backup-{created_at}.jsonl.gz")
+
+        count = 1
+        while os.path.exists(path):
+            count += 1
+            path = os.path.join(self.directory, f"backup-{created_at}-{count}.jsonl.gz")
+
+        return path
+
+    def build(
+        self,
+        transport: Transport,
+        form_id: str,
+        predicate: t.Callable[[Record], bool],
+        backup: bool = False,
+    ):
+        """
+        Stream the records of a form and keep the ones that match the predicate
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.form_id = form_id
+        self.record_ids = []
+        self.backup_path = self._new_backup_path() if backup else None
+        scanned = 0
+
+        # The backup is a snapshot so deleted records can be restored from it
+        backup_writer = (
+            SnapshotWriter(self.backup_path, metadata={"form_id": form_id})
+            if backup
+            else None
+        )
+        try:
+            for page in iter_record_pages(transport, form_id):
+                scanned += len(page)
+                selected = [record for record in page if predicate(record)]
+                self.record_ids.extend(record["id"] for record in selected)
+
+                if backup_writer:
+                    for record in selected:
+                        backup_writer.add(record)
+
+                logger.debug(f"Scanned {scanned} records, {len(self.record_ids)} selected")
+        finally:
+            if backup_writer:
+                backup_writer.close()
+
+        tmp_path = self.manifest_path + ".part"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "form_id": form_id,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "scanned": scanned,
+                    "backup": backup,
+                    "backup_path": self.backup_path,
+                    "record_ids": self.record_ids,
+                },
+                f,
+                indent=2,
+            )
+        os.replace(tmp_path, self.manifest_path)
+
+        logger.info(
+            f"Selected {len(self.record_ids)} of {scanned} records, manifest written to {self.manifest_path}"
+        )
+
+    def pending(self) -> t.List[str]:
+        """
+        The IDs in the manifest that have not been deleted yet
+        """
+        deleted = {entry["id"] for entry in self.deleted.read()}
+        return [record_id for record_id in self.record_ids if record_id not in deleted]
+
+
+class BulkDeleter:
+    """
+    Deletes the records in a manifest with a pool of workers. Every delete
+    draws from the same rate limit and is retried through the ResilientWriter,
+    records that can't be deleted end up in its dead letter file.
+    """
+
+    def __init__(
+        self,
+        fulcrum,
+        manifest: DeletionManifest,
+        workers: int = DEFAULT_WORKERS,
+        writer: ResilientWriter | None = None,
+    ):
+        self.fulcrum = fulcrum
+        self.manifest = manifest
+        self.workers = workers
+        self.writer = writer or ResilientWriter(
+            dead_letter_path=os.path.join(manifest.directory, "dead_letter.jsonl")
+        )
+
+    # Rate limited for 4000 calls per hour (actual limit is 5000/h but we want to be safe)
+    @rate_limited(4000 / 3600)
+    def _delete(self, record_id: str) -> bool:
+        try:
+            self.fulcrum.records.delete(record_id)
+        except NotFoundException:
+            logger.debug(f"Record already deleted: {record_id}")
+
+        return True
+
+    def delete_record(self, record_id: str) -> bool:
+        deleted = self.writer.call("delete_record", self._delete, record_id, key=record_id)
+
+        if deleted:
+            self.manifest.deleted.append({"id": record_id})
+
+        return bool(deleted)
+
+    def run(self, on_result: t.Callable[[str, bool], None] | None = None) -> int:
+        """
+        Delete the pending records, returns the number deleted
+        """
+        pending = self.manifest.pending()
+        logger.info(
+            f"{len(pending)} of {len(self.manifest.record_ids)} records left to delete"
+        )
+
+        deleted_count = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for record_id, deleted in zip(
+                pending, executor.map(self.delete_record, pending)
+            ):
+                deleted_count += deleted
+                if on_result:
+                    on_result(record_id, deleted)
+
+        return deleted_count
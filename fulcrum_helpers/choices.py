@@ -0,0 +1,217 @@
+import json
+import logging
+import typing as t
+
+from .schema import FormSchema
+from .types import DictValue, Record
+
+logger = logging.getLogger(__name__)
+
+
+class ChoiceNormalizer:
+    """
+    Alias tables compiled into lookups so that each choice is normalized with
+    a single dict lookup instead of a scan over every alias.
+
+    - aliases: canonical value -> the single values that should become it,
+      a canonical value of None removes the aliases
+    - sequences: canonical value -> whole lists of values that should become
+      it, e.g. a name that was split on its commas when it was imported
+    """
+
+    def __init__(
+        self,
+        aliases: t.Dict[str | None, t.List[str]] | None = None,
+        sequences: t.Dict[str, t.List[t.List[str]]] | None = None,
+    ):
+        self.aliases = {
+            alias: canonical
+            for canonical, values in (aliases or {}).items()
+            for alias in values
+        }  # type: t.Dict[str, str | None]
+        self.sequences = {
+            tuple(sequence): canonical
+            for canonical, values in (sequences or {}).items()
+            for sequence in values
+        }  # type: t.Dict[t.Tuple[str, ...], str]
+
+    def normalize_values(self, values: t.List[str]) -> t.List[str]:
+        sequence = self.sequences.get(tuple(values))
+        if sequence is not None:
+            return [sequence]
+
+        normalized = []
+        for value in values:
+            value = self.aliases.get(value, value)
+            if value is not None:
+                normalized.append(value)
+
+        return normalized
+
+    def normalize(self, choice_value: DictValue) -> DictValue | None:
+        """
+        Get the normalized choice value, None if nothing would change
+        """
+        original_choice_values = choice_value.get("choice_values") or []
+        original_other_values = choice_value.get("other_values") or []
+
+        choice_values = self.normalize_values(original_choice_values)
+        other_values = self.normalize_values(original_other_values)
+
+        if (
+            choice_values == original_choice_values
+            and other_values == original_other_values
+        ):
+            return None
+
+        return {
+            **choice_value,
+            "choice_values": choice_values,
+            "other_values": other_values,
+        }
+
+
+class ChoiceChange(t.NamedTuple):
+    original: Record
+    updated: Record
+    # (before, after) for each choice value that changed
+    changes: t.List[t.Tuple[DictValue, DictValue]]
+
+
+def _normalize_form_values(
+    form_values: dict,
+    path: t.List[str],
+    key: str,
+    normalizer: ChoiceNormalizer,
+    changes: list,
+) -> dict | None:
+    """
+    Normalize a field in form values, following the path of repeatable keys
+    to reach it. Only the containers that change are copied, None is
+    returned if nothing changed.
+    """
+    if not path:
+        value = form_values.get(key)
+        if not value:
+            return None
+
+        normalized = normalizer.normalize(value)
+        if normalized is None:
+            return None
+
+        changes.append((value, normalized))
+        return {**form_values, key: normalized}
+
+    entries = form_values.get(path[0])
+    if not entries:
+        return None
+
+    updated_entries = None
+    for i, entry in enumerate(entries):
+        updated_values = _normalize_form_values(
+            entry.get("form_values", {}), path[1:], key, normalizer, changes
+        )
+        if updated_values is None:
+            continue
+
+        if updated_entries is None:
+            updated_entries = list(entries)
+        updated_entries[i] = {**entry, "form_values": updated_values}
+
+    if updated_entries is None:
+        return None
+
+    return {**form_values, path[0]: updated_entries}
+
+
+def get_field_path(schema: FormSchema, data_name: str) -> t.Tuple[t.List[str], str]:
+    """
+    Get the keys of the repeatables a field is in (outermost first) and the
+    key of the field
+    """
+    element = schema.element(data_name)
+    if not element:
+        raise Exception(f"Field not found: {data_name}")
+
+    path = []
+    repeatable = schema.repeatable_of(element["key"])
+    while repeatable:
+        path.insert(0, repeatable["key"])
+        repeatable = schema.repeatable_of(repeatable["key"])
+
+    return path, element["key"]
+
+
+def normalize_record(
+    record: Record, path: t.List[str], key: str, normalizer: ChoiceNormalizer
+) -> ChoiceChange | None:
+    """
+    Normalize a choice field in a record. The record is not changed, a copy
+    is returned if the field changes.
+    """
+    changes = []
+    form_values = _normalize_form_values(
+        record["form_values"], path, key, normalizer, changes
+    )
+
+    if form_values is None:
+        return None
+
+    return ChoiceChange(record, {**record, "form_values": form_values}, changes)
+
+
+def normalize_records(
+    records: t.Iterable[Record],
+    schema: FormSchema,
+    data_name: str,
+    normalizer: ChoiceNormalizer,
+) -> t.Iterator[ChoiceChange]:
+    """
+    Normalize a choice field wherever it is in the records, including inside
+    (nested) repeatables, yielding the records that change
+    """
+    path, key = get_field_path(schema, data_name)
+
+    for record in records:
+        change = normalize_record(record, path, key, normalizer)
+        if change:
+            yield change
+
+
+def write_update_plan(plan: t.List[ChoiceChange], path: str):
+    """
+    Write the changes in a plan for review
+    """
+    with open(path, "w") as f:
+        json.dump(
+            [
+                {
+                    "record_id": change.original["id"],
+                    "changes": [
+                        {"before": before, "after": after}
+                        for before, after in change.changes
+                    ],
+                }
+                for change in plan
+            ],
+            f,
+            indent=2,
+        )
+
+    logger.info(f"Update plan for {len(plan)} records written to {path}")
+
+
+def apply_update_plan(
+    plan: t.List[ChoiceChange], update: t.Callable[[Record, Record], t.Any]
+) -> int:
+    """
+    Write the records in a plan with an update function that takes the
+    original and the updated record, e.g. RecordPatcher.update.
+    Returns the number of records updated.
+    """
+    updated_count = 0
+    for change in plan:
+        if update(change.original, change.updated):
+            updated_count += 1
+
+    return updated_count
@@ -0,0 +1,176 @@
+"""
+A single entry point for the scripts, with a subcommand per script:
+
+    python -m fulcrum_helpers <command> [arguments]
+
+Nothing is imported until a command is picked, so the heavy dependencies
+(the Fulcrum SDK, pymupdf, tqdm) are only loaded by the commands that use
+them. Every script has a main(argv) and does nothing when it is imported.
+"""
+
+import importlib
+import os
+import sys
+import typing as t
+
+from .config import ROOT_DIR, load_env
+
+
+class Command(t.NamedTuple):
+    # The path of the script, relative to the root of the repository
+    script: str
+    description: str
+
+
+COMMANDS = {
+    "check_data_for_a_field": Command(
+        "check_data_for_a_field.py",
+        "Count the records of an app that have a value for a field.",
+    ),
+    "check_data_for_fields": Command(
+        "check_data_for_fields.py",
+        "Count the records of an app that have a value for each field.",
+    ),
+    "check_for_conditional_mapping": Command(
+        "check_for_conditional_mapping.py",
+        "Check whether field mappings were applied to conditional fields.",
+    ),
+    "create_clientele": Command(
+        "create_clientele.py", "Create the clientele list for import."
+    ),
+    "create_site_locations": Command(
+        "create_site_locations.py", "Create the site locations for import."
+    ),
+    "delete_records": Command(
+        "delete_records.py", "Delete the records of an app, with a backup."
+    ),
+    "detect_differences_between_apps": Command(
+        "detect_differences_between_apps.py",
+        "Highlight the differences between 2 apps.",
+    ),
+    "duplicate_app": Command(
+        "duplicate_app.py", "Duplicate an app with its records and media."
+    ),
+    "find_differences": Command(
+        "find_differences.py",
+        "Map the columns of an export to the columns of the target app.",
+    ),
+    "find_hidden_data": Command(
+        "find_hidden_data.py",
+        "Find data hidden by the conditions of an app.",
+    ),
+    "find_missing_visit_types": Command(
+        "find_missing_visit_types.py", "Find the site visits missing a visit type."
+    ),
+    "fix_missing_photos": Command(
+        "fix_missing_photos.py", "Copy the missing photos of migrated records."
+    ),
+    "fix_sv_records": Command(
+        "fix_sv_records.py", "Normalize the choice values of site visit records."
+    ),
+    "generate_export": Command(
+        "generate_export.py",
+        "Generate a synthetic export and its form for benchmarks.",
+    ),
+    "get_form": Command("get_form.py", "Get a form from Fulcrum."),
+    "get_record": Command("get_record.py", "Get a record from Fulcrum."),
+    "identify_missing_site_plans": Command(
+        "identify_missing_site_plans.py", "Identify the records missing site plans."
+    ),
+    "import_api": Command(
+        "import_api.py",
+        "Import the transformed records into an app.",
+    ),
+    "import_other_visits": Command(
+        os.path.join("import_other_visits", "import_other_visits.py"),
+        "Import the 'Other' visits from the old JKMR app.",
+    ),
+    "list_users": Command("list_users.py", "List the users of the Fulcrum account."),
+    "pdf_to_image": Command(
+        "pdf_to_image.py", "Convert site plan PDF attachments into images."
+    ),
+    "restore_snapshot": Command(
+        "restore_snapshot.py", "Snapshot the records of an app or restore them."
+    ),
+    "run_benchmarks": Command(
+        "run_benchmarks.py",
+        "Benchmark the pipeline against synthetic exports.",
+    ),
+    "run_fake_api": Command(
+        "run_fake_api.py",
+        "Run a local stand-in for the Fulcrum API.",
+    ),
+    "save_record": Command("save_record.py", "Save a record to Fulcrum."),
+    "transform": Command(
+        "transform.py",
+        "Transform an export into the records to import.",
+    ),
+    "update_assigned_to": Command(
+        "update_assigned_to.py", "Assign all the records of an app to a user."
+    ),
+    "update_records": Command(
+        "update_records.py", "Update records with the configured rules."
+    ),
+    "update_records_custom": Command(
+        os.path.join("update_records_custom", "update_records_custom.py"),
+        "Update site visit records from the old apps.",
+    ),
+    "update_records_with_mappings": Command(
+        "update_records_with_mappings.py",
+        "Migrate fields from old records to new records.",
+    ),
+}
+
+
+def format_commands() -> str:
+    width = max(len(name) for name in COMMANDS)
+    lines = ["Commands:"]
+    for name, command in COMMANDS.items():
+        lines.append(f"  {name.ljust(width)}  {command.description}")
+    return "\n".join(lines)
+
+
+def usage() -> str:
+    return (
+        "usage: python -m fulcrum_helpers <command> [arguments]\n\n"
+        f"{format_commands()}\n\n"
+        "Run a command with --help to see its arguments."
+    )
+
+
+def run_command(name: str, argv: t.List[str]):
+    """
+    Run a command with its arguments, as if its script was run directly
+    """
+    command = COMMANDS[name]
+    path = os.path.join(ROOT_DIR, command.script)
+
+    # The .env file is shared by all the commands
+    load_env()
+
+    # So that the usage of the command shows its script
+    sys.argv = [path, *argv]
+
+    # Scripts may import modules that sit next to them
+    script_dir = os.path.dirname(path)
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+
+    module = importlib.import_module(os.path.splitext(os.path.basename(path))[0])
+    return module.main(argv)
+
+
+def main(argv: t.List[str] | None = None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return
+
+    name, *command_argv = argv
+
+    if name not in COMMANDS:
+        print(f"Unknown command: {name}\n\n{usage()}", file=sys.stderr)
+        sys.exit(2)
+
+    run_command(name, command_argv)
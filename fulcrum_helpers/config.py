@@ -0,0 +1,86 @@
+import logging
+import os
+import typing as t
+
+# Logging format of: [LEVEL]::[FUNCTION]::[HH:MM:SS] - [MESSAGE]
+# Where the level is colored based on the level and the rest except from the message is grey
+start = "\033["
+end = "\033[0m"
+colors = {
+    "GREEN": "32m",
+    "ORANGE": "33m",
+    "RED": "31m",
+    "GREY": "90m",
+}
+for color in colors:
+    # Add the start to the color
+    colors[color] = start + colors[color]
+
+LOG_FORMAT = f"%(levelname)s::%(funcName)s::%(asctime)s - {end}%(message)s"
+LOG_DATE_FORMAT = "%H:%M:%S"
+
+# The scripts are in the root of the repository
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_logging_configured = False
+_env_loaded = False
+
+
+def configure_logging() -> None:
+    """
+    Set up the colored logging shared by the scripts, once per process
+    """
+    global _logging_configured
+
+    if _logging_configured:
+        return
+
+    logging.addLevelName(
+        logging.DEBUG, f"{colors['GREEN']}DEBUG{colors['GREY']}"
+    )  # Green
+    logging.addLevelName(logging.INFO, f"{colors['GREEN']}INFO{colors['GREY']}")  # Green
+    logging.addLevelName(
+        logging.WARNING, f"{colors['ORANGE']}WARNING{colors['GREY']}"
+    )  # Orange
+    logging.addLevelName(logging.ERROR, f"{colors['RED']}ERROR{colors['GREY']}")  # Red
+    logging.addLevelName(
+        logging.CRITICAL, f"{colors['RED']}CRITICAL{colors['GREY']}"
+    )  # Red
+
+    # Define the format of the logging
+    logging.basicConfig(format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+
+    _logging_configured = True
+
+
+def get_logger(name: str, debug: bool = False) -> logging.Logger:
+    """
+    Get a script's logger, at DEBUG or INFO, with the shared logging set up
+    """
+    configure_logging()
+
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG if debug else logging.INFO)
+    return logger
+
+
+def load_env() -> None:
+    """
+    Load the .env file into the environment, once per process.
+    Variables that are already set are kept.
+    """
+    global _env_loaded
+
+    if _env_loaded:
+        return
+
+    from dotenv import load_dotenv
+
+    # Next to the scripts, where load_dotenv() in a script finds it
+    load_dotenv(os.path.join(ROOT_DIR, ".env"))
+    _env_loaded = True
+
+
+def get_api_key() -> t.Optional[str]:
+    load_env()
+    return os.getenv("FULCRUM_API_KEY")
@@ -0,0 +1,632 @@
+import collections
+import datetime
+import json
+import logging
+import math
+import random
+import re
+import sqlite3
+import threading
+import time
+import typing as t
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = "/api/v2/"
+FILES_PREFIX = "/files/"
+
+# The Fulcrum API limit
+DEFAULT_RATE_LIMIT = 5000
+DEFAULT_RATE_LIMIT_WINDOW = 60 * 60
+
+DEFAULT_PER_PAGE = 1000
+DEFAULT_ERROR_STATUSES = (500, 502, 503)
+
+# The resources that are listed under their plural name
+RESOURCES = {
+    "forms": "form",
+    "records": "record",
+    "projects": "project",
+    "memberships": "membership",
+    "attachments": "attachment",
+}
+
+# The query parameters that filter each kind of resource
+FILTERS = ["form_id", "record_id", "project_id", "owner_type"]
+
+
+def _timestamp(seconds: float) -> str:
+    return (
+        datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc)
+        .isoformat(timespec="seconds")
+        .replace("+00:00", "Z")
+    )
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class FakeFulcrumStore:
+    """
+    The forms, records, projects, memberships and attachments of a fake
+    Fulcrum account, kept in SQLite (in memory unless a path is given)
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS resources (
+                kind TEXT NOT NULL,
+                id TEXT NOT NULL,
+                form_id TEXT,
+                record_id TEXT,
+                project_id TEXT,
+                owner_type TEXT,
+                updated_at REAL NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (kind, id)
+            );
+            CREATE INDEX IF NOT EXISTS resources_form
+                ON resources (kind, form_id, updated_at);
+            CREATE TABLE IF NOT EXISTS files (
+                id TEXT PRIMARY KEY,
+                content_type TEXT NOT NULL,
+                content BLOB NOT NULL
+            );
+            """
+        )
+
+    def _row(self, kind: str, resource: dict, touch: bool) -> tuple:
+        now = time.time()
+        resource.setdefault("id", str(uuid.uuid4()))
+        resource.setdefault("created_at", _timestamp(now))
+        if touch or not resource.get("updated_at"):
+            resource["updated_at"] = _timestamp(now)
+        else:
+            now = datetime.datetime.fromisoformat(resource["updated_at"]).timestamp()
+
+        return (
+            kind,
+            resource["id"],
+            resource.get("form_id"),
+            resource.get("record_id"),
+            resource.get("project_id"),
+            resource.get("owner_type"),
+            now,
+            json.dumps(resource),
+        )
+
+    def put_many(
+        self, kind: str, resources: t.Iterable[dict], touch: bool = True
+    ) -> t.List[dict]:
+        """
+        Add or replace resources in a single transaction, setting their IDs
+        and timestamps. The updated_at of each resource is kept if `touch`
+        is False.
+        """
+        resources = [dict(resource) for resource in resources]
+        rows = [self._row(kind, resource, touch) for resource in resources]
+
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+        return resources
+
+    def put(self, kind: str, resource: dict, touch: bool = True) -> dict:
+        return self.put_many(kind, [resource], touch)[0]
+
+    def get(self, kind: str, resource_id: str) -> dict | None:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT data FROM resources WHERE kind = ? AND id = ?",
+                (kind, resource_id),
+            ).fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    def delete(self, kind: str, resource_id: str) -> bool:
+        with self.lock, self.db:
+            cursor = self.db.execute(
+                "DELETE FROM resources WHERE kind = ? AND id = ?", (kind, resource_id)
+            )
+
+        return cursor.rowcount > 0
+
+    def search(
+        self,
+        kind: str,
+        filters: t.Dict[str, str] | None = None,
+        updated_since: float | None = None,
+        page: int = 1,
+        per_page: int = DEFAULT_PER_PAGE,
+    ) -> t.Tuple[t.List[dict], int]:
+        """
+        Get a page of resources and the total number that match
+        """
+        where = ["kind = ?"]
+        params = [kind]  # type: t.List[t.Any]
+        for column, value in (filters or {}).items():
+            where.append(f"{column} = ?")
+            params.append(value)
+        if updated_since is not None:
+            where.append("updated_at >= ?")
+            params.append(updated_since)
+
+        where_sql = " AND ".join(where)
+        with self.lock:
+            total_count = self.db.execute(
+                f"SELECT COUNT(*) FROM resources WHERE {where_sql}", params
+            ).fetchone()[0]
+            rows = self.db.execute(
+                f"SELECT data FROM resources WHERE {where_sql} ORDER BY rowid LIMIT ? OFFSET ?",
+                [*params, per_page, (page - 1) * per_page],
+            ).fetchall()
+
+        return [json.loads(row[0]) for row in rows], total_count
+
+    def add_file(self, content: bytes, content_type: str) -> str:
+        file_id = str(uuid.uuid4())
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO files VALUES (?, ?, ?)", (file_id, content_type, content)
+            )
+
+        return file_id
+
+    def get_file(self, file_id: str) -> t.Tuple[bytes, str] | None:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT content, content_type FROM files WHERE id = ?", (file_id,)
+            ).fetchone()
+
+        return (row[0], row[1]) if row else None
+
+    def add_attachment(
+        self,
+        name: str,
+        content: bytes,
+        record_id: str | None = None,
+        form_id: str | None = None,
+        content_type: str = "application/pdf",
+    ) -> dict:
+        """
+        Add an attachment with the content that its download URL returns
+        """
+        return self.put(
+            "attachments",
+            {
+                "name": name,
+                "owner_type": "record" if record_id else "form",
+                "record_id": record_id,
+                "form_id": form_id,
+                "file_size": len(content),
+                "content_type": content_type,
+                "file_id": self.add_file(content, content_type),
+                "status": "complete",
+            },
+        )
+
+    def load(self, data: t.Dict[str, t.List[dict]]):
+        """
+        Seed the store, e.g. from a JSON file of
+        {"forms": [...], "records": [...], "projects": [...], "memberships": [...]}
+        """
+        for kind in RESOURCES:
+            self.put_many(kind, data.get(kind, []), touch=False)
+
+        logger.info(
+            "Loaded "
+            + ", ".join(f"{len(data.get(kind, []))} {kind}" for kind in RESOURCES)
+        )
+
+
+class RateLimiter:
+    """
+    A sliding window of the calls made with each API token, like the
+    Fulcrum limit of 5000 calls per hour
+    """
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.lock = threading.Lock()
+        self.calls = collections.defaultdict(
+            collections.deque
+        )  # type: t.Dict[str, t.Deque[float]]
+
+    def acquire(self, token: str) -> t.Tuple[int, float | None]:
+        """
+        Count a call, returning the calls remaining and, if the limit has
+        been reached, the seconds until the next call is allowed
+        """
+        now = time.monotonic()
+        with self.lock:
+            calls = self.calls[token]
+            while calls and calls[0] <= now - self.window:
+                calls.popleft()
+
+            if len(calls) >= self.limit:
+                return 0, calls[0] + self.window - now
+
+            calls.append(now)
+            return self.limit - len(calls), None
+
+
+class FakeFulcrumServer(ThreadingHTTPServer):
+    """
+    A local stand-in for the Fulcrum API, for benchmarks and offline runs.
+
+    Point a Transport (or $FULCRUM_API_URL) at `base_url`. Each request can be
+    delayed (`latency` seconds, +/- `jitter`), fail with one of
+    `error_statuses` (a fraction `error_rate` of requests) and is counted
+    against a rate limit per API token, answered with a 429 and a
+    Retry-After header when it is reached. A `rate_limit` of 0 disables it.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        store: FakeFulcrumStore | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        api_key: str | None = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_statuses: t.Sequence[int] = DEFAULT_ERROR_STATUSES,
+        rate_limit: int = DEFAULT_RATE_LIMIT,
+        rate_limit_window: float = DEFAULT_RATE_LIMIT_WINDOW,
+        supports_patch: bool = True,
+        seed: int | None = None,
+    ):
+        super().__init__((host, port), FakeFulcrumHandler)
+        self.store = store or FakeFulcrumStore()
+        self.api_key = api_key
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses)
+        self.rate_limiter = (
+            RateLimiter(rate_limit, rate_limit_window) if rate_limit else None
+        )
+        self.supports_patch = supports_patch
+
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        # "METHOD resource" -> number of calls
+        self.calls = collections.Counter()  # type: t.Counter[str]
+        # Status code -> number of responses
+        self.statuses = collections.Counter()  # type: t.Counter[int]
+
+        self.thread = None  # type: threading.Thread | None
+
+    @property
+    def root_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_url(self) -> str:
+        return self.root_url + API_PREFIX.rstrip("/")
+
+    def start(self) -> "FakeFulcrumServer":
+        """
+        Serve requests on a background thread
+        """
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Fake Fulcrum API listening on {self.base_url}")
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.calls.clear()
+            self.statuses.clear()
+
+    def delay(self) -> float:
+        with self.random_lock:
+            return max(0.0, self.latency + self.random.uniform(-1, 1) * self.jitter)
+
+    def injected_error(self) -> int | None:
+        if not self.error_rate:
+            return None
+
+        with self.random_lock:
+            if self.random.random() < self.error_rate:
+                return self.random.choice(self.error_statuses)
+
+        return None
+
+    def count(self, call: str, status: int):
+        with self.stats_lock:
+            self.calls[call] += 1
+            self.statuses[status] += 1
+
+
+class FakeFulcrumHandler(BaseHTTPRequestHandler):
+    server: FakeFulcrumServer
+    protocol_version = "HTTP/1.1"
+    # The headers and body are sent separately, without this each response
+    # on a kept-alive connection waits for the client's delayed ACK (~40ms)
+    disable_nagle_algorithm = True
+
+    # (method, path pattern, handler name)
+    ROUTES = [
+        ("GET", r"(?P<kind>forms|records|projects|memberships|attachments)", "search"),
+        ("GET", r"(?P<kind>forms|records|projects|attachments)/(?P<id>[^/]+)", "find"),
+        ("POST", r"(?P<kind>forms|records|projects)", "create"),
+        ("PUT", r"(?P<kind>forms|records|projects)/(?P<id>[^/]+)", "update"),
+        ("PATCH", r"(?P<kind>records)/(?P<id>[^/]+)", "patch"),
+        ("DELETE", r"(?P<kind>forms|records|projects)/(?P<id>[^/]+)", "delete"),
+    ]
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def do_PATCH(self):
+        self.handle_request("PATCH")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def send_json(
+        self, status: int, body: dict | None, headers: t.Dict[str, str] | None = None
+    ):
+        content = json.dumps(body).encode() if body is not None else b""
+
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def read_body(self) -> dict:
+        if not self.body:
+            return {}
+
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            raise ApiError(400, "The body is not valid JSON")
+
+    def handle_request(self, method: str):
+        url = urlparse(self.path)
+        # Always read the body so that the connection can be reused
+        length = int(self.headers.get("Content-Length") or 0)
+        self.body = self.rfile.read(length) if length else b""
+
+        if url.path.startswith(FILES_PREFIX) and method == "GET":
+            self.send_file(url.path[len(FILES_PREFIX) :])
+            return
+
+        if not url.path.startswith(API_PREFIX):
+            self.send_json(404, {"error": "Not found"})
+            return
+
+        path = url.path[len(API_PREFIX) :].rstrip("/").removesuffix(".json")
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        call = f"{method} {path.split('/')[0]}"
+        status, body, headers = self.call(method, path, params)
+        self.server.count(call, status)
+        self.send_json(status, body, headers)
+
+    def call(
+        self, method: str, path: str, params: t.Dict[str, str]
+    ) -> t.Tuple[int, dict | None, t.Dict[str, str]]:
+        headers = {}
+
+        token = self.headers.get("X-ApiToken")
+        if not token or (self.server.api_key and token != self.server.api_key):
+            return 401, {"error": "Unauthorized"}, headers
+
+        if self.server.rate_limiter:
+            remaining, retry_after = self.server.rate_limiter.acquire(token)
+            headers["X-RateLimit-Limit"] = str(self.server.rate_limiter.limit)
+            headers["X-RateLimit-Remaining"] = str(remaining)
+            if retry_after is not None:
+                headers["Retry-After"] = str(math.ceil(retry_after))
+                return 429, {"error": "Rate limit exceeded"}, headers
+
+        delay = self.server.delay()
+        if delay:
+            time.sleep(delay)
+
+        try:
+            body = self.read_body()
+        except ApiError as e:
+            return e.status, {"error": e.message}, headers
+
+        error_status = self.server.injected_error()
+        if error_status:
+            return error_status, {"error": "Injected error"}, headers
+
+        for route_method, pattern, name in self.ROUTES:
+            if route_method != method:
+                continue
+
+            match = re.fullmatch(pattern, path)
+            if not match:
+                continue
+
+            try:
+                status, response = getattr(self, name)(
+                    params=params, body=body, **match.groupdict()
+                )
+            except ApiError as e:
+                return e.status, {"errors": [e.message]}, headers
+
+            return status, response, headers
+
+        return 405 if method == "PATCH" else 404, {"error": "Not found"}, headers
+
+    def send_file(self, file_id: str):
+        found = self.server.store.get_file(file_id)
+        if not found:
+            self.send_json(404, {"error": "Not found"})
+            return
+
+        content, content_type = found
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("ETag", f'"{file_id}"')
+        self.end_headers()
+        self.wfile.write(content)
+
+    def present(self, kind: str, resource: dict) -> dict:
+        if kind == "attachments":
+            resource = {
+                **resource,
+                "download_url": f"{self.server.root_url}{FILES_PREFIX}{resource['file_id']}",
+            }
+        return resource
+
+    def search(self, kind: str, params: dict, body: dict) -> t.Tuple[int, dict]:
+        page = max(1, int(params.get("page", 1)))
+        per_page = max(1, int(params.get("per_page", DEFAULT_PER_PAGE)))
+        updated_since = params.get("updated_since")
+
+        resources, total_count = self.server.store.search(
+            kind,
+            {column: params[column] for column in FILTERS if column in params},
+            float(updated_since) if updated_since else None,
+            page,
+            per_page,
+        )
+
+        if kind == "forms" and params.get("schema") == "false":
+            resources = [
+                {k: v for k, v in form.items() if k != "elements"} for form in resources
+            ]
+
+        return 200, {
+            kind: [self.present(kind, resource) for resource in resources],
+            "current_page": page,
+            "total_pages": max(1, math.ceil(total_count / per_page)),
+            "total_count": total_count,
+            "per_page": per_page,
+        }
+
+    def find(self, kind: str, id: str, params: dict, body: dict) -> t.Tuple[int, dict]:
+        resource = self.server.store.get(kind, id)
+        if not resource:
+            raise ApiError(404, f"{RESOURCES[kind]} not found: {id}")
+
+        if kind == "attachments":
+            # The repo reads attachments without an envelope
+            return 200, self.present(kind, resource)
+
+        return 200, {RESOURCES[kind]: resource}
+
+    def validate(self, kind: str, resource: dict):
+        if kind == "forms" and not resource.get("name"):
+            raise ApiError(422, "A form needs a name")
+
+        if kind == "records":
+            if not self.server.store.get("forms", resource.get("form_id") or ""):
+                raise ApiError(422, f"Form not found: {resource.get('form_id')}")
+            resource.setdefault("form_values", {})
+
+    def create(self, kind: str, params: dict, body: dict) -> t.Tuple[int, dict]:
+        resource = dict(body.get(RESOURCES[kind]) or {})
+        resource.pop("id", None)
+        self.validate(kind, resource)
+        resource["version"] = 1
+
+        return 200, {RESOURCES[kind]: self.server.store.put(kind, resource)}
+
+    def update(
+        self, kind: str, id: str, params: dict, body: dict
+    ) -> t.Tuple[int, dict]:
+        existing = self.server.store.get(kind, id)
+        if not existing:
+            raise ApiError(404, f"{RESOURCES[kind]} not found: {id}")
+
+        resource = dict(body.get(RESOURCES[kind]) or {})
+        resource.update(
+            id=id,
+            created_at=existing.get("created_at"),
+            version=existing.get("version", 0) + 1,
+        )
+        resource.setdefault("form_id", existing.get("form_id"))
+        self.validate(kind, resource)
+
+        return 200, {RESOURCES[kind]: self.server.store.put(kind, resource)}
+
+    def patch(self, kind: str, id: str, params: dict, body: dict) -> t.Tuple[int, dict]:
+        if not self.server.supports_patch:
+            raise ApiError(405, "PATCH is not supported")
+
+        existing = self.server.store.get(kind, id)
+        if not existing:
+            raise ApiError(404, f"{RESOURCES[kind]} not found: {id}")
+
+        changes = dict(body.get(RESOURCES[kind]) or {})
+        version = changes.pop("version", None)
+        if version is not None and version != existing.get("version"):
+            raise ApiError(
+                409, f"{id} is at version {existing.get('version')}, not {version}"
+            )
+
+        form_values = dict(existing.get("form_values") or {})
+        for key, value in (changes.pop("form_values", None) or {}).items():
+            if value is None:
+                form_values.pop(key, None)
+            else:
+                form_values[key] = value
+
+        resource = {
+            **existing,
+            **changes,
+            "form_values": form_values,
+            "version": existing.get("version", 0) + 1,
+        }
+
+        return 200, {RESOURCES[kind]: self.server.store.put(kind, resource)}
+
+    def delete(
+        self, kind: str, id: str, params: dict, body: dict
+    ) -> t.Tuple[int, None]:
+        if not self.server.store.delete(kind, id):
+            raise ApiError(404, f"{RESOURCES[kind]} not found: {id}")
+
+        return 204, None
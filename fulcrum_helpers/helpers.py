@@ -1,61 +1,31 @@
 import logging
-import time
 import typing as t
 
-import requests
-from fulcrum import Fulcrum
-
-from .types import App, AppElement, AppElementTypes, Record
-
-# Logging format of: [LEVEL]::[FUNCTION]::[HH:MM:SS] - [MESSAGE]
-# Where the level is colored based on the level and the rest except from the message is grey
-start = "\033["
-end = "\033[0m"
-colors = {
-    "GREEN": "32m",
-    "ORANGE": "33m",
-    "RED": "31m",
-    "GREY": "90m",
-}
-for color in colors:
-    # Add the start to the color
-    colors[color] = start + colors[color]
-
-logging.addLevelName(logging.DEBUG, f"{colors['GREEN']}DEBUG{colors['GREY']}")  # Green
-logging.addLevelName(logging.INFO, f"{colors['GREEN']}INFO{colors['GREY']}")  # Green
-logging.addLevelName(
-    logging.WARNING, f"{colors['ORANGE']}WARNING{colors['GREY']}"
-)  # Orange
-logging.addLevelName(logging.ERROR, f"{colors['RED']}ERROR{colors['GREY']}")  # Red
-logging.addLevelName(
-    logging.CRITICAL, f"{colors['RED']}CRITICAL{colors['GREY']}"
-)  # Red
-
-# Define the format of the logging
-logging.basicConfig(
-    format=f"%(levelname)s::%(funcName)s::%(asctime)s - {end}%(message)s",
-    datefmt="%H:%M:%S",
-)
+from .metrics import ApiMetrics
+from .rate_limit import get_rate_limiter
+from .resilience import ResilientWriter
+from .schema import FormSchema, SchemaRegistry, index_elements
+from .transport import Transport, use_transport
+from .types import App, AppElement, Record
+
+if t.TYPE_CHECKING:
+    from fulcrum import Fulcrum
 
 logger = logging.getLogger(__name__)
 
 
-def rate_limited(max_per_second):
+def rate_limited(max_per_second, api_key: str | None = None):
     """
     Decorator to limit the rate of function calls.
+    All the decorated functions share the limiter of the API key
+    ($FULCRUM_API_KEY by default), so together they stay within the limit.
+    Calls aren't limited while $FULCRUM_NO_RATE_LIMIT is set.
     """
-    minimum_interval = 1.0 / float(max_per_second)
 
     def decorate(func):
-        last_time_called = [0.0]
-
         def rate_limited_function(*args, **kargs):
-            elapsed = time.perf_counter() - last_time_called[0]
-            left_to_wait = minimum_interval - elapsed
-            if left_to_wait > 0:
-                time.sleep(left_to_wait)
+            get_rate_limiter(api_key, max_per_second).wait()
             ret = func(*args, **kargs)
-            last_time_called[0] = time.perf_counter()
             return ret
 
         return rate_limited_function
@@ -64,18 +34,33 @@ def rate_limited(max_per_second):
 
 
 class FulcrumApp:
-    fulcrum: Fulcrum
+    fulcrum: "Fulcrum"
     api_key: str
-
-    def __init__(self, api_key: str):
-        self.fulcrum = Fulcrum(api_key)
+    transport: Transport
+
+    def __init__(
+        self,
+        api_key: str,
+        transport: Transport | None = None,
+        writer: ResilientWriter | None = None,
+        base_url: str | None = None,
+        metrics: ApiMetrics | None = None,
+    ):
+        from fulcrum import Fulcrum
+
+        self.transport = transport or Transport(api_key, base_url, metrics=metrics)
+        self.fulcrum = use_transport(Fulcrum(api_key), self.transport)
+        self.writer = writer or ResilientWriter()
+        self.schemas = SchemaRegistry(self.transport)
+        # Created on the first partial update
+        self.patcher = None
         self.api_key = api_key
 
     def list_apps(self) -> t.List[App]:
         """
         List all the apps in the Fulcrum account
         """
-        apps = self.fulcrum.forms.search()["forms"]
+        apps = self.schemas.list_apps()
         logger.debug(f"Found {len(apps)} apps")
         return apps
 
@@ -84,10 +69,13 @@ class FulcrumApp:
         Get an app by name
         """
         logger.info(f"Getting app: {name}")
-        apps = self.list_apps()
-        for app in apps:
-            if app["name"] == name:
-                return app  # type: App
+        return self.schemas.get_app(name)  # type: App
+
+    def get_schema(self, app: App) -> FormSchema:
+        """
+        Get the element indexes of an app
+        """
+        return self.schemas.get_schema(app)
 
     def get_app_records(self, app: App) -> t.List[Record]:
         """
@@ -96,32 +84,48 @@ class FulcrumApp:
         records = self.fulcrum.records.search({"form_id": app["id"]})["records"]
         return records
 
-    # Rate limited for 4000 calls per hour (actual limit is 5000/h but we want to be safe)
-    @rate_limited(4000 / 3600)
-    def update_fulcrum_record(self, record_id: str, record: Record):
+    def update_fulcrum_record(
+        self, record_id: str, record: Record, original: Record | None = None
+    ):
         """
-        Update a record in Fulcrum
+        Update a record in Fulcrum. If the record as it was fetched is given
+        only the changes are sent.
         """
+        from .patch import RecordPatcher
 
-        # Update the record
-        updated_record = self.fulcrum.records.update(record_id, {"record": record})
+        if original is not None:
+            if self.patcher is None:
+                self.patcher = RecordPatcher(self.transport, self.writer)
+            updated_record = self.patcher.update(original, record)
+        else:
+            updated_record = self._put_fulcrum_record(record_id, record)
 
-        if "errors" in updated_record["record"]:
-            logger.error(f"Error updating record")
-            logger.error(updated_record)
-            exit(1)
+        if updated_record is None:
+            logger.error(f"Error updating record: {record_id}")
+            return None
 
         logger.info(f"Updated record: {updated_record['record']['id']} with new entry")
+        return updated_record
+
+    # Rate limited for 4000 calls per hour (actual limit is 5000/h but we want to be safe)
+    @rate_limited(4000 / 3600)
+    def _put_fulcrum_record(self, record_id: str, record: Record):
+        return self.writer.call(
+            "update_record",
+            self.fulcrum.records.update,
+            record_id,
+            {"record": record},
+            key=record_id,
+            payload={"record": record},
+        )
 
     @rate_limited(4000 / 3600)
     def get_record_attachments(self, record_id: str):
         """
         Get the attachments of a record in Fulcrum
         """
-        resp = requests.get(
-            "https://api.fulcrumapp.com/api/v2/attachments",
-            params={"record_id": record_id},
-            headers={"X-ApiToken": self.api_key, "Accept": "application/json"},
+        resp = self.transport.request(
+            "get", "attachments", params={"record_id": record_id}
         )
 
         if resp.status_code != 200:
@@ -137,10 +141,7 @@ class FulcrumApp:
         """
         Get an attachment from Fulcrum
         """
-        resp = requests.get(
-            f"https://api.fulcrumapp.com/api/v2/attachments/{attachment_id}",
-            headers={"X-ApiToken": self.api_key, "Accept": "application/json"},
-        )
+        resp = self.transport.request("get", f"attachments/{attachment_id}")
 
         if resp.status_code != 200:
             logger.error(resp)
@@ -150,41 +151,101 @@ class FulcrumApp:
 
         return resp_json
 
-    def list_attachments(self):
-        """
-        List all the attachments in the Fulcrum account
-        """
-        resp = requests.get(
-            "https://api.fulcrumapp.com/api/v2/attachments?form_id=8b47f113-c60f-4016-af20-1a4367887eba",
-            headers={"X-ApiToken": self.api_key, "Accept": "application/json"},
-        )
+    @rate_limited(4000 / 3600)
+    def _get_attachments_page(self, params: dict):
+        resp = self.transport.request("get", "attachments", params=params)
 
         if resp.status_code != 200:
             logger.error(resp)
             raise Exception("Failed to get attachments")
 
-        resp_json = resp.json()
+        return resp.json()
 
-        return resp_json
+    def list_attachments(
+        self,
+        form_id: str | None = None,
+        record_id: str | None = None,
+        owner_type: str | None = None,
+        per_page: int = 1000,
+    ) -> t.List[dict]:
+        """
+        List the attachments in the Fulcrum account, optionally filtered by
+        form, record or owner type. All pages are fetched.
+        """
+        params = {"per_page": per_page}
+        if form_id:
+            params["form_id"] = form_id
+        if record_id:
+            params["record_id"] = record_id
+        if owner_type:
+            params["owner_type"] = owner_type
 
+        attachments = []
+        page = 1
+        while True:
+            resp_json = self._get_attachments_page({**params, "page": page})
+            page_attachments = resp_json.get("attachments", [])
+            attachments.extend(page_attachments)
 
-def find_key_code(elements: t.List[AppElement], data_name: str) -> str | None:
+            total_pages = resp_json.get("total_pages")
+            if total_pages is not None:
+                if page >= total_pages:
+                    break
+            elif len(page_attachments) < per_page:
+                break
+
+            page += 1
+
+        logger.debug(f"Found {len(attachments)} attachments")
+        return attachments
+
+
+# Rate limited for 4000 calls per hour (actual limit is 5000/h but we want to be safe)
+@rate_limited(4000 / 3600)
+def _get_records_page(transport: Transport, params: dict) -> dict:
+    resp = transport.request("get", "records.json", params=params)
+
+    if resp.status_code != 200:
+        logger.error(resp)
+        raise Exception(f"Failed to get records page {params.get('page')}")
+
+    return resp.json()
+
+
+def iter_record_pages(
+    transport: Transport, form_id: str, per_page: int = 1000, **params
+) -> t.Iterator[t.List[Record]]:
     """
-    Recursively search an app's elements to find the key
-    code of a field in an app
+    Yield the records of a form one page at a time
     """
-    section_types = [
-        "Section",
-        "Repeatable",
-    ]  # type: AppElementTypes
+    page = 1
+    while True:
+        resp_json = _get_records_page(
+            transport, {**params, "form_id": form_id, "page": page, "per_page": per_page}
+        )
+        yield resp_json["records"]
+
+        if page >= (resp_json.get("total_pages") or 1):
+            return
+        page += 1
+
 
-    for element in elements:
-        if element["data_name"] == data_name:
-            return element["key"]
+def get_records_by_id(transport: Transport, form_id: str) -> t.Dict[str, Record]:
+    """
+    Get every record of a form indexed by ID
+    """
+    records_by_id = {}
+    for page in iter_record_pages(transport, form_id):
+        for record in page:
+            records_by_id[record["id"]] = record
 
-        if element["type"] in section_types:
-            key_code = find_key_code(element["elements"], data_name)
-            if key_code:
-                return key_code
+    logger.debug(f"Found {len(records_by_id)} records for form {form_id}")
+    return records_by_id
 
-    return None
+
+def find_key_code(elements: t.List[AppElement], data_name: str) -> str | None:
+    """
+    Find the key code of a field in an app's elements.
+    The elements are indexed on the first lookup.
+    """
+    return index_elements(elements).key_code(data_name)
@@ -0,0 +1,109 @@
+import hashlib
+import inspect
+import json
+import logging
+import os
+import time
+import typing as t
+
+from .types import Record
+
+logger = logging.getLogger(__name__)
+
+# Records changed this many seconds before the last run started are fetched
+# again, in case of clock differences with the API
+OVERLAP_SECONDS = 5 * 60
+
+
+def ruleset_hash(rules: t.List[t.Callable]) -> str:
+    """
+    Hash the source of the rules so a record is processed again whenever the
+    rules that are applied to it change
+    """
+    digest = hashlib.sha256()
+    for rule in rules:
+        digest.update(rule.__name__.encode())
+        try:
+            digest.update(inspect.getsource(rule).encode())
+        except (OSError, TypeError):
+            # No source available (e.g. defined interactively)
+            digest.update(rule.__code__.co_code)
+
+    return digest.hexdigest()[:16]
+
+
+class IncrementalState:
+    """
+    The (version, ruleset hash) of each record processed by a script, so that
+    the next run only fetches and processes the records that have changed.
+
+    Records are fetched in full whenever the ruleset changes. Records that
+    failed to be processed are kept and fetched again on the next run, even
+    if they haven't changed since.
+    """
+
+    def __init__(self, path: str, ruleset: str):
+        self.path = path
+        self.ruleset = ruleset
+        self.run_started_at = time.time()
+
+        self.last_run_at = None  # type: float | None
+        self.records = {}  # type: t.Dict[str, t.Tuple[int, str]]
+        self.failed = set()  # type: t.Set[str]
+
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                state = json.load(f)
+
+            self.records = {k: tuple(v) for k, v in state["records"].items()}
+
+            # A different ruleset means every record has to be looked at again
+            if state["ruleset"] == ruleset:
+                self.last_run_at = state["last_run_at"]
+                self.failed = set(state.get("failed", []))
+            else:
+                logger.info("The ruleset has changed, all records will be processed")
+
+    def updated_since(self) -> int | None:
+        """
+        The `updated_since` to fetch records with, None for every record
+        """
+        if self.last_run_at is None:
+            return None
+
+        return int(self.last_run_at - OVERLAP_SECONDS)
+
+    def is_processed(self, record: Record) -> bool:
+        return self.records.get(record["id"]) == (record["version"], self.ruleset)
+
+    def mark(self, record_id: str, version: int):
+        self.records[record_id] = (version, self.ruleset)
+        self.failed.discard(record_id)
+
+    def mark_failed(self, record_id: str):
+        """
+        Keep a record to be processed again on the next run
+        """
+        self.records.pop(record_id, None)
+        self.failed.add(record_id)
+
+    def failed_since_last_run(self, fetched_ids: t.Iterable[str]) -> t.Set[str]:
+        """
+        The records that failed on an earlier run and haven't been fetched
+        again, they have to be fetched by ID
+        """
+        return self.failed - set(fetched_ids)
+
+    def save(self):
+        tmp_path = self.path + ".part"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "ruleset": self.ruleset,
+                    "last_run_at": self.run_started_at,
+                    "records": self.records,
+                    "failed": sorted(self.failed),
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
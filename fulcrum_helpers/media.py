@@ -0,0 +1,309 @@
+import hashlib
+import json
+import logging
+import threading
+import typing as t
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+from .rate_limit import get_rate_limiter
+from .transport import Transport
+
+logger = logging.getLogger(__name__)
+
+# Form value keys that reference media, mapped to the API resource that
+# owns them. The singular name is used for the multipart upload fields
+# and the plural name for the list response.
+MEDIA_TYPES = {
+    "photo_id": {
+        "resource": "photos",
+        "singular": "photo",
+        "plural": "photos",
+        "upload_path": "",
+    },
+    "video_id": {
+        "resource": "videos",
+        "singular": "video",
+        "plural": "videos",
+        "upload_path": "/upload",
+    },
+    "audio_id": {
+        "resource": "audio",
+        "singular": "audio",
+        "plural": "audio",
+        "upload_path": "/upload",
+    },
+    "signature_id": {
+        "resource": "signatures",
+        "singular": "signature",
+        "plural": "signatures",
+        "upload_path": "",
+    },
+}
+
+# Record attachments are owned by the record they belong to so they can
+# only be created once the new record exists
+ATTACHMENT_KEY = "attachment_id"
+
+
+def collect_media_ids(records: t.List[dict]) -> t.Dict[str, t.Set[str]]:
+    """
+    Collect every media ID referenced by the records, grouped by the
+    form value key that references it (photo_id, video_id, ...)
+    """
+    media_ids = {key: set() for key in MEDIA_TYPES}
+    media_ids[ATTACHMENT_KEY] = set()
+
+    def walk(value):
+        if isinstance(value, list):
+            for item in value:
+                walk(item)
+        elif isinstance(value, dict):
+            for key, item in value.items():
+                if key in media_ids and isinstance(item, str):
+                    media_ids[key].add(item)
+                else:
+                    walk(item)
+
+    for record in records:
+        walk(record.get("form_values", {}))
+
+    return media_ids
+
+
+def rewrite_media_references(value, id_map: t.Dict[str, str]):
+    """
+    Return a copy of a form value with all media references replaced
+    using the old ID -> new ID mapping. IDs not in the mapping are kept.
+    """
+    if isinstance(value, list):
+        return [rewrite_media_references(item, id_map) for item in value]
+
+    if isinstance(value, dict):
+        rewritten = {}
+        for key, item in value.items():
+            if key in MEDIA_TYPES and isinstance(item, str):
+                rewritten[key] = id_map.get(item, item)
+            else:
+                rewritten[key] = rewrite_media_references(item, id_map)
+        return rewritten
+
+    return value
+
+
+class MediaCopier:
+    """
+    Copies the photos, videos, audio and signatures referenced by a set of
+    records so that duplicated records do not point at the source app's media.
+
+    Metadata is fetched in pages per form, the files are transferred by a pool
+    of workers and identical content is only uploaded once. The cache is kept
+    on disk so interrupted copies can be resumed. The calls to the API share
+    the rate limit of the API key with the rest of the script.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        workers: int = 8,
+        cache_path: str = ".media_cache.json",
+        dry_run: bool = False,
+    ):
+        self.api_key = api_key
+        self.workers = workers
+        self.cache_path = cache_path
+        self.dry_run = dry_run
+
+        self.transport = Transport(api_key, pool_size=workers)
+        self.rate_limiter = get_rate_limiter(api_key)
+
+        self._lock = threading.Lock()
+        self.cache = self._load_cache()
+        # The uploads in progress by content hash, so that the workers that
+        # download the same content wait for a single upload
+        self._uploads = {}  # type: t.Dict[str, Future]
+
+    def _load_cache(self) -> dict:
+        try:
+            with open(self.cache_path, "r") as f:
+                cache = json.load(f)
+        except FileNotFoundError:
+            cache = {}
+
+        cache.setdefault("ids", {})
+        cache.setdefault("hashes", {})
+        return cache
+
+    def _save_cache(self):
+        with open(self.cache_path, "w") as f:
+            json.dump(self.cache, f)
+
+    def copy(self, records: t.List[dict], form_id: str) -> t.Dict[str, str]:
+        """
+        Copy all media referenced by the records and return the mapping
+        of old media IDs to new media IDs
+        """
+        media_ids = collect_media_ids(records)
+
+        attachment_ids = media_ids.pop(ATTACHMENT_KEY)
+        if attachment_ids:
+            logger.warning(
+                f"{len(attachment_ids)} record attachments cannot be copied before the record exists, they will reference the source app"
+            )
+
+        jobs = []
+        for key, ids in media_ids.items():
+            if not ids:
+                continue
+
+            media_type = MEDIA_TYPES[key]
+            pending = [x for x in ids if x not in self.cache["ids"]]
+            logger.info(
+                f"Found {len(ids)} {media_type['plural']} ({len(ids) - len(pending)} already copied)"
+            )
+
+            if not pending:
+                continue
+
+            metadata = self.list_media(media_type, form_id)
+            for media_id in pending:
+                jobs.append((media_type, media_id, metadata.get(media_id)))
+
+        if jobs and not self.dry_run:
+            self._run(jobs)
+
+        return dict(self.cache["ids"])
+
+    def _run(self, jobs: t.List[tuple]):
+        failed = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self.copy_media, *job): job[1] for job in jobs
+            }
+            for i, future in enumerate(as_completed(futures), start=1):
+                media_id = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"Failed to copy media: {media_id}", exc_info=e)
+
+                if i % 100 == 0:
+                    logger.info(f"Copied {i}/{len(jobs)} media files")
+                    with self._lock:
+                        self._save_cache()
+
+        with self._lock:
+            self._save_cache()
+
+        if failed:
+            raise Exception(f"Failed to copy {failed}/{len(jobs)} media files")
+
+    def list_media(self, media_type: dict, form_id: str) -> t.Dict[str, dict]:
+        """
+        Page through the media of a form and return the metadata by ID
+        """
+        metadata = {}
+        page = 1
+        while True:
+            resp_json = self._list_page(media_type["resource"], form_id, page)
+            for item in resp_json[media_type["plural"]]:
+                metadata[item["access_key"]] = item
+
+            if page >= resp_json.get("total_pages", 1):
+                break
+            page += 1
+
+        logger.debug(f"Found {len(metadata)} {media_type['plural']} for {form_id}")
+        return metadata
+
+    def _list_page(self, resource: str, form_id: str, page: int) -> dict:
+        self.rate_limiter.wait()
+        resp = self.transport.request(
+            "get",
+            f"{resource}.json",
+            params={"form_id": form_id, "page": page, "per_page": 1000},
+        )
+
+        if resp.status_code != 200:
+            logger.error(resp)
+            raise Exception(f"Failed to list {resource} for form {form_id}")
+
+        return resp.json()
+
+    def _find(self, media_type: dict, media_id: str) -> dict:
+        self.rate_limiter.wait()
+        resp = self.transport.request(
+            "get", f"{media_type['resource']}/{media_id}.json"
+        )
+
+        if resp.status_code != 200:
+            logger.error(resp)
+            raise Exception(f"Failed to get {media_type['singular']} {media_id}")
+
+        return resp.json()[media_type["singular"]]
+
+    def _upload(self, media_type: dict, content: bytes, content_type: str) -> str:
+        self.rate_limiter.wait()
+        new_id = str(uuid.uuid4())
+        singular = media_type["singular"]
+        resp = self.transport.request(
+            "post",
+            f"{media_type['resource']}{media_type['upload_path']}",
+            data={f"{singular}[access_key]": new_id},
+            files={f"{singular}[file]": (new_id, content, content_type)},
+        )
+
+        if resp.status_code not in (200, 201):
+            logger.error(resp)
+            raise Exception(f"Failed to upload {singular}")
+
+        return new_id
+
+    def copy_media(self, media_type: dict, media_id: str, metadata: dict | None):
+        """
+        Download a single media file and upload it again, reusing an
+        existing upload when the content has been seen before
+        """
+        if metadata is None:
+            # Not returned in the form listing (e.g. media from another form)
+            metadata = self._find(media_type, media_id)
+
+        resp = self.transport.request("get", metadata["original"])
+        if resp.status_code != 200:
+            logger.error(resp)
+            raise Exception(f"Failed to download {media_type['singular']} {media_id}")
+
+        content_hash = hashlib.sha256(resp.content).hexdigest()
+
+        with self._lock:
+            new_id = self.cache["hashes"].get(content_hash)
+            upload = self._uploads.get(content_hash)
+            is_uploader = not new_id and upload is None
+            if is_uploader:
+                upload = self._uploads[content_hash] = Future()
+
+        if is_uploader:
+            content_type = metadata.get("content_type") or resp.headers.get(
+                "Content-Type", "application/octet-stream"
+            )
+            try:
+                new_id = self._upload(media_type, resp.content, content_type)
+            except Exception as e:
+                # The workers waiting on this content fail too, a rerun retries it
+                with self._lock:
+                    del self._uploads[content_hash]
+                upload.set_exception(e)
+                raise
+
+            with self._lock:
+                self.cache["hashes"][content_hash] = new_id
+                del self._uploads[content_hash]
+            upload.set_result(new_id)
+        elif not new_id:
+            new_id = upload.result()
+
+        with self._lock:
+            self.cache["ids"][media_id] = new_id
+
+        logger.debug(f"Copied {media_type['singular']}: {media_id} -> {new_id}")
@@ -0,0 +1,491 @@
+import atexit
+import bisect
+import collections
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import typing as t
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Set to print a summary of the API calls made when a script exits
+METRICS_VARIABLE = "FULCRUM_METRICS"
+# Set to a path to keep a Prometheus textfile of the metrics up to date
+PROMETHEUS_VARIABLE = "FULCRUM_METRICS_PROMETHEUS"
+# Set to a path to append every request, sleep and retry to as JSON Lines
+TRACE_VARIABLE = "FULCRUM_METRICS_TRACE"
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# Percentiles are taken from a random sample of this many latencies per endpoint
+SAMPLE_SIZE = 10000
+
+# Seconds between writes of the Prometheus textfile during a run
+PROMETHEUS_INTERVAL = 15.0
+
+# Sleep reasons
+RATE_LIMIT_SLEEP = "rate_limit"
+RETRY_SLEEP = "retry"
+
+# Record, form, attachment, etc. IDs in API paths
+ID_PATTERN = re.compile(
+    r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|\d+)$", re.I
+)
+
+
+def endpoint_name(url: str, base_url: str) -> str:
+    """
+    The endpoint of a URL without IDs, e.g. "records/{id}" for
+    .../api/v2/records/<uuid>.json. Requests outside the API (e.g. downloads
+    from pre-signed URLs) are all "download".
+    """
+    if not url.startswith(base_url):
+        return "download"
+
+    segments = []
+    for segment in urlparse(url[len(base_url) :]).path.split("/"):
+        if segment.endswith(".json"):
+            segment = segment[: -len(".json")]
+        if segment:
+            segments.append("{id}" if ID_PATTERN.match(segment) else segment)
+
+    return "/".join(segments) or "/"
+
+
+class EndpointStats:
+    """
+    The calls made to one endpoint with one method
+    """
+
+    def __init__(self):
+        self.calls = 0
+        # Status code (None for connection errors) -> number of calls
+        self.statuses = collections.Counter()  # type: t.Counter[int | None]
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        # Calls that took at most each of LATENCY_BUCKETS seconds
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.samples = []  # type: t.List[float]
+        self.sent_bytes = 0
+        self.received_bytes = 0
+
+    @property
+    def errors(self) -> int:
+        return sum(
+            count
+            for status, count in self.statuses.items()
+            if status is None or status >= 400
+        )
+
+    def add(
+        self,
+        status: int | None,
+        seconds: float,
+        sent_bytes: int,
+        received_bytes: int,
+        rng: random.Random,
+    ):
+        self.calls += 1
+        self.statuses[status] += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.sent_bytes += sent_bytes
+        self.received_bytes += received_bytes
+
+        for i in range(bisect.bisect_left(LATENCY_BUCKETS, seconds), len(self.buckets)):
+            self.buckets[i] += 1
+
+        # Reservoir sampling, so long runs keep a fixed number of latencies
+        if len(self.samples) < SAMPLE_SIZE:
+            self.samples.append(seconds)
+        else:
+            i = rng.randrange(self.calls)
+            if i < SAMPLE_SIZE:
+                self.samples[i] = seconds
+
+    def percentile(self, percent: float) -> float:
+        if not self.samples:
+            return 0.0
+
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+
+class ApiMetrics:
+    """
+    Counts, latencies and payload sizes of the API calls made in a run, per
+    method and endpoint, with the time spent sleeping for rate limits and
+    retries and the number of retries.
+
+    The Prometheus textfile is rewritten every PROMETHEUS_INTERVAL seconds so
+    a long run can be watched while it is going. The metrics are only
+    reported, a file that can't be written is logged and never fails the
+    request that was being recorded.
+    """
+
+    def __init__(
+        self,
+        prometheus_path: str | None = None,
+        trace_path: str | None = None,
+        script: str | None = None,
+    ):
+        # Imported here as resilience reports its retries to the metrics
+        from .resilience import JsonLinesFile
+
+        self.prometheus_path = prometheus_path
+        self.trace = JsonLinesFile(trace_path) if trace_path else None
+        self.script = script or os.path.basename(sys.argv[0] or "python")
+        self.started_at = time.time()
+
+        self.lock = threading.Lock()
+        self.rng = random.Random(0)
+        self.endpoints = {}  # type: t.Dict[t.Tuple[str, str], EndpointStats]
+        # Reason -> seconds slept
+        self.sleeps = collections.Counter()  # type: t.Counter[str]
+        # (operation, error class) -> number of retries
+        self.retries = collections.Counter()  # type: t.Counter[t.Tuple[str, str]]
+        self.last_written_at = 0.0
+        # Held while the Prometheus textfile is written
+        self.write_lock = threading.Lock()
+
+    def _trace(self, event: str, **fields):
+        if not self.trace:
+            return
+
+        try:
+            self.trace.append(
+                {
+                    "time": datetime.now(timezone.utc).isoformat(),
+                    "event": event,
+                    **fields,
+                }
+            )
+        except OSError as e:
+            logger.warning(f"Failed to write to the metrics trace: {e}")
+
+    def record_request(
+        self,
+        method: str,
+        endpoint: str,
+        status: int | None,
+        seconds: float,
+        sent_bytes: int = 0,
+        received_bytes: int = 0,
+    ):
+        method = method.upper()
+        with self.lock:
+            stats = self.endpoints.get((method, endpoint))
+            if stats is None:
+                stats = self.endpoints[(method, endpoint)] = EndpointStats()
+            stats.add(status, seconds, sent_bytes, received_bytes, self.rng)
+
+        self._trace(
+            "request",
+            method=method,
+            endpoint=endpoint,
+            status=status,
+            seconds=round(seconds, 6),
+            sent_bytes=sent_bytes,
+            received_bytes=received_bytes,
+        )
+
+        if (
+            self.prometheus_path
+            and time.time() - self.last_written_at >= PROMETHEUS_INTERVAL
+        ):
+            # The other threads carry on while one of them writes the file
+            if self.write_lock.acquire(blocking=False):
+                try:
+                    if time.time() - self.last_written_at >= PROMETHEUS_INTERVAL:
+                        self._write_prometheus(self.prometheus_path)
+                finally:
+                    self.write_lock.release()
+
+    def record_response(
+        self,
+        method: str,
+        endpoint: str,
+        response: requests.Response,
+        seconds: float,
+        streamed: bool = False,
+    ):
+        """
+        Record a request from its response. The bytes are those on the wire
+        when the Content-Length is known, the body of a streamed response
+        isn't read to find its size.
+        """
+        sent_bytes = int(response.request.headers.get("Content-Length") or 0)
+
+        received_bytes = response.headers.get("Content-Length")
+        if received_bytes is None:
+            received_bytes = 0 if streamed else len(response.content)
+
+        self.record_request(
+            method,
+            endpoint,
+            response.status_code,
+            seconds,
+            sent_bytes,
+            int(received_bytes),
+        )
+
+    def record_sleep(self, reason: str, seconds: float):
+        with self.lock:
+            self.sleeps[reason] += seconds
+
+        self._trace("sleep", reason=reason, seconds=round(seconds, 6))
+
+    def record_retry(self, operation: str, error_class: str, delay: float):
+        with self.lock:
+            self.retries[(operation, error_class)] += 1
+
+        self._trace(
+            "retry", operation=operation, error_class=error_class, delay=round(delay, 3)
+        )
+        self.record_sleep(RETRY_SLEEP, delay)
+
+    def calls(self) -> int:
+        with self.lock:
+            return sum(stats.calls for stats in self.endpoints.values())
+
+    def summary(self) -> str:
+        """
+        A table of the calls made to each endpoint and the totals of the run
+        """
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            sleeps = dict(self.sleeps)
+            retries = dict(self.retries)
+
+        rows = [
+            [
+                "Endpoint",
+                "Calls",
+                "Errors",
+                "p50 ms",
+                "p95 ms",
+                "p99 ms",
+                "Max ms",
+                "Sent KB",
+                "Received KB",
+            ]
+        ]
+        for (method, endpoint), stats in endpoints:
+            rows.append(
+                [
+                    f"{method} {endpoint}",
+                    str(stats.calls),
+                    str(stats.errors),
+                    *[
+                        f"{seconds * 1000:.0f}"
+                        for seconds in [
+                            stats.percentile(50),
+                            stats.percentile(95),
+                            stats.percentile(99),
+                            stats.max_seconds,
+                        ]
+                    ],
+                    f"{stats.sent_bytes / 1024:.1f}",
+                    f"{stats.received_bytes / 1024:.1f}",
+                ]
+            )
+
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines = [
+            "  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip()
+            for row in rows
+        ]
+
+        calls = sum(stats.calls for _, stats in endpoints)
+        api_seconds = sum(stats.seconds for _, stats in endpoints)
+        lines.append(
+            f"{calls} calls in {time.time() - self.started_at:.1f}s, {api_seconds:.1f}s waiting on the API"
+        )
+        for reason, seconds in sorted(sleeps.items()):
+            lines.append(f"Slept {seconds:.1f}s ({reason})")
+        for (operation, error_class), count in sorted(retries.items()):
+            lines.append(f"Retried {operation} {count} times ({error_class})")
+
+        return "\n".join(lines)
+
+    def prometheus(self) -> str:
+        """
+        The metrics in the Prometheus text format
+        """
+        script = self.script.replace("\\", "\\\\").replace('"', '\\"')
+
+        def labels(**values) -> str:
+            return ",".join(
+                [f'script="{script}"']
+                + [f'{name}="{value}"' for name, value in values.items()]
+            )
+
+        lines = [
+            "# HELP fulcrum_api_requests_total Requests made to the Fulcrum API.",
+            "# TYPE fulcrum_api_requests_total counter",
+        ]
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            for (method, endpoint), stats in endpoints:
+                for status, count in sorted(
+                    stats.statuses.items(), key=lambda item: str(item[0])
+                ):
+                    lines.append(
+                        f"fulcrum_api_requests_total{{{labels(method=method, endpoint=endpoint, status=status or 'error')}}} {count}"
+                    )
+
+            lines += [
+                "# HELP fulcrum_api_request_duration_seconds Latency of requests to the Fulcrum API.",
+                "# TYPE fulcrum_api_request_duration_seconds histogram",
+            ]
+            for (method, endpoint), stats in endpoints:
+                endpoint_labels = labels(method=method, endpoint=endpoint)
+                for le, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    lines.append(
+                        f'fulcrum_api_request_duration_seconds_bucket{{{endpoint_labels},le="{le}"}} {count}'
+                    )
+                lines += [
+                    f'fulcrum_api_request_duration_seconds_bucket{{{endpoint_labels},le="+Inf"}} {stats.calls}',
+                    f"fulcrum_api_request_duration_seconds_sum{{{endpoint_labels}}} {stats.seconds}",
+                    f"fulcrum_api_request_duration_seconds_count{{{endpoint_labels}}} {stats.calls}",
+                ]
+
+            for name, direction, attribute in [
+                ("fulcrum_api_sent_bytes_total", "sent to", "sent_bytes"),
+                ("fulcrum_api_received_bytes_total", "received from", "received_bytes"),
+            ]:
+                lines += [
+                    f"# HELP {name} Bytes {direction} the Fulcrum API.",
+                    f"# TYPE {name} counter",
+                ]
+                for (method, endpoint), stats in endpoints:
+                    lines.append(
+                        f"{name}{{{labels(method=method, endpoint=endpoint)}}} {getattr(stats, attribute)}"
+                    )
+
+            lines += [
+                "# HELP fulcrum_sleep_seconds_total Time spent sleeping for rate limits and retries.",
+                "# TYPE fulcrum_sleep_seconds_total counter",
+            ]
+            for reason, seconds in sorted(self.sleeps.items()):
+                lines.append(
+                    f"fulcrum_sleep_seconds_total{{{labels(reason=reason)}}} {seconds}"
+                )
+
+            lines += [
+                "# HELP fulcrum_retries_total Writes retried after an error.",
+                "# TYPE fulcrum_retries_total counter",
+            ]
+            for (operation, error_class), count in sorted(self.retries.items()):
+                lines.append(
+                    f"fulcrum_retries_total{{{labels(operation=operation, error_class=error_class)}}} {count}"
+                )
+
+        lines += [
+            "# HELP fulcrum_run_started_at_seconds When the run started.",
+            "# TYPE fulcrum_run_started_at_seconds gauge",
+            f"fulcrum_run_started_at_seconds{{{labels()}}} {self.started_at}",
+        ]
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str | None = None):
+        """
+        Write the Prometheus textfile, replaced in one go so that it is never
+        read half written
+        """
+        path = path or self.prometheus_path
+        if not path:
+            return
+
+        with self.write_lock:
+            self._write_prometheus(path)
+
+    def _write_prometheus(self, path: str):
+        self.last_written_at = time.time()
+        content = self.prometheus()
+
+        # Unique so that no other writer (e.g. another process sharing the
+        # file) can replace or remove it first
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write the Prometheus textfile {path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def finish(self, print_summary: bool = True):
+        """
+        Write the final metrics and print the summary, when the script exits
+        """
+        self.write_prometheus()
+
+        if print_summary and self.endpoints:
+            print(self.summary(), file=sys.stderr)
+
+
+_metrics = None  # type: ApiMetrics | None
+_configured = False
+_metrics_lock = threading.Lock()
+
+
+def enable_metrics(
+    prometheus_path: str | None = None,
+    trace_path: str | None = None,
+    print_summary: bool = True,
+) -> ApiMetrics:
+    """
+    Record the API calls made from now on, the summary is printed and the
+    files are written when the script exits
+    """
+    with _metrics_lock:
+        return _enable_metrics(prometheus_path, trace_path, print_summary)
+
+
+def _enable_metrics(
+    prometheus_path: str | None, trace_path: str | None, print_summary: bool
+) -> ApiMetrics:
+    global _metrics, _configured
+
+    _metrics = ApiMetrics(prometheus_path, trace_path)
+    _configured = True
+
+    atexit.register(_metrics.finish, print_summary)
+    return _metrics
+
+
+def get_metrics() -> ApiMetrics | None:
+    """
+    The metrics of this run, if they are enabled. They are enabled on the
+    first call when $FULCRUM_METRICS, $FULCRUM_METRICS_PROMETHEUS or
+    $FULCRUM_METRICS_TRACE is set.
+    """
+    if _configured:
+        return _metrics
+
+    prometheus_path = os.getenv(PROMETHEUS_VARIABLE)
+    trace_path = os.getenv(TRACE_VARIABLE)
+    print_summary = bool(os.getenv(METRICS_VARIABLE))
+
+    if not (print_summary or prometheus_path or trace_path):
+        return None
+
+    with _metrics_lock:
+        if _configured:
+            return _metrics
+
+        return _enable_metrics(prometheus_path, trace_path, print_summary)
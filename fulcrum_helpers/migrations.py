@@ -0,0 +1,254 @@
+import logging
+import typing as t
+
+from .types import Record
+
+logger = logging.getLogger(__name__)
+
+# How repeatable entries in the source are matched to those in the destination
+MATCH_POSITION = "position"
+MATCH_ID = "id"
+MATCH_FIELDS = "fields"
+
+
+class FieldMigration:
+    """
+    Copy a field from one record to another, e.g. between apps.
+
+    Paths are the keys of the repeatables the field is in followed by the
+    key of the field, e.g. ["d93c", "6008"] for field 6008 in repeatable d93c.
+    Repeatable entries are matched by position, by entry ID or by the values
+    of `match_fields` ((source key, destination key) pairs).
+    """
+
+    def __init__(
+        self,
+        source_path: t.List[str],
+        destination_path: t.List[str],
+        match: str = MATCH_POSITION,
+        match_fields: t.List[t.Tuple[str, str]] | None = None,
+        overwrite: bool = True,
+    ):
+        if len(source_path) != len(destination_path):
+            raise Exception(
+                f"Paths must be in the same number of repeatables: {source_path} -> {destination_path}"
+            )
+        if match == MATCH_FIELDS and not match_fields:
+            raise Exception("match_fields are needed to match entries by fields")
+
+        self.source_path = source_path
+        self.destination_path = destination_path
+        self.match = match
+        self.match_fields = match_fields or []
+        self.overwrite = overwrite
+
+    def __repr__(self):
+        return f"FieldMigration({'.'.join(self.source_path)} -> {'.'.join(self.destination_path)})"
+
+
+class MigrationResult(t.NamedTuple):
+    original: Record
+    updated: Record
+    # (migration, destination entry ID or None, value) for each value copied
+    changes: t.List[t.Tuple[FieldMigration, str | None, t.Any]]
+
+
+class _Step:
+    """
+    The migrations that share a pair of containers. Fields at this level are
+    copied and the entries of each child repeatable pair are matched once for
+    all the migrations under them.
+    """
+
+    def __init__(self):
+        # (source key, destination key, migration)
+        self.fields = []  # type: t.List[t.Tuple[str, str, FieldMigration]]
+        # (source key, destination key, match, match fields) -> step
+        self.children = {}  # type: t.Dict[tuple, _Step]
+
+    def add(self, migration: FieldMigration, depth: int = 0):
+        source_key = migration.source_path[depth]
+        destination_key = migration.destination_path[depth]
+
+        if depth == len(migration.source_path) - 1:
+            self.fields.append((source_key, destination_key, migration))
+            return
+
+        child_key = (
+            source_key,
+            destination_key,
+            migration.match,
+            tuple(migration.match_fields),
+        )
+        self.children.setdefault(child_key, _Step()).add(migration, depth + 1)
+
+
+def _match_entries(
+    source_entries: t.List[dict],
+    destination_entries: t.List[dict],
+    match: str,
+    match_fields: t.Tuple[t.Tuple[str, str], ...],
+) -> t.Iterator[t.Tuple[int, dict | None]]:
+    """
+    Yield each destination entry index with its source entry (or None)
+    """
+    if match == MATCH_POSITION:
+        for i in range(len(destination_entries)):
+            yield i, source_entries[i] if i < len(source_entries) else None
+        return
+
+    if match == MATCH_ID:
+        source_by_key = {entry.get("id"): entry for entry in source_entries}
+        for i, entry in enumerate(destination_entries):
+            yield i, source_by_key.get(entry.get("id"))
+        return
+
+    def fields_key(entry: dict, side: int):
+        form_values = entry.get("form_values", {})
+        return tuple(repr(form_values.get(keys[side])) for keys in match_fields)
+
+    source_by_key = {}
+    for entry in source_entries:
+        source_by_key.setdefault(fields_key(entry, 0), entry)
+    for i, entry in enumerate(destination_entries):
+        yield i, source_by_key.get(fields_key(entry, 1))
+
+
+def _apply_step(
+    step: _Step,
+    source_values: dict,
+    destination_values: dict,
+    entry_id: str | None,
+    changes: list,
+    errors: list,
+) -> dict | None:
+    """
+    Apply the migrations of a step to a pair of form values. Only the
+    containers that change are copied, None is returned if nothing changed.
+    """
+    updated_values = None
+
+    for source_key, destination_key, migration in step.fields:
+        value = source_values.get(source_key)
+        # There is no key when no value was set for the field
+        if not value:
+            continue
+
+        current = destination_values.get(destination_key)
+        if current == value or (current and not migration.overwrite):
+            continue
+
+        if updated_values is None:
+            updated_values = dict(destination_values)
+        updated_values[destination_key] = value
+        changes.append((migration, entry_id, value))
+
+    for child_key, child in step.children.items():
+        source_key, destination_key, match, match_fields = child_key
+        source_entries = source_values.get(source_key)
+        if not source_entries:
+            continue
+
+        # Another step may already have changed the same repeatable
+        destination_entries = (updated_values or destination_values).get(
+            destination_key
+        )
+        if not destination_entries:
+            errors.append(f"No {destination_key} entries for the {source_key} entries")
+            continue
+
+        updated_entries = None
+        for i, source_entry in _match_entries(
+            source_entries, destination_entries, match, match_fields
+        ):
+            destination_entry = destination_entries[i]
+            if source_entry is None:
+                errors.append(
+                    f"No {source_key} entry matches {destination_key} entry {destination_entry.get('id')}"
+                )
+                continue
+
+            entry_values = _apply_step(
+                child,
+                source_entry.get("form_values", {}),
+                destination_entry.get("form_values", {}),
+                destination_entry.get("id"),
+                changes,
+                errors,
+            )
+            if entry_values is None:
+                continue
+
+            if updated_entries is None:
+                updated_entries = list(destination_entries)
+            updated_entries[i] = {**destination_entry, "form_values": entry_values}
+
+        if updated_entries is not None:
+            if updated_values is None:
+                updated_values = dict(destination_values)
+            updated_values[destination_key] = updated_entries
+
+    return updated_values
+
+
+class MigrationPlan:
+    """
+    Several field migrations compiled into a single pass over each pair of
+    source and destination records
+    """
+
+    def __init__(self, migrations: t.List[FieldMigration]):
+        self.migrations = migrations
+        self.root = _Step()
+        for migration in migrations:
+            self.root.add(migration)
+
+        # Problems found while migrating, by destination record ID
+        self.errors = {}  # type: t.Dict[str, t.List[str]]
+
+    def apply(self, source: Record, destination: Record) -> MigrationResult | None:
+        """
+        Get a copy of the destination record with the fields migrated from the
+        source record, None if nothing changes
+        """
+        changes = []
+        errors = []
+        form_values = _apply_step(
+            self.root,
+            source["form_values"],
+            destination["form_values"],
+            None,
+            changes,
+            errors,
+        )
+
+        if errors:
+            errors = list(dict.fromkeys(errors))
+            self.errors[destination["id"]] = errors
+            for error in errors:
+                logger.warning(f"{source['id']} -> {destination['id']}: {error}")
+
+        if form_values is None:
+            return None
+
+        return MigrationResult(
+            destination, {**destination, "form_values": form_values}, changes
+        )
+
+    def apply_all(
+        self, pairs: t.Iterable[t.Tuple[Record, Record]]
+    ) -> t.List[MigrationResult]:
+        """
+        Migrate many (source, destination) record pairs, returning the
+        destination records that change
+        """
+        results = []
+        for source, destination in pairs:
+            result = self.apply(source, destination)
+            if result:
+                results.append(result)
+
+        logger.info(
+            f"{len(results)} records to update, {len(self.errors)} records with problems"
+        )
+        return results
@@ -0,0 +1,146 @@
+import json
+import logging
+import threading
+
+import requests
+
+from .helpers import rate_limited
+from .resilience import ResilientWriter
+from .transport import Transport
+from .types import Record
+
+logger = logging.getLogger(__name__)
+
+# Record properties that are set by Fulcrum and never sent back
+READ_ONLY_KEYS = [
+    "id",
+    "form_id",
+    "version",
+    "created_at",
+    "updated_at",
+    "client_created_at",
+    "client_updated_at",
+    "created_by",
+    "created_by_id",
+    "updated_by",
+    "updated_by_id",
+    "created_location",
+    "updated_location",
+    "created_duration",
+    "updated_duration",
+    "edited_duration",
+    "changeset_id",
+]
+
+# Statuses for which a PATCH is retried as a full PUT
+PATCH_UNSUPPORTED_STATUSES = [404, 405, 501]
+
+
+def compute_record_patch(original: Record, updated: Record) -> dict:
+    """
+    Get the properties and form values that differ between two versions of a
+    record. A form value that has been removed is patched to None.
+    """
+    patch = {}
+
+    for key, value in updated.items():
+        if key in READ_ONLY_KEYS or key == "form_values":
+            continue
+        if original.get(key) != value:
+            patch[key] = value
+
+    original_values = original.get("form_values") or {}
+    updated_values = updated.get("form_values") or {}
+
+    form_values = {
+        key: value
+        for key, value in updated_values.items()
+        if original_values.get(key) != value
+    }
+    for key in original_values:
+        if key not in updated_values:
+            form_values[key] = None
+
+    if form_values:
+        patch["form_values"] = form_values
+
+    return patch
+
+
+class RecordPatcher:
+    """
+    Writes only the changes made to a record.
+
+    The changed properties and form values are sent in a PATCH, with the
+    version the changes were made against so that Fulcrum can reject them if
+    the record has been changed since it was fetched. If the API doesn't
+    accept the PATCH the whole record is PUT instead, and later updates go
+    straight to a PUT.
+    """
+
+    def __init__(self, transport: Transport, writer: ResilientWriter | None = None):
+        self.transport = transport
+        self.writer = writer or ResilientWriter()
+        self.use_patch = True
+        self.lock = threading.Lock()
+
+    def _request(self, method: str, record_id: str, record: dict) -> requests.Response:
+        return self.transport.request(
+            method,
+            f"records/{record_id}.json",
+            data=json.dumps({"record": record}),
+            headers={"Content-Type": "application/json"},
+        )
+
+    # Rate limited for 4000 calls per hour (actual limit is 5000/h but we want to be safe)
+    @rate_limited(4000 / 3600)
+    def _send(self, record_id: str, patch: dict, record: Record) -> dict:
+        if self.use_patch:
+            resp = self._request(
+                "patch", record_id, {**patch, "version": record.get("version")}
+            )
+
+            if resp.status_code not in PATCH_UNSUPPORTED_STATUSES:
+                resp.raise_for_status()
+                return resp.json()
+
+            logger.debug(f"PATCH not accepted ({resp.status_code}), sending a PUT")
+
+        resp = self._request("put", record_id, record)
+        resp.raise_for_status()
+
+        if self.use_patch:
+            # The record exists so it was the PATCH that wasn't supported
+            with self.lock:
+                self.use_patch = False
+            logger.warning("Record PATCH is not supported, whole records will be sent")
+
+        return resp.json()
+
+    def update(self, original: Record, updated: Record) -> dict | None:
+        """
+        Update a record from the version it was fetched at. Returns the API
+        response, the original record if nothing changed or None on failure.
+        """
+        patch = compute_record_patch(original, updated)
+
+        if not patch:
+            logger.debug(f"No changes to record: {original['id']}")
+            return {"record": original}
+
+        changed_keys = [key for key in patch if key != "form_values"]
+        changed_keys.extend(patch.get("form_values", {}))
+        logger.debug(f"Updating record {original['id']}: {', '.join(changed_keys)}")
+
+        # The version of the changes is the version they were made against
+        record = {**updated, "version": original.get("version")}
+
+        return self.writer.call(
+            "update_record",
+            self._send,
+            original["id"],
+            patch,
+            record,
+            key=original["id"],
+            payload=patch,
+        )
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import threading
+import time
+
+from .metrics import RATE_LIMIT_SLEEP, get_metrics
+
+# Rate limited for 4000 calls per hour (actual limit is 5000/h but we want to be safe)
+DEFAULT_MAX_PER_SECOND = 4000 / 3600
+
+# Set to turn off the client side rate limits, e.g. against the local fake API
+NO_RATE_LIMIT_VARIABLE = "FULCRUM_NO_RATE_LIMIT"
+
+
+class RateLimiter:
+    """
+    A token bucket for the calls made with an API key. Up to `burst` calls
+    can start at once, after which calls start at `max_per_second`.
+
+    The limit is for the whole account so every call made with the key,
+    from any thread or event loop, should reserve its slot from the same
+    limiter (see get_rate_limiter). Calls aren't limited while $FULCRUM_NO_RATE_LIMIT is
+    set.
+    """
+
+    def __init__(self, max_per_second: float, burst: int = 1):
+        self.interval = 1.0 / float(max_per_second)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take a token and return how long to wait before it can be used
+        """
+        if os.getenv(NO_RATE_LIMIT_VARIABLE):
+            return 0
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated_at) / self.interval
+            )
+            self.updated_at = now
+            self.tokens -= 1
+
+            if self.tokens >= 0:
+                return 0
+
+            return -self.tokens * self.interval
+
+    def wait(self):
+        """
+        Block until the next call can be made
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+            self._record_sleep(wait)
+
+    async def acquire(self):
+        """
+        Wait, without blocking the event loop, until the next call can be made
+        """
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+            self._record_sleep(wait)
+
+    def _record_sleep(self, seconds: float):
+        metrics = get_metrics()
+        if metrics:
+            metrics.record_sleep(RATE_LIMIT_SLEEP, seconds)
+
+
+_rate_limiters = {}  # type: dict[str, RateLimiter]
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(
+    api_key: str | None = None, max_per_second: float = DEFAULT_MAX_PER_SECOND
+) -> RateLimiter:
+    """
+    Get the limiter shared by every call made with an API key, the key in
+    $FULCRUM_API_KEY by default. `max_per_second` is only used when the
+    limiter is first created.
+    """
+    api_key = api_key or os.getenv("FULCRUM_API_KEY") or ""
+
+    with _rate_limiters_lock:
+        if api_key not in _rate_limiters:
+            _rate_limiters[api_key] = RateLimiter(max_per_second)
+        return _rate_limiters[api_key]
@@ -0,0 +1,110 @@
+import glob
+import json
+import logging
+import typing as t
+
+from .helpers import get_records_by_id
+from .schema import SchemaRegistry
+from .transport import Transport
+from .types import Record
+
+logger = logging.getLogger(__name__)
+
+# The ID mapping files written by import_api.py
+ID_MAPPING_PATTERN = "old_to_new_id_mapping_*.json"
+
+
+def load_id_mappings(pattern: str = ID_MAPPING_PATTERN) -> t.Dict[str, str]:
+    """
+    Merge every old -> new record ID mapping file that matches a pattern
+    """
+    mapping = {}
+    paths = sorted(glob.glob(pattern))
+    for path in paths:
+        with open(path, "r") as f:
+            mapping.update(json.load(f))
+
+    logger.debug(f"Loaded {len(mapping)} ID mappings from {len(paths)} files")
+    return mapping
+
+
+class LinkResolution(t.NamedTuple):
+    # Record IDs that exist in the app
+    existing: t.Set[str]
+    # Old record ID -> new record ID for the IDs that have a mapping
+    remapped: t.Dict[str, str]
+    # Record IDs that neither exist nor have a mapping
+    missing: t.List[str]
+
+
+class RecordIndex:
+    """
+    Answers whether records exist in an app. The app is found by name and all
+    of its records are fetched once, on the first lookup.
+    """
+
+    def __init__(
+        self,
+        transport: Transport,
+        form_name: str,
+        schemas: SchemaRegistry | None = None,
+        id_mapping: t.Dict[str, str] | None = None,
+    ):
+        self.transport = transport
+        self.form_name = form_name
+        self.schemas = schemas or SchemaRegistry(transport)
+        self._id_mapping = id_mapping
+
+        self._records_by_id = None  # type: t.Dict[str, Record] | None
+        self._ids = None  # type: t.FrozenSet[str] | None
+
+    def load(self):
+        form = self.schemas.get_app(self.form_name)
+        if not form:
+            raise Exception(f"App not found: {self.form_name}")
+
+        self._records_by_id = get_records_by_id(self.transport, form["id"])
+        self._ids = frozenset(self._records_by_id)
+        logger.info(f"Indexed {len(self._ids)} records of {self.form_name}")
+
+    @property
+    def records_by_id(self) -> t.Dict[str, Record]:
+        if self._records_by_id is None:
+            self.load()
+        return self._records_by_id
+
+    @property
+    def ids(self) -> t.FrozenSet[str]:
+        if self._ids is None:
+            self.load()
+        return self._ids
+
+    @property
+    def id_mapping(self) -> t.Dict[str, str]:
+        if self._id_mapping is None:
+            self._id_mapping = load_id_mappings()
+        return self._id_mapping
+
+    def exists(self, record_id: str) -> bool:
+        return record_id in self.ids
+
+    def get(self, record_id: str) -> Record | None:
+        return self.records_by_id.get(record_id)
+
+    def resolve(self, record_ids: t.Iterable[str]) -> LinkResolution:
+        """
+        Check many linked record IDs at once. IDs that don't exist in the app
+        are looked up in the old -> new ID mappings.
+        """
+        record_ids = set(record_ids)
+
+        existing = record_ids & self.ids
+        remapped = {}
+        missing = []
+        for record_id in record_ids - existing:
+            if record_id in self.id_mapping:
+                remapped[record_id] = self.id_mapping[record_id]
+            else:
+                missing.append(record_id)
+
+        return LinkResolution(existing, remapped, missing)
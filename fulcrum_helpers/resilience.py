@@ -0,0 +1,354 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+import typing as t
+from datetime import datetime, timezone
+
+import requests
+
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Error classes
+RATE_LIMIT = "rate_limit"
+TRANSIENT = "transient"
+VALIDATION = "validation"
+PERMANENT = "permanent"
+
+
+class WriteError(Exception):
+    """
+    A write that could not be completed
+    """
+
+    def __init__(self, message: str, error_class: str, response=None):
+        super().__init__(message)
+        self.error_class = error_class
+        self.response = response
+
+
+def check_response(response: t.Any) -> t.Any:
+    """
+    Raise a validation error if the API returned errors in the body of a
+    successful response (e.g. {"record": {"errors": ...}})
+    """
+    if isinstance(response, dict):
+        if "error" in response or "errors" in response:
+            raise WriteError(f"API returned errors: {response}", VALIDATION)
+
+        for value in response.values():
+            if isinstance(value, dict) and "errors" in value:
+                raise WriteError(f"API returned errors: {response}", VALIDATION)
+
+    return response
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Classify an exception raised by a write as a rate limit, transient,
+    validation or permanent error
+    """
+    from fulcrum.exceptions import (BadRequestException,
+                                    InternalServerErrorException,
+                                    NotFoundException,
+                                    RateLimitExceededException,
+                                    UnauthorizedException)
+
+    if isinstance(error, WriteError):
+        return error.error_class
+
+    if isinstance(error, RateLimitExceededException):
+        return RATE_LIMIT
+
+    if isinstance(error, InternalServerErrorException):
+        return TRANSIENT
+
+    if isinstance(error, BadRequestException):
+        return VALIDATION
+
+    if isinstance(error, (UnauthorizedException, NotFoundException)):
+        return PERMANENT
+
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return TRANSIENT
+
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return classify_status(error.response.status_code)
+
+    # A body that could not be decoded usually means a gateway error page,
+    # other value errors are bugs in the payload or the script
+    if isinstance(error, requests.JSONDecodeError):
+        return TRANSIENT
+
+    return PERMANENT
+
+
+def classify_status(status_code: int) -> str:
+    if status_code == 429:
+        return RATE_LIMIT
+    if status_code >= 500 or status_code == 408:
+        return TRANSIENT
+    if status_code in (400, 422):
+        return VALIDATION
+    return PERMANENT
+
+
+def get_retry_after(error: Exception) -> float | None:
+    """
+    Get the number of seconds from a Retry-After header, if the error has one
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    # Retry-After can also be an HTTP date
+    try:
+        from email.utils import parsedate_to_datetime
+
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter. Rate limits back off from a longer
+    base delay and Retry-After is used when the API sends it.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 8,
+        base_delay: float = 1.0,
+        rate_limit_base_delay: float = 30.0,
+        max_delay: float = 300.0,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.rate_limit_base_delay = rate_limit_base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, error_class: str, attempt: int) -> bool:
+        if error_class not in (RATE_LIMIT, TRANSIENT):
+            return False
+
+        return attempt < self.max_attempts
+
+    def delay(self, error: Exception, error_class: str, attempt: int) -> float:
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+
+        base = self.rate_limit_base_delay if error_class == RATE_LIMIT else self.base_delay
+        return random.uniform(0, min(self.max_delay, base * 2 ** (attempt - 1)))
+
+
+class JsonLinesFile:
+    """
+    An append-only JSON Lines file that can be written from several threads
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def append(self, entry: dict):
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+
+    def read(self) -> t.List[dict]:
+        if not os.path.exists(self.path):
+            return []
+
+        with open(self.path, "r") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+class ResilientWriter:
+    """
+    Runs API writes with classified retries.
+
+    - Rate limits and transient (5xx/network) errors are retried with backoff
+    - Validation and other permanent errors are not retried
+    - Writes that fail permanently are appended to a dead letter file and
+      None is returned, so a long run carries on with the next write
+    - Creates with an idempotency key are recorded in a journal and are not
+      sent again on later runs
+    - Creates are only sent again after a failure that may have reached the
+      API (a timeout or 5xx) if they can look for the created resource first
+    """
+
+    def __init__(
+        self,
+        policy: RetryPolicy | None = None,
+        dead_letter_path: str = "dead_letter.jsonl",
+        journal_path: str | None = None,
+    ):
+        self.policy = policy or RetryPolicy()
+        self.dead_letter = JsonLinesFile(dead_letter_path)
+        self.journal = JsonLinesFile(journal_path) if journal_path else None
+
+        self.completed = {}  # type: t.Dict[str, t.Any]
+        if self.journal:
+            for entry in self.journal.read():
+                self.completed[entry["key"]] = entry["result"]
+
+            if self.completed:
+                logger.info(
+                    f"Loaded {len(self.completed)} completed writes from {journal_path}"
+                )
+
+    def call(
+        self,
+        operation: str,
+        func: t.Callable,
+        *args,
+        key: str | None = None,
+        payload: t.Any = None,
+        **kwargs,
+    ):
+        """
+        Call a write function, retrying it according to the policy.
+        Returns the result of the function or None if it failed permanently.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return check_response(func(*args, **kwargs))
+            except Exception as e:
+                error_class = classify_error(e)
+
+                if not self.policy.should_retry(error_class, attempt):
+                    logger.error(
+                        f"{operation} failed ({error_class}) after {attempt} attempts: {key or ''} {e}"
+                    )
+                    self.dead_letter.append(
+                        {
+                            "time": datetime.now(timezone.utc).isoformat(),
+                            "operation": operation,
+                            "key": key,
+                            "error_class": error_class,
+                            "error": repr(e),
+                            "attempts": attempt,
+                            "payload": payload,
+                        }
+                    )
+                    return None
+
+                delay = self.policy.delay(e, error_class, attempt)
+                metrics = get_metrics()
+                if metrics:
+                    metrics.record_retry(operation, error_class, delay)
+                logger.warning(
+                    f"{operation} failed ({error_class}), retrying in {delay:.1f}s (attempt {attempt}/{self.policy.max_attempts}): {key or ''}"
+                )
+                time.sleep(delay)
+
+    def create(
+        self,
+        operation: str,
+        func: t.Callable,
+        *args,
+        key: str | None = None,
+        payload: t.Any = None,
+        find_existing: t.Callable[[], t.Any] | None = None,
+        **kwargs,
+    ):
+        """
+        Call a create function at most once per idempotency key.
+
+        A failed attempt may still have created the resource (e.g. a timeout
+        after the request was sent), so the create is only sent again if the
+        find_existing callback didn't find it. Without find_existing the
+        create fails instead of risking a duplicate.
+        """
+        if key is not None and key in self.completed:
+            logger.debug(f"{operation} already completed: {key}")
+            return self.completed[key]
+
+        # The last error that may have reached the API
+        ambiguous_error = [None]  # type: t.List[Exception | None]
+
+        def guarded_create():
+            if ambiguous_error[0] is not None:
+                if not find_existing:
+                    raise WriteError(
+                        f"{operation} may have been created by a failed attempt, not sending it again: {ambiguous_error[0]!r}",
+                        PERMANENT,
+                    )
+
+                existing = find_existing()
+                if existing:
+                    logger.warning(f"{operation} found an existing result: {key}")
+                    return existing
+
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                # Rate limits and connections that were never made didn't
+                # reach the API
+                if classify_error(e) == TRANSIENT and not isinstance(
+                    e, requests.ConnectTimeout
+                ):
+                    ambiguous_error[0] = e
+                raise
+
+        result = self.call(operation, guarded_create, key=key, payload=payload)
+
+        if result is not None and key is not None and self.journal:
+            self.completed[key] = result
+            self.journal.append({"key": key, "result": result})
+
+        return result
+
+
+def find_created_record(fulcrum, payload: dict) -> t.Callable[[], dict | None]:
+    """
+    Make a find_existing callback for ResilientWriter.create that looks for a
+    record created from `payload` by an earlier attempt: a record of the same
+    form, updated since the callback was made, with the same status, location
+    and form values.
+    """
+    record = payload["record"]
+    # A minute of leeway for the difference between our clock and Fulcrum's
+    since = int(time.time()) - 60
+
+    def matches(existing: dict) -> bool:
+        for field in ("status", "latitude", "longitude"):
+            if field in record and existing.get(field) != record[field]:
+                return False
+
+        form_values = existing.get("form_values") or {}
+        return all(
+            form_values.get(key) == value
+            for key, value in (record.get("form_values") or {}).items()
+        )
+
+    def find_existing():
+        records = fulcrum.records.search(
+            url_params={"form_id": record["form_id"], "updated_since": since}
+        )["records"]
+
+        for existing in records:
+            if matches(existing):
+                return {"record": existing}
+
+        return None
+
+    return find_existing
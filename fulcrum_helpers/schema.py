@@ -0,0 +1,243 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+from .transport import Transport
+from .types import App, AppElement
+
+logger = logging.getLogger(__name__)
+
+# Element types that contain other elements
+SECTION_TYPES = ["Section", "Repeatable"]
+
+# How long the cached forms are trusted before their versions are checked again
+DEFAULT_MAX_AGE = 5 * 60
+
+# How many element lists keep their index, the least recently used go first
+MAX_ELEMENT_INDEXES = 64
+
+
+class FormSchema:
+    """
+    The elements of a form indexed for constant time lookups.
+
+    - elements: every element in the order they appear in the form
+    - by_data_name: data name -> element
+    - by_key: key -> element
+    - parent_repeatable: key -> the repeatable the element is in (or None)
+    """
+
+    def __init__(self, form: App):
+        self.form = form
+        self.elements = []  # type: t.List[AppElement]
+        self.by_data_name = {}  # type: t.Dict[str, AppElement]
+        self.by_key = {}  # type: t.Dict[str, AppElement]
+        self.parent_repeatable = {}  # type: t.Dict[str, AppElement | None]
+
+        self._index(form.get("elements", []), None)
+
+    def _index(self, elements: t.List[AppElement], repeatable: AppElement | None):
+        for element in elements:
+            self.elements.append(element)
+            # The first match wins, the same as a depth first search
+            self.by_data_name.setdefault(element["data_name"], element)
+            self.by_key.setdefault(element["key"], element)
+            self.parent_repeatable[element["key"]] = repeatable
+
+            if element["type"] in SECTION_TYPES:
+                self._index(
+                    element.get("elements", []),
+                    element if element["type"] == "Repeatable" else repeatable,
+                )
+
+    def key_code(self, data_name: str) -> str | None:
+        """
+        Get the key of the element with a data name
+        """
+        element = self.by_data_name.get(data_name)
+        return element["key"] if element else None
+
+    def element(self, data_name: str) -> AppElement | None:
+        return self.by_data_name.get(data_name)
+
+    def repeatable_of(self, key: str) -> AppElement | None:
+        """
+        Get the repeatable that an element is in, None if it is at the top level
+        """
+        return self.parent_repeatable.get(key)
+
+
+# Indexes of the element lists that were searched last, by id of the list.
+# The list is kept with its index so the id can't be reused by another list.
+_ELEMENT_INDEXES = (
+    OrderedDict()
+)  # type: OrderedDict[int, t.Tuple[t.List[AppElement], FormSchema]]
+_ELEMENT_INDEXES_LOCK = threading.Lock()
+
+
+def index_elements(elements: t.List[AppElement]) -> FormSchema:
+    """
+    Get the (cached) index of a list of form elements. Form schemas are
+    treated as read only, an index is not rebuilt if its list is changed.
+    """
+    with _ELEMENT_INDEXES_LOCK:
+        cached = _ELEMENT_INDEXES.get(id(elements))
+        if cached and cached[0] is elements:
+            _ELEMENT_INDEXES.move_to_end(id(elements))
+            return cached[1]
+
+    schema = FormSchema({"elements": elements})
+
+    with _ELEMENT_INDEXES_LOCK:
+        _ELEMENT_INDEXES[id(elements)] = (elements, schema)
+        while len(_ELEMENT_INDEXES) > MAX_ELEMENT_INDEXES:
+            _ELEMENT_INDEXES.popitem(last=False)
+
+    return schema
+
+
+def default_cache_path(transport: Transport) -> str:
+    """
+    The cache file of the forms an API key can see on an API, so that forms
+    aren't shared between accounts or with the fake API
+    """
+    account = f"{transport.base_url}\n{transport.api_key or ''}"
+    return f".form_cache_{hashlib.sha256(account.encode()).hexdigest()[:16]}.json"
+
+
+class SchemaRegistry:
+    """
+    Forms cached on disk so that scripts don't download every schema on start.
+
+    The cache is trusted for `max_age` seconds. After that the form versions
+    are listed (without their schemas) and only the forms that have changed
+    are downloaded again. A lookup that misses the cache (e.g. an app that
+    was just created) checks the API again straight away. There is a cache
+    file per API and key unless `cache_path` is given.
+    """
+
+    def __init__(
+        self,
+        transport: Transport,
+        cache_path: str | None = None,
+        max_age: float = DEFAULT_MAX_AGE,
+    ):
+        self.transport = transport
+        self.cache_path = cache_path or default_cache_path(transport)
+        self.max_age = max_age
+
+        self.checked_at = 0.0
+        self.forms = {}  # type: t.Dict[str, App]
+        self.schemas = {}  # type: t.Dict[str, FormSchema]
+
+        if os.path.exists(self.cache_path):
+            with open(self.cache_path, "r") as f:
+                cache = json.load(f)
+            self.checked_at = cache["checked_at"]
+            self.forms = cache["forms"]
+
+    def _get(self, path: str, params: dict | None = None) -> dict:
+        resp = self.transport.request("get", path, params=params)
+
+        if resp.status_code != 200:
+            logger.error(resp)
+            raise Exception(f"Failed to get {path} ({resp.status_code})")
+
+        return resp.json()
+
+    def save(self):
+        tmp_path = self.cache_path + ".part"
+        with open(tmp_path, "w") as f:
+            json.dump({"checked_at": self.checked_at, "forms": self.forms}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Download the forms that have changed since they were cached.
+        Returns False if the cache was trusted without checking the API.
+        """
+        if not force and time.time() - self.checked_at < self.max_age:
+            return False
+
+        versions = self._get("forms.json", {"schema": "false"})["forms"]
+
+        forms = {}
+        changed = 0
+        for summary in versions:
+            cached = self.forms.get(summary["id"])
+
+            if (
+                cached
+                and cached.get("version") == summary.get("version")
+                and cached.get("updated_at") == summary.get("updated_at")
+            ):
+                forms[summary["id"]] = cached
+                continue
+
+            changed += 1
+            if "elements" in summary:
+                # The API ignored schema=false so the form is already complete
+                forms[summary["id"]] = summary
+            else:
+                forms[summary["id"]] = self._get(f"forms/{summary['id']}.json")["form"]
+
+            self.schemas.pop(summary["id"], None)
+
+        logger.debug(f"{len(forms)} forms, {changed} changed since they were cached")
+
+        self.forms = forms
+        self.checked_at = time.time()
+        self.save()
+
+        return True
+
+    def list_apps(self) -> t.List[App]:
+        self.refresh()
+        return list(self.forms.values())
+
+    def _find_app(self, name: str) -> App | None:
+        for app in self.forms.values():
+            if app["name"] == name:
+                return app
+
+        return None
+
+    def get_app(self, name: str) -> App | None:
+        """
+        Get an app by name
+        """
+        checked = self.refresh()
+        app = self._find_app(name)
+
+        if app is None and not checked:
+            self.refresh(force=True)
+            app = self._find_app(name)
+
+        return app
+
+    def get_form(self, form_id: str) -> App | None:
+        """
+        Get an app by ID
+        """
+        checked = self.refresh()
+        form = self.forms.get(form_id)
+
+        if form is None and not checked:
+            self.refresh(force=True)
+            form = self.forms.get(form_id)
+
+        return form
+
+    def get_schema(self, app: App) -> FormSchema:
+        """
+        Get the element indexes of an app
+        """
+        if app["id"] not in self.schemas:
+            self.schemas[app["id"]] = FormSchema(app)
+
+        return self.schemas[app["id"]]
@@ -0,0 +1,79 @@
+import json
+
+import fulcrum
+from fulcrum.api import Client
+from fulcrum.exceptions import InternalServerErrorException
+
+from .transport import Transport
+
+
+class TransportClient(Client):
+    """
+    A Fulcrum SDK client that sends its requests through a Transport
+    instead of opening a new connection for each call
+    """
+
+    def __init__(self, transport: Transport, key: str, uri: str):
+        super().__init__(key, uri)
+        self.transport = transport
+
+    def call(
+        self,
+        method,
+        path,
+        data=None,
+        extra_headers=None,
+        url_params=None,
+        json_content=True,
+        files=None,
+        auth=None,
+    ):
+        full_path = self.api_root + path
+
+        headers = {
+            "User-Agent": f"Fulcrum Python API Client, Version {fulcrum.__version__}",
+        }
+
+        if self.key:
+            headers["X-ApiToken"] = self.key
+
+        if json_content:
+            headers.update({"Accept": "application/json"})
+
+        if extra_headers is not None:
+            headers.update(extra_headers)
+
+        kwargs = {"headers": headers, "timeout": self.transport.timeout}
+
+        if data is not None:
+            if files:
+                kwargs["data"] = data
+            else:
+                kwargs["data"] = json.dumps(data)
+
+        if url_params is not None:
+            kwargs["params"] = url_params
+
+        if files is not None:
+            kwargs["files"] = files
+
+        if auth is not None:
+            kwargs["auth"] = auth
+
+        resp = self.transport.send(method, full_path, **kwargs)
+
+        if resp.status_code in self.http_exception_map or resp.status_code >= 500:
+            # Keep the response on the error so callers can read Retry-After
+            error = self.http_exception_map.get(
+                resp.status_code, InternalServerErrorException
+            )()
+            error.response = resp
+            raise error
+
+        if method == "delete" or (method == "put" and "close" in path):
+            # No body is returned for delete and close methods.
+            return
+        elif json_content:
+            return resp.json()
+        else:
+            return resp.content
@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import typing as t
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from fulcrum.exceptions import NotFoundException
+
+from .helpers import iter_record_pages, rate_limited
+from .resilience import ResilientWriter
+from .transport import Transport
+from .types import Record
+
+logger = logging.getLogger(__name__)
+
+# The number of records compressed together, a lookup decompresses one chunk
+DEFAULT_CHUNK_SIZE = 256
+
+# The number of decompressed chunks kept in memory by a reader
+CHUNK_CACHE_SIZE = 8
+
+# The directory snapshots are written to by the scripts
+SNAPSHOT_DIR = "snapshots"
+
+
+class SnapshotWriter:
+    """
+    Writes records to a snapshot archive.
+
+    {path}          - chunks of JSON Lines, each one a separate gzip member so
+                      the whole file can also be read with `gzip.open`
+    {path}.idx.json - the offset and length of each chunk and the chunk
+                      that each record ID is in
+    """
+
+    def __init__(
+        self,
+        path: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        metadata: dict | None = None,
+    ):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.metadata = metadata or {}
+
+        self.chunks = []  # type: t.List[t.Tuple[int, int]]
+        self.record_chunks = {}  # type: t.Dict[str, int]
+        self.buffer = []  # type: t.List[str]
+        self.offset = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path + ".part", "wb")
+
+    def add(self, record: Record):
+        self.record_chunks[record["id"]] = len(self.chunks)
+        self.buffer.append(json.dumps(record, separators=(",", ":")))
+
+        if len(self.buffer) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        if not self.buffer:
+            return
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        data = compressor.compress(("\n".join(self.buffer) + "\n").encode())
+        data += compressor.flush()
+
+        self.file.write(data)
+        self.chunks.append((self.offset, len(data)))
+        self.offset += len(data)
+        self.buffer = []
+
+    def close(self):
+        self._flush()
+        self.file.close()
+        os.replace(self.path + ".part", self.path)
+
+        with open(self.path + ".idx.json", "w") as f:
+            json.dump(
+                {
+                    **self.metadata,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "count": len(self.record_chunks),
+                    "chunks": self.chunks,
+                    "records": self.record_chunks,
+                },
+                f,
+            )
+
+        logger.info(
+            f"Snapshot of {len(self.record_chunks)} records written to {self.path} ({self.offset / 1024 / 1024:.1f} MB)"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Snapshot:
+    """
+    Reads a snapshot archive, records can be iterated over or looked up by ID
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(path + ".idx.json", "r") as f:
+            self.index = json.load(f)
+
+        self.chunks = self.index["chunks"]
+        self.record_chunks = self.index["records"]
+        self._cache = OrderedDict()  # type: OrderedDict[int, t.Dict[str, Record]]
+
+    def __len__(self) -> int:
+        return len(self.record_chunks)
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self.record_chunks
+
+    def ids(self) -> t.List[str]:
+        return list(self.record_chunks)
+
+    def _read_chunk(self, chunk: int) -> t.Dict[str, Record]:
+        if chunk in self._cache:
+            self._cache.move_to_end(chunk)
+            return self._cache[chunk]
+
+        offset, length = self.chunks[chunk]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = zlib.decompress(f.read(length), 16 + zlib.MAX_WBITS)
+
+        records = {}
+        for line in data.decode().splitlines():
+            record = json.loads(line)
+            records[record["id"]] = record
+
+        self._cache[chunk] = records
+        if len(self._cache) > CHUNK_CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+        return records
+
+    def get(self, record_id: str) -> Record | None:
+        """
+        Get a record by ID, only the chunk it is in is read
+        """
+        chunk = self.record_chunks.get(record_id)
+        if chunk is None:
+            return None
+
+        return self._read_chunk(chunk)[record_id]
+
+    def __iter__(self) -> t.Iterator[Record]:
+        for chunk in range(len(self.chunks)):
+            yield from self._read_chunk(chunk).values()
+
+
+def snapshot_path(name: str) -> str:
+    """
+    Get a timestamped path in the snapshot directory
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(SNAPSHOT_DIR, f"{name}_{timestamp}.jsonl.gz")
+
+
+def write_snapshot(records: t.Iterable[Record], path: str, **metadata) -> str:
+    """
+    Snapshot records that have already been fetched
+    """
+    with SnapshotWriter(path, metadata=metadata) as writer:
+        for record in records:
+            writer.add(record)
+
+    return path
+
+
+def snapshot_app(transport: Transport, form_id: str, path: str) -> str:
+    """
+    Stream every record of an app into a snapshot
+    """
+    with SnapshotWriter(path, metadata={"form_id": form_id}) as writer:
+        for page in iter_record_pages(transport, form_id):
+            for record in page:
+                writer.add(record)
+
+    return path
+
+
+class SnapshotRestorer:
+    """
+    Writes records from a snapshot back to Fulcrum. Records that still exist
+    are updated with the snapshot version, records that have been deleted are
+    created again.
+    """
+
+    def __init__(self, fulcrum, snapshot: Snapshot, writer: ResilientWriter | None = None):
+        self.fulcrum = fulcrum
+        self.snapshot = snapshot
+        self.writer = writer or ResilientWriter(
+            dead_letter_path=snapshot.path + ".restore_dead_letter.jsonl"
+        )
+
+    # Rate limited for 4000 calls per hour (actual limit is 5000/h but we want to be safe)
+    @rate_limited(4000 / 3600)
+    def _restore(self, record: Record):
+        try:
+            return self.fulcrum.records.update(record["id"], {"record": record})
+        except NotFoundException:
+            logger.warning(f"Record no longer exists, creating it: {record['id']}")
+            return self.fulcrum.records.create({"record": record})
+
+    def restore(self, record_id: str) -> bool:
+        record = self.snapshot.get(record_id)
+        if record is None:
+            logger.error(f"Record is not in the snapshot: {record_id}")
+            return False
+
+        result = self.writer.call(
+            "restore_record", self._restore, record, key=record_id, payload=record
+        )
+        return result is not None
@@ -0,0 +1,1168 @@
+import csv
+import functools
+import hashlib
+import json
+import logging
+import os
+import random
+import typing as t
+import uuid
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+# The columns of each kind of export file, before the field columns
+RECORD_COLUMNS = [
+    "fulcrum_id",
+    "created_at",
+    "updated_at",
+    "created_by",
+    "updated_by",
+    "system_created_at",
+    "system_updated_at",
+    "version",
+    "status",
+    "project",
+    "assigned_to",
+    "latitude",
+    "longitude",
+    "geometry",
+]
+CHILD_COLUMNS = [
+    "fulcrum_id",
+    "fulcrum_parent_id",
+    "fulcrum_record_id",
+    "version",
+    "created_at",
+    "updated_at",
+    "created_by",
+    "updated_by",
+    "latitude",
+    "longitude",
+    "geometry",
+]
+PHOTO_COLUMNS = [
+    "fulcrum_id",
+    "fulcrum_parent_id",
+    "fulcrum_record_id",
+    "caption",
+    "latitude",
+    "longitude",
+    "geometry",
+    "file",
+]
+
+ADDRESS_PARTS = [
+    "sub_thoroughfare",
+    "thoroughfare",
+    "suite",
+    "locality",
+    "sub_admin_area",
+    "admin_area",
+    "postal_code",
+    "country",
+    "full",
+]
+
+# File layouts: as exported by Fulcrum ({prefix}.csv, {prefix}_{repeatable}.csv)
+# or as read by import_api.py (base.csv, {repeatable}.csv)
+LAYOUT_EXPORT = "export"
+LAYOUT_IMPORT = "import"
+
+STATUSES = ["Active", "Completed", "On hold"]
+
+# The fraction of fields left empty, and of client names and references
+EMPTY_RATE = 0.15
+KEY_EMPTY_RATE = 0.02
+
+# Placeholder photo files start like a JPEG, the rest is random
+JPEG_HEADER = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00"
+DEFAULT_PHOTO_SIZE = 64 * 1024
+
+FIRST_NAMES = [
+    "James",
+    "Mary",
+    "John",
+    "Patricia",
+    "Robert",
+    "Jennifer",
+    "Michael",
+    "Linda",
+    "David",
+    "Susan",
+    "Ahmed",
+    "Priya",
+    "Wei",
+    "Siobhan",
+    "Gareth",
+    "Fiona",
+]
+LAST_NAMES = [
+    "Smith",
+    "Jones",
+    "Taylor",
+    "Brown",
+    "Williams",
+    "Wilson",
+    "Johnson",
+    "Davies",
+    "Patel",
+    "Evans",
+    "Thomas",
+    "Roberts",
+    "Khan",
+    "Lewis",
+    "Walker",
+    "Cooper",
+]
+COMPANY_WORDS = [
+    "Inland",
+    "Riverside",
+    "Northern",
+    "Oak",
+    "Meadow",
+    "Harbour",
+    "Crown",
+    "Valley",
+    "Summit",
+    "Heritage",
+    "Greenway",
+    "Castle",
+    "Park",
+    "Bridge",
+]
+COMPANY_TYPES = [
+    "Homes",
+    "Housing Association",
+    "Developments",
+    "Estates",
+    "Property Management",
+    "Council",
+    "Trust",
+    "Construction",
+]
+COMPANY_SUFFIXES = ["Ltd", "Limited", "PLC", "LLP", ""]
+STREETS = [
+    "High",
+    "Station",
+    "Church",
+    "Mill",
+    "Victoria",
+    "Park",
+    "Green",
+    "Manor",
+    "King",
+    "Queen",
+    "York",
+    "Albert",
+    "Chapel",
+    "School",
+]
+STREET_TYPES = ["Street", "Road", "Lane", "Avenue", "Close", "Way", "Drive", "Crescent"]
+TOWNS = [
+    ("Leeds", "West Yorkshire"),
+    ("Bristol", "Bristol"),
+    ("Cardiff", "South Glamorgan"),
+    ("Swansea", "West Glamorgan"),
+    ("Manchester", "Greater Manchester"),
+    ("Bath", "Somerset"),
+    ("York", "North Yorkshire"),
+    ("Exeter", "Devon"),
+    ("Norwich", "Norfolk"),
+    ("Reading", "Berkshire"),
+    ("Chester", "Cheshire"),
+    ("Durham", "County Durham"),
+]
+WORDS = "knotweed stand rhizome growth treatment herbicide boundary fence garden rear front path wall excavation monitoring regrowth crown canes dense sparse near adjacent property observed applied stem injection spray barrier root".split()
+
+PROPERTY_TYPES = [
+    "Private Residential",
+    "Housing Association",
+    "Commercial",
+    "Retail outlet",
+    "Hotel",
+    "Development site",
+    "Construction site",
+    "Council",
+    "Education",
+    "Health & Social Care",
+    "Industrial",
+]
+ACCOUNT_STATUSES = [
+    "Guarantee  Period",
+    "Ongoing",
+    "Pending",
+    "On hold",
+    "Ongoing (Scheduled Monitoring)",
+]
+SURVEYORS = [
+    'J. Smith "BSc"',
+    'A. Patel "PCA"',
+    "M. Jones",
+    'S. Evans "BASIS"',
+    "R. Cooper",
+]
+STAND_LOCATIONS = [
+    "Within client property only",
+    "Within client property and one other property",
+    "Within client property and more than one other property",
+    "Within an adjacent property only",
+    "Within more than one adjacent property",
+]
+IMPACTED_AREAS = [
+    "front garden",
+    "rear garden",
+    "side of property",
+    "front of property",
+    "driveway",
+    "boundary",
+]
+PACKAGE_TYPES = [
+    "kmp",
+    "payg",
+    "jk_identification_survey_&_report",
+    "jk_survey_&_findings_report",
+    "jk_mcp",
+    "jk_payg",
+]
+WATER_DISTANCES = ["<= 2 metres", "2 - 5 metres", "> 5 metres"]
+SERVICE_TYPES = [
+    "Herbicide treatment (spray)",
+    "Herbicide treatment (stem injection)",
+    "Monitoring visit",
+    "Cut / Clearance",
+    "Excavation",
+    "Barrier",
+]
+TECHNICIANS = ["L. Walker PA1/PA6", "D. Lewis PA1", "K. Khan PA6"]
+YES_NO = ["Yes", "No"]
+
+
+class Field:
+    """
+    A field of a synthetic form, with the values to generate for it.
+
+    `values` is a list of choices or the name of a generator
+    ("text", "date", "time", "integer", "decimal", "client_name", "reference").
+    `visible_when` is a (data name, operator, value) condition for the field
+    to be shown. Values are generated whether or not it is met, so some
+    records have hidden data like real ones.
+    """
+
+    def __init__(
+        self,
+        type: str,
+        data_name: str,
+        values: t.List[str] | str = "text",
+        multiple: bool = False,
+        allow_other: bool = False,
+        elements: t.List["Field"] | None = None,
+        label: str | None = None,
+        visible_when: t.Tuple[str, str, str] | None = None,
+    ):
+        self.type = type
+        self.data_name = data_name
+        self.values = values
+        self.multiple = multiple
+        self.allow_other = allow_other
+        self.elements = elements or []
+        self.label = label or data_name.replace("_", " ").capitalize()
+        self.visible_when = visible_when
+        self.key = ""
+
+    def columns(self) -> t.List[str]:
+        """
+        The columns of the field in the file of the record or repeatable it
+        is in
+        """
+        if self.type in ("Section", "Repeatable"):
+            return []
+        if self.type in ("ChoiceField", "ClassificationField"):
+            return [self.data_name] + (
+                [f"{self.data_name}_other"] if self.allow_other else []
+            )
+        if self.type == "AddressField":
+            return [f"{self.data_name}_{part}" for part in ADDRESS_PARTS]
+        if self.type == "PhotoField":
+            return [
+                self.data_name,
+                f"{self.data_name}_caption",
+                f"{self.data_name}_url",
+            ]
+
+        return [self.data_name]
+
+    def element(self, link_form_ids: t.Dict[str, str], keys: t.Dict[str, str]) -> dict:
+        element = {
+            "type": self.type,
+            "key": self.key,
+            "label": self.label,
+            "data_name": self.data_name,
+            "required": False,
+            "hidden": False,
+            "disabled": False,
+            "visible_conditions": None,
+            "visible_conditions_type": None,
+        }
+
+        if self.visible_when:
+            data_name, operator, value = self.visible_when
+            element["visible_conditions"] = [
+                {"field_key": keys[data_name], "operator": operator, "value": value}
+            ]
+            element["visible_conditions_type"] = "all"
+
+        if self.type in ("ChoiceField", "ClassificationField"):
+            element["choices"] = [
+                {"label": value, "value": value} for value in self.values
+            ]
+            element["multiple"] = self.multiple
+            element["allow_other"] = self.allow_other
+        elif self.type == "TextField" and self.values in ("integer", "decimal"):
+            element["numeric"] = True
+            element["format"] = self.values
+        elif self.type == "RecordLinkField":
+            element["form_id"] = link_form_ids.get(self.data_name)
+        elif self.type in ("Section", "Repeatable"):
+            element["elements"] = [
+                child.element(link_form_ids, keys) for child in self.elements
+            ]
+
+        return element
+
+
+def _text(data_name: str, values: t.List[str] | str = "text") -> Field:
+    return Field("TextField", data_name, values)
+
+
+def _choice(
+    data_name: str,
+    values: t.List[str],
+    multiple: bool = False,
+    allow_other: bool = True,
+) -> Field:
+    return Field("ChoiceField", data_name, values, multiple, allow_other)
+
+
+def _photo(data_name: str) -> Field:
+    return Field("PhotoField", data_name)
+
+
+def _repeatable(data_name: str, elements: t.List[Field]) -> Field:
+    return Field("Repeatable", data_name, elements=elements)
+
+
+def _common_fields(client_name: str, reference: str | None) -> t.List[Field]:
+    return [
+        _text(client_name, "client_name"),
+        *([_text(reference, "reference")] if reference else []),
+        Field("AddressField", "site_address"),
+        _choice("property_type", PROPERTY_TYPES, multiple=True),
+        _choice("account_status", ACCOUNT_STATUSES, allow_other=False),
+        _choice("surveyors_and_qualifications", SURVEYORS, multiple=True),
+        _choice(
+            "document_status", ["Draft", "Issued", "Superseded"], allow_other=False
+        ),
+        Field("DateField", "survey_date", "date"),
+        Field(
+            "TextField",
+            "site_access_notes",
+            visible_when=("account_status", "not_equal_to", "Pending"),
+        ),
+        _photo("site_photos_property"),
+    ]
+
+
+def _stand_fields() -> t.List[Field]:
+    return [
+        _text("stand_number", "integer"),
+        _choice("stand_location", STAND_LOCATIONS, allow_other=False),
+        _choice("stand_location_visibly_impacted_areas", IMPACTED_AREAS, multiple=True),
+        _choice(
+            "visibly_impacted_areas_subject_property", IMPACTED_AREAS, multiple=True
+        ),
+        _text("distance_from_nearest_dwelling_m", "decimal"),
+        _text("distance_from_subject_property_dwelling_m", "decimal"),
+        Field(
+            "TextField",
+            "stand_area_m2",
+            "decimal",
+            visible_when=("growth_characteristics", "is_not_empty", ""),
+        ),
+        _choice("growth_characteristics", ["Dense", "Sparse", "Regrowth", "Dormant"]),
+        _photo("stand_photos"),
+    ]
+
+
+def _capture_points() -> Field:
+    return _repeatable(
+        "hide_stand_shape_and_area_capture_point_data",
+        [_text("point_label"), _text("point_accuracy_m", "decimal")],
+    )
+
+
+def _visit_fields() -> t.List[Field]:
+    return [
+        Field("DateField", "date", "date"),
+        Field("TimeField", "time", "time"),
+        _choice("technician_details_qualifications", TECHNICIANS, multiple=True),
+        _choice(
+            "does_site_to_be_treated_meet_generic_rams_criteria",
+            YES_NO,
+            allow_other=False,
+        ),
+        Field(
+            "TextField",
+            "visit_notes",
+            visible_when=(
+                "does_site_to_be_treated_meet_generic_rams_criteria",
+                "equal_to",
+                "Yes",
+            ),
+        ),
+        _photo("visit_photos"),
+    ]
+
+
+class Dataset(t.NamedTuple):
+    name: str
+    # The file name prefix of the export
+    prefix: str
+    form_name: str
+    client_name_column: str
+    reference_column: str | None
+    fields: t.List[Field]
+
+
+DATASETS = {
+    "JKMR": Dataset(
+        "JKMR",
+        "japanese_knotweed_management_record",
+        "JAPANESE KNOTWEED MANAGEMENT RECORD",
+        "client_names",
+        "pba_reference",
+        [
+            *_common_fields("client_names", "pba_reference"),
+            _choice("jk_package_type", PACKAGE_TYPES, allow_other=False),
+            _photo("site_plans"),
+            _photo("site_photo_property"),
+            _repeatable(
+                "knotweed_survey",
+                [
+                    Field("DateField", "knotweed_survey_date", "date"),
+                    _text("survey_findings_summary"),
+                    _repeatable("knotweed_stand_details", _stand_fields()),
+                ],
+            ),
+            _repeatable(
+                "herbicide_application_monitoring_records",
+                [
+                    *_visit_fields(),
+                    _choice(
+                        "visit_type",
+                        [
+                            "Herbicide Application",
+                            "Monitoring",
+                            "Site Monitoring Observations & Recommendations",
+                        ],
+                    ),
+                ],
+            ),
+            _repeatable(
+                "other_treatments_inc_excavation",
+                [
+                    *_visit_fields(),
+                    _choice(
+                        "visit_type", ["Excavation", "Cut", "Barrier installation"]
+                    ),
+                ],
+            ),
+            _repeatable(
+                "site_monitoring_observations_and_recommendations",
+                [
+                    *_visit_fields(),
+                    _choice(
+                        "visit_type", ["Site Monitoring Observations & Recommendations"]
+                    ),
+                ],
+            ),
+        ],
+    ),
+    "IPMR": Dataset(
+        "IPMR",
+        "invasive_plants_management_records",
+        "INVASIVE PLANTS MANAGEMENT RECORDS",
+        "client_names",
+        "pba_reference",
+        [
+            *_common_fields("client_names", "pba_reference"),
+            _choice("treatment_year_1", SERVICE_TYPES, multiple=True),
+            _choice("treatment_schedule_year_2", SERVICE_TYPES, multiple=True),
+            _choice("treatment_schedule_year_3", SERVICE_TYPES, multiple=True),
+            _repeatable(
+                "stand_details",
+                [
+                    *_stand_fields(),
+                    _choice(
+                        "target_species",
+                        [
+                            "Giant hogweed",
+                            "Himalayan balsam",
+                            "Japanese knotweed",
+                            "Bamboo",
+                        ],
+                    ),
+                    _choice(
+                        "distance_from_stand_to_water_body",
+                        WATER_DISTANCES,
+                        allow_other=False,
+                    ),
+                    _choice(
+                        "close_to_water_within_2_metres", YES_NO, allow_other=False
+                    ),
+                ],
+            ),
+            _repeatable(
+                "service_visit_records",
+                [
+                    *_visit_fields(),
+                    _choice("service_type", SERVICE_TYPES, multiple=True),
+                    _choice(
+                        "weather_conditions", ["Dry", "Light rain", "Overcast", "Windy"]
+                    ),
+                    _choice("adjuvant_name", ["Validate", "Companion Gold", "None"]),
+                    _text("quantity_of_product_per_litre_ml", "decimal"),
+                    _text("works_notes"),
+                    _photo("treatment_photos"),
+                    _photo("monitoring_photos"),
+                ],
+            ),
+        ],
+    ),
+    "KSMP": Dataset(
+        "KSMP",
+        "knotweed_survey_and_management_plan",
+        "KNOTWEED SURVEY AND MANAGEMENT PLAN",
+        "client_name",
+        "account_reference",
+        [
+            *_common_fields("client_name", "account_reference"),
+            _choice("open_space_area_approx", ["< 100m2", "100 - 500m2", "> 500m2"]),
+            _choice(
+                "primary_control_method",
+                ["Herbicide", "Excavation", "Barrier", "Combination"],
+            ),
+            _choice("treatment_programme_start_period", ["Spring", "Summer", "Autumn"]),
+            _choice("evidence_of_previous_treatment", YES_NO),
+            _choice("herbicide_treatment_year_1", SERVICE_TYPES, multiple=True),
+            _choice(
+                "herbicide_treatment_schedule_year_2", SERVICE_TYPES, multiple=True
+            ),
+            _choice(
+                "monitoring_schedule_year_3",
+                ["Spring", "Summer", "Autumn"],
+                multiple=True,
+            ),
+            _repeatable("knotweed_stand_details", _stand_fields()),
+        ],
+    ),
+    "S": Dataset(
+        "S",
+        "survey_legacy",
+        "SURVEY (LEGACY)",
+        "client_name",
+        None,
+        [
+            *_common_fields("client_name", None),
+            Field("RecordLinkField", "site_location"),
+            _repeatable(
+                "knotweed_stand_details", [*_stand_fields(), _capture_points()]
+            ),
+        ],
+    ),
+    # The app the legacy datasets are imported into, the base of find_differences.py
+    "SURVEY": Dataset(
+        "SURVEY",
+        "survey",
+        "SURVEY",
+        "client_name",
+        "job_id",
+        [
+            *_common_fields("client_name", "job_id"),
+            Field("RecordLinkField", "site_location"),
+            _choice("record_type", ["Management Plan", "Survey"], allow_other=False),
+            _choice("client_type", ["Residential", "Commercial"], allow_other=False),
+            _choice("plant_type", ["Japanese Knotweed", "Other"], allow_other=False),
+            _choice("job_type", ["Treatment", "Survey"], allow_other=False),
+            _choice(
+                "jk_package_type",
+                [
+                    "Contracted (Knotweed Management Plan)",
+                    "Non-contract (Pay As You Go)",
+                ],
+                allow_other=False,
+            ),
+            _photo("break_before_site_plans"),
+            _repeatable(
+                "stand_details",
+                [
+                    *_stand_fields(),
+                    _choice(
+                        "close_to_water_within_2_metres", YES_NO, allow_other=False
+                    ),
+                    _capture_points(),
+                ],
+            ),
+        ],
+    ),
+}
+
+
+def _walk(fields: t.List[Field]) -> t.Iterator[Field]:
+    for field in fields:
+        yield field
+        if field.type in ("Section", "Repeatable"):
+            yield from _walk(field.elements)
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+# The children of a record are all written with its times
+@functools.lru_cache(maxsize=16)
+def _export_time(value: datetime) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S UTC")
+
+
+class ExportGenerator:
+    """
+    Generates a Fulcrum CSV export and the form it was exported from, the
+    same for the same seed.
+
+    Records are spread over a pool of sites, each with a client and an
+    account reference, so several records share an address, client or
+    reference. A fraction `duplicate_rate` of client names are written as
+    near duplicates ("Inland Homes" / "Inland's Homes" / "inland homes ")
+    and of references are shared with another client, as in real exports.
+    """
+
+    def __init__(
+        self,
+        dataset: str,
+        records: int,
+        seed: int = 0,
+        max_children: int = 3,
+        photo_rate: float = 0.5,
+        max_photos: int = 3,
+        duplicate_rate: float = 0.05,
+        extra_fields: int = 0,
+    ):
+        if dataset not in DATASETS:
+            raise Exception(
+                f"Unknown dataset: {dataset} (one of {', '.join(DATASETS)})"
+            )
+
+        self.dataset = DATASETS[dataset]
+        self.records = records
+        self.seed = seed
+        self.max_children = max_children
+        self.photo_rate = photo_rate
+        self.max_photos = max_photos
+        self.duplicate_rate = duplicate_rate
+
+        self.rng = random.Random(f"{dataset}:{seed}")
+        self.form_id = _uuid(self.rng)
+        self.site_form_id = _uuid(self.rng)
+
+        self.fields = list(self.dataset.fields)
+        # Wide apps have many more fields than the ones the scripts know about
+        self.fields.extend(
+            _text(f"additional_observations_{i + 1}") for i in range(extra_fields)
+        )
+        self._assign_keys()
+
+        self.projects = [
+            {"id": _uuid(self.rng), "name": f"{town} Region"} for town, _ in TOWNS[:6]
+        ]
+        self.members = []
+        for first_name, last_name in zip(FIRST_NAMES[:8], LAST_NAMES[:8]):
+            email = f"{first_name.lower()}.{last_name.lower()}@example.com"
+            self.members.append(
+                {
+                    "user_id": _uuid(self.rng),
+                    "first_name": first_name,
+                    "last_name": last_name,
+                    "email": email,
+                    "role_name": "Standard User",
+                }
+            )
+
+        self.sites = []  # type: t.List[dict]
+        self.photo_count = 0
+
+    def _assign_keys(self):
+        """
+        Give each field a 4 character key derived from its data name, like
+        the keys of real forms
+        """
+        keys = set()
+        for field in _walk(self.fields):
+            salt = 0
+            while True:
+                digest = hashlib.sha1(
+                    f"{self.dataset.name}:{field.data_name}:{salt}".encode()
+                ).hexdigest()[:4]
+                if digest not in keys:
+                    break
+                salt += 1
+
+            keys.add(digest)
+            field.key = digest
+
+    def form(self) -> dict:
+        keys = {field.data_name: field.key for field in _walk(self.fields)}
+
+        return {
+            "id": self.form_id,
+            "name": self.dataset.form_name,
+            "version": 1,
+            "status_field": {
+                "type": "StatusField",
+                "data_name": "status",
+                "enabled": True,
+                "default_value": STATUSES[0],
+                "choices": [{"label": status, "value": status} for status in STATUSES],
+            },
+            "elements": [
+                field.element({"site_location": self.site_form_id}, keys)
+                for field in self.fields
+            ],
+        }
+
+    def _client_name(self) -> str:
+        rng = self.rng
+        if rng.random() < 0.4:
+            return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+        return " ".join(
+            part
+            for part in [
+                rng.choice(COMPANY_WORDS),
+                rng.choice(COMPANY_TYPES),
+                rng.choice(COMPANY_SUFFIXES),
+            ]
+            if part
+        )
+
+    def _near_duplicate(self, name: str) -> str:
+        rng = self.rng
+        variant = rng.randrange(5)
+        words = name.split(" ")
+        if variant == 0:
+            return name.lower()
+        if variant == 1:
+            return name + " "
+        if variant == 2 and len(words) > 1:
+            words[0] = words[0] + "'s"
+            return " ".join(words)
+        if variant == 3:
+            return name[:-1] if name.endswith("s") else name + "s"
+
+        return name.replace("Limited", "Ltd") if "Limited" in name else name + " Ltd"
+
+    def _address(self) -> t.Dict[str, str]:
+        rng = self.rng
+        town, county = rng.choice(TOWNS)
+        address = {
+            "sub_thoroughfare": str(rng.randint(1, 250)),
+            "thoroughfare": f"{rng.choice(STREETS)} {rng.choice(STREET_TYPES)}",
+            "suite": rng.choice(["", "", "", f"Flat {rng.randint(1, 20)}"]),
+            "locality": town,
+            "sub_admin_area": county,
+            "admin_area": "Wales" if county.endswith("Glamorgan") else "England",
+            "postal_code": f"{town[:2].upper()}{rng.randint(1, 29)} {rng.randint(1, 9)}{rng.choice('ABDEFGHJLNPQRSTUWXYZ')}{rng.choice('ABDEFGHJLNPQRSTUWXYZ')}",
+            "country": "GB",
+        }
+        address["full"] = ", ".join(
+            part
+            for part in [
+                address["suite"],
+                f"{address['sub_thoroughfare']} {address['thoroughfare']}",
+                address["locality"],
+                address["postal_code"],
+            ]
+            if part
+        )
+        return address
+
+    def _build_sites(self):
+        """
+        The sites that records are spread over, with their client and
+        reference
+        """
+        rng = self.rng
+        clients = [self._client_name() for _ in range(max(1, int(self.records * 0.6)))]
+
+        self.sites = []
+        for i in range(max(1, int(self.records * 0.8))):
+            client = rng.choice(clients)
+            reference = f"Q{rng.randint(10000, 999999)}"
+            if self.sites and rng.random() < self.duplicate_rate:
+                # The same reference used for a different client
+                reference = rng.choice(self.sites)["reference"]
+
+            self.sites.append(
+                {
+                    "id": _uuid(rng),
+                    "client": client,
+                    "reference": reference,
+                    "address": self._address(),
+                    "latitude": round(rng.uniform(50.5, 54.5), 6),
+                    "longitude": round(rng.uniform(-4.5, 0.5), 6),
+                }
+            )
+
+    def _sentence(self, words: int = 8) -> str:
+        return " ".join(
+            self.rng.choices(WORDS, k=self.rng.randint(3, words))
+        ).capitalize()
+
+    def _value(self, field: Field, site: dict, created: datetime) -> str:
+        rng = self.rng
+        values = field.values
+
+        if isinstance(values, list):
+            count = rng.randint(1, min(3, len(values))) if field.multiple else 1
+            return ",".join(rng.sample(values, count))
+        if values == "client_name":
+            name = site["client"]
+            if rng.random() < self.duplicate_rate:
+                name = self._near_duplicate(name)
+            return name
+        if values == "reference":
+            return site["reference"]
+        if values == "date":
+            return (created - timedelta(days=rng.randint(0, 60))).strftime("%Y-%m-%d")
+        if values == "time":
+            return f"{rng.randint(7, 17):02d}:{rng.choice(['00', '15', '30', '45'])}"
+        if values == "integer":
+            return str(rng.randint(1, 12))
+        if values == "decimal":
+            return f"{rng.uniform(0.5, 50):.1f}"
+
+        return self._sentence()
+
+    def _field_values(
+        self, fields: t.List[Field], site: dict, created: datetime
+    ) -> t.Tuple[t.Dict[str, str], t.List[t.Tuple[Field, t.List[str], t.List[str]]]]:
+        """
+        The column values of the fields in a record or repeatable entry and
+        the photo IDs and captions of each photo field
+        """
+        rng = self.rng
+        row = {}
+        photos = []
+
+        for field in fields:
+            if field.type in ("Section", "Repeatable"):
+                continue
+
+            if field.type == "AddressField":
+                for part in ADDRESS_PARTS:
+                    row[f"{field.data_name}_{part}"] = site["address"][part]
+                continue
+
+            if field.type == "RecordLinkField":
+                row[field.data_name] = site["id"]
+                continue
+
+            if field.type == "PhotoField":
+                photo_ids = []
+                if rng.random() < self.photo_rate:
+                    photo_ids = [
+                        _uuid(rng) for _ in range(rng.randint(1, self.max_photos))
+                    ]
+                captions = [
+                    self._sentence(4) if rng.random() < 0.5 else "" for _ in photo_ids
+                ]
+
+                row[field.data_name] = ",".join(photo_ids)
+                row[f"{field.data_name}_caption"] = ",".join(captions)
+                row[f"{field.data_name}_url"] = (
+                    f"https://web.fulcrumapp.com/photos/view?photos={photo_ids[0]}"
+                    if photo_ids
+                    else ""
+                )
+                photos.append((field, photo_ids, captions))
+                continue
+
+            empty_rate = (
+                KEY_EMPTY_RATE
+                if field.values in ("client_name", "reference")
+                else EMPTY_RATE
+            )
+            if rng.random() < empty_rate:
+                continue
+
+            value = self._value(field, site, created)
+            if field.allow_other and rng.random() < 0.1:
+                row[f"{field.data_name}_other"] = self._sentence(3)
+                if rng.random() < 0.5:
+                    value = ""
+            row[field.data_name] = value
+
+        return row, photos
+
+
+class ExportWriter:
+    """
+    Writes the files of an export, opening each one on its first row so the
+    rows never have to be kept in memory
+    """
+
+    def __init__(
+        self,
+        generator: ExportGenerator,
+        directory: str,
+        layout: str = LAYOUT_EXPORT,
+        photo_files: bool = False,
+        photo_size: int = DEFAULT_PHOTO_SIZE,
+    ):
+        self.generator = generator
+        self.directory = directory
+        self.layout = layout
+        self.photo_files = photo_files
+        self.photo_size = photo_size
+        # Kept apart so the export is the same with or without photo files
+        self.photo_rng = random.Random(generator.seed)
+
+        self.files = {}  # type: t.Dict[str, t.Any]
+        # File name -> (CSV writer, columns)
+        self.writers = {}  # type: t.Dict[str, t.Tuple[t.Any, t.List[str]]]
+        self.row_counts = {}  # type: t.Dict[str, int]
+
+        os.makedirs(directory, exist_ok=True)
+
+    def file_name(self, path: t.List[str]) -> str | None:
+        """
+        The file of the record (empty path), a repeatable or a photo field
+        (the data names leading to it). Photos aren't read in the import
+        layout so they have no file.
+        """
+        prefix = self.generator.dataset.prefix
+        if self.layout == LAYOUT_IMPORT:
+            return f"{path[-1]}.csv" if path else "base.csv"
+
+        return f"{prefix}{''.join('_' + name for name in path)}.csv"
+
+    def _columns(self, fields: t.List[Field], system: t.List[str]) -> t.List[str]:
+        columns = list(system)
+        for field in fields:
+            columns.extend(field.columns())
+        return columns
+
+    def write_row(self, path: t.List[str], columns: t.List[str], row: dict):
+        name = self.file_name(path)
+        if name not in self.writers:
+            f = open(
+                os.path.join(self.directory, name), "w", newline="", encoding="utf-8"
+            )
+            self.files[name] = f
+            self.writers[name] = (csv.writer(f), columns)
+            self.writers[name][0].writerow(columns)
+            self.row_counts[name] = 0
+
+        writer, columns = self.writers[name]
+        writer.writerow([row.get(column, "") for column in columns])
+        self.row_counts[name] += 1
+
+    def write_photos(
+        self,
+        path: t.List[str],
+        photos: t.List[t.Tuple[Field, t.List[str], t.List[str]]],
+        parent_id: str,
+        record_id: str,
+        site: dict,
+    ):
+        for field, photo_ids, captions in photos:
+            for photo_id, caption in zip(photo_ids, captions):
+                self.generator.photo_count += 1
+
+                if self.layout == LAYOUT_EXPORT:
+                    self.write_row(
+                        [*path, field.data_name],
+                        PHOTO_COLUMNS,
+                        {
+                            "fulcrum_id": photo_id,
+                            "fulcrum_parent_id": parent_id,
+                            "fulcrum_record_id": record_id,
+                            "caption": caption,
+                            "latitude": site["latitude"],
+                            "longitude": site["longitude"],
+                            "geometry": f"POINT ({site['longitude']} {site['latitude']})",
+                            "file": f"{photo_id}.jpg",
+                        },
+                    )
+
+                if self.photo_files:
+                    with open(
+                        os.path.join(self.directory, f"{photo_id}.jpg"), "wb"
+                    ) as f:
+                        f.write(JPEG_HEADER)
+                        f.write(
+                            self.photo_rng.randbytes(
+                                max(0, self.photo_size - len(JPEG_HEADER))
+                            )
+                        )
+
+    def write_children(
+        self,
+        fields: t.List[Field],
+        path: t.List[str],
+        parent_id: str,
+        record_id: str,
+        site: dict,
+        created: datetime,
+    ):
+        generator = self.generator
+        rng = generator.rng
+
+        for field in fields:
+            if field.type != "Repeatable":
+                continue
+
+            child_path = [*path, field.data_name]
+            columns = self._columns(field.elements, CHILD_COLUMNS)
+            for _ in range(rng.randint(0, generator.max_children)):
+                child_id = _uuid(rng)
+                values, photos = generator._field_values(field.elements, site, created)
+                latitude = round(site["latitude"] + rng.uniform(-0.0005, 0.0005), 6)
+                longitude = round(site["longitude"] + rng.uniform(-0.0005, 0.0005), 6)
+
+                self.write_row(
+                    child_path,
+                    columns,
+                    {
+                        "fulcrum_id": child_id,
+                        "fulcrum_parent_id": parent_id,
+                        "fulcrum_record_id": record_id,
+                        "version": 1,
+                        "created_at": _export_time(created),
+                        "updated_at": _export_time(created),
+                        "created_by": "",
+                        "updated_by": "",
+                        "latitude": latitude,
+                        "longitude": longitude,
+                        "geometry": f"POINT ({longitude} {latitude})",
+                        **values,
+                    },
+                )
+                self.write_photos(child_path, photos, child_id, record_id, site)
+                self.write_children(
+                    field.elements, child_path, child_id, record_id, site, created
+                )
+
+    def write(self) -> t.Dict[str, int]:
+        """
+        Write the records, returning the number of rows in each file
+        """
+        generator = self.generator
+        rng = generator.rng
+        generator._build_sites()
+
+        columns = self._columns(generator.fields, RECORD_COLUMNS)
+        start = datetime(2016, 1, 1, tzinfo=timezone.utc)
+
+        try:
+            for _ in range(generator.records):
+                site = rng.choice(generator.sites)
+                record_id = _uuid(rng)
+                created = start + timedelta(seconds=rng.randint(0, 8 * 365 * 24 * 3600))
+                updated = created + timedelta(days=rng.randint(0, 400))
+                member = rng.choice(generator.members)
+                status = rng.choice(STATUSES + [""])
+
+                values, photos = generator._field_values(
+                    generator.fields, site, created
+                )
+                self.write_row(
+                    [],
+                    columns,
+                    {
+                        "fulcrum_id": record_id,
+                        "created_at": _export_time(created),
+                        "updated_at": _export_time(updated),
+                        "created_by": f"{member['first_name']} {member['last_name']}",
+                        "updated_by": f"{member['first_name']} {member['last_name']}",
+                        "system_created_at": _export_time(created),
+                        "system_updated_at": _export_time(updated),
+                        "version": rng.randint(1, 12),
+                        "status": status,
+                        "project": (
+                            rng.choice(generator.projects)["name"]
+                            if rng.random() < 0.7
+                            else ""
+                        ),
+                        "assigned_to": member["email"] if rng.random() < 0.5 else "",
+                        "latitude": site["latitude"],
+                        "longitude": site["longitude"],
+                        "geometry": f"POINT ({site['longitude']} {site['latitude']})",
+                        **values,
+                    },
+                )
+                self.write_photos([], photos, record_id, record_id, site)
+                self.write_children(
+                    generator.fields, [], record_id, record_id, site, created
+                )
+        finally:
+            for f in self.files.values():
+                f.close()
+
+        return dict(self.row_counts)
+
+
+def generate_export(
+    dataset: str,
+    records: int,
+    directory: str,
+    seed: int = 0,
+    layout: str = LAYOUT_EXPORT,
+    photo_files: bool = False,
+    **options,
+) -> dict:
+    """
+    Generate an export with the form it is from and a seed for the fake API
+    (the form, its projects and members). Returns a summary of what was
+    written.
+    """
+    generator = ExportGenerator(dataset, records, seed, **options)
+    writer = ExportWriter(generator, directory, layout, photo_files)
+    row_counts = writer.write()
+
+    form = generator.form()
+    with open(os.path.join(directory, "form.json"), "w") as f:
+        json.dump(form, f, indent=2)
+
+    with open(os.path.join(directory, "fake_api_seed.json"), "w") as f:
+        json.dump(
+            {
+                "forms": [form],
+                "projects": generator.projects,
+                "memberships": generator.members,
+            },
+            f,
+        )
+
+    summary = {
+        "dataset": dataset,
+        "seed": seed,
+        "records": records,
+        "form_id": generator.form_id,
+        "photos": generator.photo_count,
+        "files": row_counts,
+    }
+    logger.info(
+        f"Generated {records} {dataset} records ({sum(row_counts.values())} rows, {generator.photo_count} photos) in {directory}"
+    )
+    return summary
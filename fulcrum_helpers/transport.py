@@ -0,0 +1,140 @@
+import logging
+import os
+import time
+import typing as t
+
+import requests
+
+from .metrics import ApiMetrics, endpoint_name, get_metrics
+
+if t.TYPE_CHECKING:
+    import fulcrum
+
+logger = logging.getLogger(__name__)
+
+API_URL = "https://api.fulcrumapp.com/api/v2"
+
+# Set to point every Transport at another API, e.g. the local fake API
+API_URL_VARIABLE = "FULCRUM_API_URL"
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10, 120)
+
+# The number of keep-alive connections kept open to each host
+DEFAULT_POOL_SIZE = 16
+
+
+class Transport:
+    """
+    A keep-alive HTTP session shared by all the calls made to the Fulcrum API.
+
+    The API token is only sent to the API itself so the same session can be
+    used to download files from the (pre-signed) URLs that the API returns.
+    The base URL defaults to $FULCRUM_API_URL, then to the Fulcrum API.
+    Every request is recorded in `metrics`, which default to the metrics of
+    the run when they are enabled (see metrics.get_metrics).
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str | None = None,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeout: t.Tuple[float, float] = DEFAULT_TIMEOUT,
+        metrics: ApiMetrics | None = None,
+    ):
+        self.api_key = api_key
+        self._metrics = metrics
+        base_url = base_url or os.getenv(API_URL_VARIABLE) or API_URL
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        # requests already asks for gzip, set it explicitly so it isn't lost
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @property
+    def metrics(self) -> ApiMetrics | None:
+        return self._metrics or get_metrics()
+
+    def url(self, path: str) -> str:
+        """
+        Get the full URL of an API path, full URLs are returned unchanged
+        """
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Make a request with the shared session
+        """
+        url = self.url(path)
+
+        headers = kwargs.pop("headers", None) or {}
+        if url.startswith(self.base_url) and self.api_key:
+            headers = {
+                "X-ApiToken": self.api_key,
+                "Accept": "application/json",
+                **headers,
+            }
+
+        kwargs.setdefault("timeout", self.timeout)
+
+        return self.send(method, url, headers=headers, **kwargs)
+
+    def send(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request with the shared session as is, recording it in the
+        metrics
+        """
+        metrics = self.metrics
+        if metrics is None:
+            return self.session.request(method, url, **kwargs)
+
+        endpoint = endpoint_name(url, self.base_url)
+        start = time.perf_counter()
+        try:
+            resp = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            metrics.record_request(method, endpoint, None, time.perf_counter() - start)
+            raise
+
+        metrics.record_response(
+            method,
+            endpoint,
+            resp,
+            time.perf_counter() - start,
+            streamed=kwargs.get("stream", False),
+        )
+        return resp
+
+
+def use_transport(sdk: "fulcrum.Fulcrum", transport: Transport) -> "fulcrum.Fulcrum":
+    """
+    Make a Fulcrum SDK instance send all its requests through a Transport,
+    to the API the Transport points at
+    """
+    # The SDK is only loaded by the scripts that use it
+    from fulcrum.api import BaseAPI
+
+    from .sdk_client import TransportClient
+
+    client = TransportClient(
+        transport, sdk.client.key, sdk.client.api_root[: -len("/api/v2/")]
+    )
+    client.api_root = transport.base_url + "/"
+    sdk.client = client
+
+    # Each endpoint keeps its own reference to the client
+    for endpoint in vars(sdk).values():
+        if isinstance(endpoint, BaseAPI):
+            endpoint.client = client
+
+    return sdk
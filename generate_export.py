@@ -0,0 +1,92 @@
+import argparse
+import json
+import logging
+
+from fulcrum_helpers.synthetic import (DATASETS, LAYOUT_EXPORT, LAYOUT_IMPORT,
+                                       generate_export)
+
+parser = argparse.ArgumentParser(
+    description="Generate a synthetic Fulcrum export and its form for benchmarks."
+)
+parser.add_argument(
+    "--dataset",
+    "-d",
+    choices=list(DATASETS),
+    required=True,
+    help="The app to generate an export of.",
+)
+parser.add_argument(
+    "--records", "-r", type=int, default=1000, help="The number of records."
+)
+parser.add_argument(
+    "--output_dir",
+    "-o",
+    help="The directory to write the export to. Defaults to the export prefix of the dataset.",
+)
+parser.add_argument(
+    "--seed",
+    "-s",
+    type=int,
+    default=0,
+    help="The seed, the same seed gives the same export.",
+)
+parser.add_argument(
+    "--layout",
+    choices=[LAYOUT_EXPORT, LAYOUT_IMPORT],
+    default=LAYOUT_EXPORT,
+    help="Write the files as exported by Fulcrum or as read by import_api.py.",
+)
+parser.add_argument(
+    "--max_children",
+    type=int,
+    default=3,
+    help="The most entries in each repeatable of a record.",
+)
+parser.add_argument(
+    "--photo_rate",
+    type=float,
+    default=0.5,
+    help="The fraction of photo fields that have photos.",
+)
+parser.add_argument(
+    "--photo_files",
+    action="store_true",
+    help="Whether to write placeholder photo files next to the CSV files.",
+)
+parser.add_argument(
+    "--duplicate_rate",
+    type=float,
+    default=0.05,
+    help="The fraction of client names and references that are near duplicates.",
+)
+parser.add_argument(
+    "--extra_fields",
+    type=int,
+    default=0,
+    help="The number of extra text fields to add to the records, for wider apps.",
+)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+
+    summary = generate_export(
+        args.dataset,
+        args.records,
+        args.output_dir or DATASETS[args.dataset].prefix,
+        seed=args.seed,
+        layout=args.layout,
+        photo_files=args.photo_files,
+        max_children=args.max_children,
+        photo_rate=args.photo_rate,
+        duplicate_rate=args.duplicate_rate,
+        extra_fields=args.extra_fields,
+    )
+
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,30 @@
 import argparse
 import json
-import os
 
-from dotenv import load_dotenv
-from fulcrum import Fulcrum
-
-load_dotenv()
+from fulcrum_helpers.config import get_api_key
+from fulcrum_helpers.transport import Transport
 
 parser = argparse.ArgumentParser(description="Get a form from Fulcrum.")
 parser.add_argument("--form_name", "-n", help="The name of the form to get data from.")
 
-args = parser.parse_args()
-
-
-# Constants
 
-FORM_NAME = args.form_name
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+def main(argv=None):
+    args = parser.parse_args(argv)
 
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
+    target_form = None
 
+    # A single call, so the SDK isn't needed
+    transport = Transport(get_api_key())
+    resp = transport.request("get", "forms.json")
 
-def main():
-    target_form = None
+    if resp.status_code != 200:
+        print(f"Failed to get forms: {resp.status_code}")
+        return
 
-    forms = FULCRUM.forms.search()
+    forms = resp.json()
 
     for form in forms["forms"]:
-        if form["name"] == FORM_NAME:
+        if form["name"] == args.form_name:
             target_form = form
             break
 
@@ -1,28 +1,25 @@
 import argparse
 import json
-import os
 
-from dotenv import load_dotenv
-from fulcrum import Fulcrum
-
-load_dotenv()
+from fulcrum_helpers.config import get_api_key
+from fulcrum_helpers.transport import Transport
 
 parser = argparse.ArgumentParser(description="Get a record from Fulcrum.")
 parser.add_argument("--record_id", "-i", help="The ID of the record you want to get.")
 
-args = parser.parse_args()
-
-
-# Constants
 
-RECORD_ID = args.record_id
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+def main(argv=None):
+    args = parser.parse_args(argv)
 
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
+    # A single call, so the SDK isn't needed
+    transport = Transport(get_api_key())
+    resp = transport.request("get", f"records/{args.record_id}.json")
 
+    if resp.status_code != 200:
+        print(f"Failed to get record {args.record_id}: {resp.status_code}")
+        return
 
-def main():
-    record = FULCRUM.records.find(RECORD_ID)
+    record = resp.json()
 
     print(json.dumps(record, indent=4, sort_keys=True))
     # Write the record to a temporary file
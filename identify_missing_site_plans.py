@@ -6,15 +6,15 @@ Identifies missing site plans (photos & attachments) in various Fulcrum apps:
 """
 
 import argparse
+import asyncio
 import logging
 import os
 import typing as t
 
-from dotenv import load_dotenv
-
-from fulcrum_helpers.helpers import FulcrumApp, find_key_code
-
-load_dotenv()
+from fulcrum_helpers.async_client import SyncFulcrumApp
+from fulcrum_helpers.config import configure_logging, load_env
+from fulcrum_helpers.helpers import find_key_code
+from fulcrum_helpers.types import App, Record
 
 # Arguments
 parser = argparse.ArgumentParser(description="Update records.")
@@ -22,56 +22,34 @@ parser.add_argument(
     "--debug", help="Whether we should run in debug mode or not", action="store_true"
 )
 
-args = parser.parse_args()
-
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-# Create the Fulcrum API object
-FULCRUM = FulcrumApp(FULCRUM_API_KEY)
-
-# Logging
-
-# Logging format of: [LEVEL]::[FUNCTION]::[HH:MM:SS] - [MESSAGE]
-# Where the level is colored based on the level and the rest except from the message is grey
-start = "\033["
-end = "\033[0m"
-colors = {
-    "GREEN": "32m",
-    "ORANGE": "33m",
-    "RED": "31m",
-    "GREY": "90m",
-}
-for color in colors:
-    # Add the start to the color
-    colors[color] = start + colors[color]
-
-logging.addLevelName(logging.DEBUG, f"{colors['GREEN']}DEBUG{colors['GREY']}")  # Green
-logging.addLevelName(logging.INFO, f"{colors['GREEN']}INFO{colors['GREY']}")  # Green
-logging.addLevelName(
-    logging.WARNING, f"{colors['ORANGE']}WARNING{colors['GREY']}"
-)  # Orange
-logging.addLevelName(logging.ERROR, f"{colors['RED']}ERROR{colors['GREY']}")  # Red
-logging.addLevelName(
-    logging.CRITICAL, f"{colors['RED']}CRITICAL{colors['GREY']}"
-)  # Red
-
-# Define the format of the logging
-logging.basicConfig(
-    format=f"%(levelname)s::%(funcName)s::%(asctime)s - {end}%(message)s",
-    datefmt="%H:%M:%S",
-)
-
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
+
+# The Fulcrum API key and object, set by configure()
+FULCRUM_API_KEY = None  # type: str
+FULCRUM = None  # type: SyncFulcrumApp
+
+
+def configure(args):
+    """
+    Set the API client and the logging from the parsed arguments
+    """
+    global FULCRUM_API_KEY, FULCRUM
+
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    # Create the Fulcrum API object, the records of the apps are read concurrently
+    FULCRUM = SyncFulcrumApp(FULCRUM_API_KEY)
+
+    # Logging
+
+    configure_logging()
+
+    logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
 
 
-def identify_missing_sv_site_plans():
-    sv_app = FULCRUM.get_app("SITE VISIT RECORDS")
+def identify_missing_sv_site_plans(sv_app: App, sv_records: t.List[Record]):
     site_plan_key = find_key_code(sv_app["elements"], "site_plans_attachments")
     site_plan_photo_key = find_key_code(sv_app["elements"], "site_plans")
 
-    # Get the records
-    sv_records = FULCRUM.get_app_records(sv_app)
-
     logger.info(f"Found {len(sv_records)} records")
 
     counter = {
@@ -129,13 +107,9 @@ def identify_missing_sv_site_plans():
     )
 
 
-def identify_missing_jkmr_site_plans():
-    jkmr_app = FULCRUM.get_app("Japanese Knotweed Management Record (LEGACY)")
+def identify_missing_jkmr_site_plans(jkmr_app: App, jkmr_records: t.List[Record]):
     site_plan_photo_key = find_key_code(jkmr_app["elements"], "site_plans")
 
-    # Get the records
-    jkmr_records = FULCRUM.get_app_records(jkmr_app)
-
     logger.info(f"Found {len(jkmr_records)} records")
 
     counter = {
@@ -164,12 +138,8 @@ def identify_missing_jkmr_site_plans():
     )
 
 
-def identify_missing_survey_site_plans():
-    jkmr_app = FULCRUM.get_app("SURVEY")
-    site_plan_photo_key = find_key_code(jkmr_app["elements"], "break_site_plans")
-
-    # Get the records
-    survey_records = FULCRUM.get_app_records(jkmr_app)
+def identify_missing_survey_site_plans(survey_app: App, survey_records: t.List[Record]):
+    site_plan_photo_key = find_key_code(survey_app["elements"], "break_site_plans")
 
     logger.info(f"Found {len(survey_records)} records")
 
@@ -199,15 +169,42 @@ def identify_missing_survey_site_plans():
     )
 
 
-def main():
+async def get_apps_and_records(app_names: t.List[str]):
+    """
+    Get the apps by name and fetch the records of all of them concurrently
+    """
+    apps = {app["name"]: app for app in await FULCRUM.client.list_apps()}
+    selected_apps = [apps[name] for name in app_names]
+
+    records = await asyncio.gather(
+        *[FULCRUM.client.get_app_records(app) for app in selected_apps]
+    )
+
+    return list(zip(selected_apps, records))
+
+
+def main(argv=None):
+    load_env()
+    configure(parser.parse_args(argv))
+
+    (sv, jkmr, survey) = FULCRUM.run(
+        get_apps_and_records(
+            [
+                "SITE VISIT RECORDS",
+                "Japanese Knotweed Management Record (LEGACY)",
+                "SURVEY",
+            ]
+        )
+    )
+
     print("Site visit records")
-    identify_missing_sv_site_plans()
+    identify_missing_sv_site_plans(*sv)
 
     print("\nJapanese Knotweed Management records")
-    identify_missing_jkmr_site_plans()
+    identify_missing_jkmr_site_plans(*jkmr)
 
     print("\nSurvey records")
-    identify_missing_survey_site_plans()
+    identify_missing_survey_site_plans(*survey)
 
 
 if __name__ == "__main__":
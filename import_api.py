@@ -6,10 +6,11 @@ import os
 import time
 from datetime import datetime
 
-from dotenv import load_dotenv
-from fulcrum import Fulcrum
-
-load_dotenv()
+from fulcrum_helpers.config import load_env
+from fulcrum_helpers.helpers import rate_limited
+from fulcrum_helpers.resilience import ResilientWriter, find_created_record
+from fulcrum_helpers.schema import SchemaRegistry
+from fulcrum_helpers.transport import Transport, use_transport
 
 parser = argparse.ArgumentParser(
     description="Import data from a CSV file into Fulcrum."
@@ -27,58 +28,86 @@ parser.add_argument(
     "--yes", "-y", help="Skip the confirmation prompt.", action="store_true"
 )
 parser.add_argument("--base_name", "-p", help="The base name of the source files")
-
-args = parser.parse_args()
+parser.add_argument(
+    "--new_journal",
+    help="Start a new journal of the created records, the old one is kept with a timestamp.",
+    action="store_true",
+)
 
 
-# Constants
+# Constants, set from the arguments by configure()
 
-FORM_NAME = args.form_name
-SOURCE_DIR = args.source_dir
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+FORM_NAME = None  # type: str
+SOURCE_DIR = None  # type: str
+FULCRUM_API_KEY = None  # type: str
 
-TYPE = args.type
+TYPE = None  # type: str
 
-CONFIRMED = args.yes
+CONFIRMED = False
 
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
+TRANSPORT = None  # type: Transport
+FULCRUM = None  # type: Fulcrum
+SCHEMAS = None  # type: SchemaRegistry
 
 READ_REPEATABLES = {}
 PROJECT_IDS = {}
 USER_IDS = {}
 
-BASE_NAME = args.base_name
-PARENT_TO_LATEST_SURVEY_ID = (
-    f"parent_to_latest_survey{('_' + BASE_NAME) if BASE_NAME else ''}.json"
-)
-OLD_TO_NEW_ID_MAPPING = (
-    f"old_to_new_id_mapping{('_' + BASE_NAME) if BASE_NAME else ''}.json"
-)
+BASE_NAME = None  # type: str | None
+PARENT_TO_LATEST_SURVEY_ID = None  # type: str
+OLD_TO_NEW_ID_MAPPING = None  # type: str
 
-# Util
+# Records that have been created, so that a rerun doesn't create them again
+WRITER = None  # type: ResilientWriter
 
 
-def rate_limited(max_per_second):
+def configure(args):
     """
-    Decorator to limit the rate of function calls.
+    Set the constants and the API clients from the parsed arguments
     """
-    minimum_interval = 1.0 / float(max_per_second)
+    from fulcrum import Fulcrum
+
+    global FORM_NAME, SOURCE_DIR, FULCRUM_API_KEY, TYPE, CONFIRMED, TRANSPORT
+    global FULCRUM, SCHEMAS, BASE_NAME, PARENT_TO_LATEST_SURVEY_ID
+    global OLD_TO_NEW_ID_MAPPING, WRITER
+
+    FORM_NAME = args.form_name
+    SOURCE_DIR = args.source_dir
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+
+    TYPE = args.type
+
+    if TYPE != "survey" and TYPE != "site_visits":
+        print("Invalid type: " + TYPE)
+        exit()
+
+    CONFIRMED = args.yes
+
+    TRANSPORT = Transport(FULCRUM_API_KEY)
+    FULCRUM = use_transport(Fulcrum(FULCRUM_API_KEY), TRANSPORT)
+    SCHEMAS = SchemaRegistry(TRANSPORT)
+
+    BASE_NAME = args.base_name
+    PARENT_TO_LATEST_SURVEY_ID = (
+        f"parent_to_latest_survey{('_' + BASE_NAME) if BASE_NAME else ''}.json"
+    )
+    OLD_TO_NEW_ID_MAPPING = (
+        f"old_to_new_id_mapping{('_' + BASE_NAME) if BASE_NAME else ''}.json"
+    )
 
-    def decorate(func):
-        last_time_called = [0.0]
+    journal_path = f"import_journal_{TYPE}{('_' + BASE_NAME) if BASE_NAME else ''}.jsonl"
+    if args.new_journal and os.path.exists(journal_path):
+        old_journal_path = f"{journal_path}.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        os.replace(journal_path, old_journal_path)
+        print(f"Moved the old journal to {old_journal_path}")
 
-        def rate_limited_function(*args, **kargs):
-            elapsed = time.perf_counter() - last_time_called[0]
-            left_to_wait = minimum_interval - elapsed
-            if left_to_wait > 0:
-                time.sleep(left_to_wait)
-            ret = func(*args, **kargs)
-            last_time_called[0] = time.perf_counter()
-            return ret
+    WRITER = ResilientWriter(
+        dead_letter_path=f"import_dead_letter{('_' + BASE_NAME) if BASE_NAME else ''}.jsonl",
+        journal_path=journal_path,
+    )
 
-        return rate_limited_function
 
-    return decorate
+# Util
 
 
 def save_first_record(form_id):
@@ -123,29 +152,32 @@ def get_csv_files(dir):
 
 # Rate limited for 4000 calls per hour (actual limit is 5000/h but we want to be safe)
 @rate_limited(4000 / 3600)
+def create_record(record):
+    return FULCRUM.records.create(record)
+
+
 def upload_records(records):
     for record in records:
         id_mapping = {}
-        res = None
-        retry_count = 0
-
-        while retry_count < 3:
-            try:
-                res = FULCRUM.records.create(record)
 
-                if "error" in res:
-                    raise Exception("Error creating record")
-
-                break
-            except Exception:
-                print(
-                    f"Error creating record '{record['record']['fulcrum_id']}'. Retrying in 1 second..."
-                )
-                time.sleep(1)
-                retry_count += 1
-
-        if not res or "error" in res:
-            print(res)
+        # The same export can be imported into more than one form. Importing
+        # it into the same form again (e.g. after its records were deleted)
+        # needs --new_journal
+        key = f"{record['record']['form_id']}:{record['record']['fulcrum_id']}"
+        journaled = key in WRITER.completed
+
+        # Records created in the form by an earlier run come back from the journal
+        res = WRITER.create(
+            "create_record",
+            create_record,
+            record,
+            key=key,
+            payload=record,
+            # A create that timed out may still have reached Fulcrum
+            find_existing=find_created_record(FULCRUM, record),
+        )
+
+        if not res:
             print(f"Failed to create record {record['record']['fulcrum_id']}")
             continue
 
@@ -153,7 +185,10 @@ def upload_records(records):
             print(res)
             raise Exception(f"Failed to create record {record['record']['fulcrum_id']}")
 
-        print(res["record"]["id"] + " created.")
+        if journaled:
+            print(res["record"]["id"] + " already created by an earlier run.")
+        else:
+            print(res["record"]["id"] + " created.")
 
         if TYPE == "survey":
             # Update the OLD_TO_NEW_ID_MAPPING file to map the old record_id to the new record_id
@@ -567,7 +602,7 @@ def create_records(form_id, elements, rows, base_obj={}):
     return all_records
 
 
-def main():
+def run_import():
     if TYPE == "survey":
         # Remove the OLD_TO_NEW_ID_MAPPING file
         if os.path.exists(OLD_TO_NEW_ID_MAPPING):
@@ -578,21 +613,40 @@ def main():
             if os.path.exists(PARENT_TO_LATEST_SURVEY_ID):
                 os.remove(PARENT_TO_LATEST_SURVEY_ID)
 
-    target_form = None
-
-    forms = FULCRUM.forms.search()
-
-    for form in forms["forms"]:
-        if form["name"] == FORM_NAME:
-            target_form = form
-            break
+    target_form = SCHEMAS.get_app(FORM_NAME)
 
     if not target_form:
         print("Form not found")
         return
 
+    records = build_records(target_form)
+
+    # save_records(records)
+    # save_first_record(form_id)
+    # save_form(target_form)
+    # print(json.dumps(records, indent=2))
+    print("Records to upload: " + str(len(records)))
+
+    if CONFIRMED:
+        print("Waiting 5 seconds before import. Press Ctrl+C to cancel.")
+        time.sleep(5)
+
+    upload_records(records)
+
+
+def build_records(target_form):
+    """
+    Build the records to create from the CSV files in SOURCE_DIR
+    """
     form_id = target_form["id"]
 
+    # The records are built from the elements, so they must be the form's
+    # current schema and not one cached before the form was edited
+    SCHEMAS.refresh(force=True)
+    target_form = SCHEMAS.get_form(form_id)
+    if not target_form:
+        raise Exception(f"Form {form_id} not found")
+
     # Process:
     # 1. We transform the records into a list of data names instead of IDs
     #    - Match on "data_name" within target_form["elements"][i], get "key" property
@@ -621,31 +675,24 @@ def main():
     for record in records:
         record["record"] = correct_record(target_form, record["record"])
 
-    # save_records(records)
-    # save_first_record(form_id)
-    # save_form(target_form)
-    # print(json.dumps(records, indent=2))
-    print("Records to upload: " + str(len(records)))
+    return records
 
-    if CONFIRMED:
-        print("Waiting 5 seconds before import. Press Ctrl+C to cancel.")
-        time.sleep(5)
-
-    upload_records(records)
 
+def main(argv=None):
+    load_env()
+    configure(parser.parse_args(argv))
 
-if TYPE != "survey" and TYPE != "site_visits":
-    print("Invalid type: " + TYPE)
-    exit()
-
-if __name__ == "__main__":
     answer = None
 
     if not CONFIRMED:
         answer = input("Are you sure? (y/n): ")
 
     if CONFIRMED or answer == "y":
-        main()
+        run_import()
         print("Done.")
     else:
         print("Exiting...")
+
+
+if __name__ == "__main__":
+    main()
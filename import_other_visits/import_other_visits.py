@@ -3,7 +3,6 @@
 This script imports all the "Other" visit types from the old JKMR app to the new SITE VISIT RECORDS app.
 """
 import argparse
-import builtins
 import copy
 import json
 import logging
@@ -16,8 +15,6 @@ from fulcrum import Fulcrum
 from fulcrum_types.types import (App, AppElement, AppElementTypes, FormValue,
                                  Record, RepeatableValue)
 
-load_dotenv()
-
 parser = argparse.ArgumentParser(
     description="Import all the 'Other' visit types from the old JKMR app to the new SITE VISIT RECORDS app."
 )
@@ -31,17 +28,15 @@ parser.add_argument(
     "--skip-missing", help="Whether we should skip records that don't have a matching record in the new app", action="store_true"
 )
 
-# Parse the arguments
-args = parser.parse_args()
-
-DEBUG = args.debug
-NO_CONFIRMATION = args.no_confirmation
-SKIP_MISSING = args.skip_missing
+# Set from the arguments by configure()
+DEBUG = False
+NO_CONFIRMATION = False
+SKIP_MISSING = False
 
-# Get the Fulcrum API key from the environment variables
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-# Create the Fulcrum API object
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
+# The Fulcrum API key from the environment variables
+FULCRUM_API_KEY = None  # type: str
+# The Fulcrum API object
+FULCRUM = None  # type: Fulcrum
 
 # The name of the old JKMR app and the new SITE VISIT RECORDS app
 JKMR_APP_NAME = "Japanese Knotweed Management Record (LEGACY)"
@@ -100,37 +95,54 @@ for color in colors:
     # Add the start to the color
     colors[color] = start + colors[color]
 
-logging.addLevelName(logging.DEBUG, f"{colors['GREEN']}DEBUG{colors['GREY']}")  # Green
-logging.addLevelName(logging.INFO, f"{colors['GREEN']}INFO{colors['GREY']}")  # Green
-logging.addLevelName(
-    logging.WARNING, f"{colors['ORANGE']}WARNING{colors['GREY']}"
-)  # Orange
-logging.addLevelName(logging.ERROR, f"{colors['RED']}ERROR{colors['GREY']}")  # Red
-logging.addLevelName(
-    logging.CRITICAL, f"{colors['RED']}CRITICAL{colors['GREY']}"
-)  # Red
-
-# Define the format of the logging
-logging.basicConfig(
-    format=f"%(levelname)s::%(funcName)s::%(asctime)s - {end}%(message)s",
-    datefmt="%H:%M:%S",
-)
-
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
 
-# Add a file handler to the logger
-file_handler = logging.FileHandler(
-    os.path.dirname(os.path.realpath(__file__)) + "/import_other_visits.log",
-    mode="w+",
-)
-file_handler.setLevel(logging.DEBUG)
-file_handler.setFormatter(
-    logging.Formatter(
-        f"%(levelname)s::%(funcName)s::%(asctime)s - %(message)s", datefmt="%H:%M:%S"
+
+def configure(args):
+    """
+    Set the constants, the API client and the logging from the parsed arguments
+    """
+    global DEBUG, NO_CONFIRMATION, SKIP_MISSING, FULCRUM_API_KEY, FULCRUM
+
+    DEBUG = args.debug
+    NO_CONFIRMATION = args.no_confirmation
+    SKIP_MISSING = args.skip_missing
+
+    # Get the Fulcrum API key from the environment variables
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    # Create the Fulcrum API object
+    FULCRUM = Fulcrum(FULCRUM_API_KEY)
+
+    logging.addLevelName(logging.DEBUG, f"{colors['GREEN']}DEBUG{colors['GREY']}")  # Green
+    logging.addLevelName(logging.INFO, f"{colors['GREEN']}INFO{colors['GREY']}")  # Green
+    logging.addLevelName(
+        logging.WARNING, f"{colors['ORANGE']}WARNING{colors['GREY']}"
+    )  # Orange
+    logging.addLevelName(logging.ERROR, f"{colors['RED']}ERROR{colors['GREY']}")  # Red
+    logging.addLevelName(
+        logging.CRITICAL, f"{colors['RED']}CRITICAL{colors['GREY']}"
+    )  # Red
+
+    # Define the format of the logging
+    logging.basicConfig(
+        format=f"%(levelname)s::%(funcName)s::%(asctime)s - {end}%(message)s",
+        datefmt="%H:%M:%S",
     )
-)
-logger.addHandler(file_handler)
+
+    logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
+
+    # Add a file handler to the logger
+    file_handler = logging.FileHandler(
+        os.path.dirname(os.path.realpath(__file__)) + "/import_other_visits.log",
+        mode="w+",
+    )
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(
+        logging.Formatter(
+            f"%(levelname)s::%(funcName)s::%(asctime)s - %(message)s", datefmt="%H:%M:%S"
+        )
+    )
+    logger.addHandler(file_handler)
 
 
 def list_apps():
@@ -153,9 +165,9 @@ def get_app(name: str) -> App:
             return app # type: App
 
 
-def open(filename: str, mode, debug_file=False):
+def create_file(filename: str, mode, debug_file=False):
     """
-    Override builtin "open" function to open file but add filename to the global list of files
+    Open a file next to the script and add the filename to the global list of files
     This is so we can delete them later
     """
     global FILES_CREATED
@@ -165,7 +177,7 @@ def open(filename: str, mode, debug_file=False):
         global DEBUG_FILES_CREATED
         DEBUG_FILES_CREATED.append(filename)
 
-    return builtins.open(os.path.join(os.path.dirname(__file__), filename), mode)
+    return open(os.path.join(os.path.dirname(__file__), filename), mode)
 
 
 def get_app_records(app: dict) -> t.List[Record]:
@@ -176,90 +188,186 @@ def get_app_records(app: dict) -> t.List[Record]:
     return records
 
 
-def deep_convert_none_fields(hash: dict) -> dict:
+def normalize_form_value(value: t.Any) -> t.Any:
     """
-    Deep convert all the None values in a dictionary to an empty string
+    Convert a form value into a hashable key that can be compared.
+    None values become empty strings and strings are stripped, without
+    modifying the original value.
     """
-    for key, value in hash.items():
-        if value is None:
-            hash[key] = ""
-        elif isinstance(value, dict):
-            hash[key] = deep_convert_none_fields(value)
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return tuple(
+            sorted((key, normalize_form_value(item)) for key, item in value.items())
+        )
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize_form_value(item) for item in value)
 
-    return hash
+    return value
 
 
-def deep_convert_fields(hash: dict) -> dict:
-    """
-    Deep convert all values in a field to a format that can be compared
-    """
-    return deep_strip_fields(deep_convert_none_fields(hash))
+# The record type that all imported "Other" visits have in the SITE VISIT RECORDS app
+OTHER_RECORD_TYPE = normalize_form_value(
+    {
+        "other_values": [],
+        "choice_values": ["Other Treatments Inc. Excavation"],
+    }
+)
 
 
-def deep_strip_fields(hash: dict) -> dict:
+class SiteVisitMatchIndex:
     """
-    Deep strip all the string values in a dictionary
+    Indexes the SITE VISIT RECORDS so that JKMR records and their "Other"
+    visits can be matched without scanning every record for each lookup.
+
+    Records are indexed by job ID (keeping all records that share a job ID)
+    and by ID. Address keys are normalized once per record and the site visit
+    entries of a record are indexed by (date, record type) on first use.
     """
-    for key, value in hash.items():
-        if isinstance(value, str):
-            hash[key] = value.strip()
-        elif isinstance(value, dict):
-            hash[key] = deep_strip_fields(value)
 
-    return hash
+    def __init__(self, site_visit_records: t.List[Record]):
+        self.by_id = {}  # type: t.Dict[str, Record]
+        self.by_job_id = {}  # type: t.Dict[str, t.List[Record]]
+        self.address_keys = {}  # type: t.Dict[str, t.Any]
+        self.entry_indexes = {}  # type: t.Dict[str, t.Dict[t.Tuple[str, t.Any], t.List[RepeatableValue]]]
+        # Job IDs that could not be resolved to a single record
+        self.collisions = {}  # type: t.Dict[str, t.List[str]]
 
+        keys = KEY_NAMES["SITE_VISIT_RECORDS"]
+        for record in site_visit_records:
+            self.by_id[record["id"]] = record
 
-SITE_VISIT_HASH = {}  # type: t.Dict[str, Record]
+            job_id = (record["form_values"].get(keys["job_id"]) or "").strip()
+            self.by_job_id.setdefault(job_id, []).append(record)
 
+            self.address_keys[record["id"]] = normalize_form_value(
+                record["form_values"].get(keys["site_address"])
+            )
 
-def find_matching_site_visit_record(
-    jkmr_record: Record, site_visit_records: t.List[Record]
-) -> t.Optional[Record]:
-    """
-    Find a matching site visit record for a JKMR record
-    """
-    global SITE_VISIT_HASH
-    if not SITE_VISIT_HASH:
-        SITE_VISIT_HASH = {
-            record["form_values"]
-            .get(KEY_NAMES["SITE_VISIT_RECORDS"]["job_id"], "")
-            .strip(): record
-            for record in site_visit_records
-        }
+        duplicates = [
+            job_id
+            for job_id, records in self.by_job_id.items()
+            if job_id and len(records) > 1
+        ]
+        logger.info(
+            f"Indexed {len(self.by_id)} site visit records ({len(self.by_job_id)} job IDs, {len(duplicates)} shared by more than one record)"
+        )
 
-    jkmr_job_id = (
-        jkmr_record["form_values"].get(KEY_NAMES["JKMR"]["pba_reference"], "")
-    ).strip()
+    def find_record(self, jkmr_record: Record) -> t.Optional[Record]:
+        """
+        Find the site visit record matching a JKMR record on job ID and site address
+        """
+        jkmr_job_id = (
+            jkmr_record["form_values"].get(KEY_NAMES["JKMR"]["pba_reference"]) or ""
+        ).strip()
 
-    focus_site_record = SITE_VISIT_HASH.get(jkmr_job_id, None)
+        candidates = self.by_job_id.get(jkmr_job_id, [])
 
-    if not focus_site_record:
-        logger.warning(
-            f"Could not find a matching site visit record for JKMR record: {jkmr_record['id']} - {jkmr_job_id}"
+        if not candidates:
+            logger.warning(
+                f"Could not find a matching site visit record for JKMR record: {jkmr_record['id']} - {jkmr_job_id}"
+            )
+            return None
+
+        address_key = normalize_form_value(
+            jkmr_record["form_values"].get(KEY_NAMES["JKMR"]["site_address"])
         )
-        return None
 
-    logger.info(
-        f"Found matching site visit record for JKMR record: {jkmr_record['id']} - {jkmr_job_id}"
-    )
+        # Empty addresses never match
+        if not address_key:
+            logger.debug(f"JKMR record has no site address: {jkmr_record['id']}")
+            return None
 
-    comparissons = [
-        [
-            deep_convert_fields(
-                jkmr_record["form_values"].get(KEY_NAMES["JKMR"]["site_address"], {})
-            ),
-            deep_convert_fields(
-                focus_site_record["form_values"].get(
-                    KEY_NAMES["SITE_VISIT_RECORDS"]["site_address"], {}
-                )
-            ),
-        ],
-    ]
+        matches = [
+            record
+            for record in candidates
+            if self.address_keys[record["id"]] == address_key
+        ]
 
-    matches = compare_comparissons(comparissons, False)
+        if len(matches) > 1:
+            logger.error(
+                f"Found {len(matches)} site visit records for JKMR record: {jkmr_record['id']} - {jkmr_job_id}"
+            )
+            self.collisions[jkmr_job_id] = [record["id"] for record in matches]
+            return None
 
-    if matches:
-        return focus_site_record
+        if not matches:
+            logger.debug(
+                f"Site address does not match for JKMR record: {jkmr_record['id']} - {jkmr_job_id}"
+            )
+            return None
+
+        logger.info(
+            f"Found matching site visit record for JKMR record: {jkmr_record['id']} - {jkmr_job_id}"
+        )
+        return matches[0]
+
+    def get_entry_index(
+        self, site_visit_record: Record
+    ) -> t.Dict[t.Tuple[str, t.Any], t.List[RepeatableValue]]:
+        """
+        Get the (date, record type) index of a site visit record's entries
+        """
+        entry_index = self.entry_indexes.get(site_visit_record["id"])
+        if entry_index is None:
+            entry_index = {}
+            for entry in get_site_visit_entries(site_visit_record):
+                self.add_entry(entry_index, entry)
+            self.entry_indexes[site_visit_record["id"]] = entry_index
+
+        return entry_index
+
+    def add_entry(
+        self,
+        entry_index: t.Dict[t.Tuple[str, t.Any], t.List[RepeatableValue]],
+        entry: RepeatableValue,
+    ):
+        """
+        Add a site visit entry to an entry index
+        """
+        keys = KEY_NAMES["SITE_VISIT_RECORDS"]
+        date = normalize_form_value(entry["form_values"].get(keys["site_visit_date"]))
+        record_type = normalize_form_value(
+            entry["form_values"].get(keys["record_type_japanese_knotweed"])
+        )
+
+        # Entries without a date or record type can never be matched
+        if not date or not record_type:
+            return
+
+        entry_index.setdefault((date, record_type), []).append(entry)
+
+    def get_matching_site_visits(
+        self, site_visit_record: Record, source_visit: RepeatableValue
+    ) -> t.List[RepeatableValue]:
+        """
+        Get the site visit entries of a record that match a JKMR "Other" visit.
+        The source visit is always of type "Other" so it is matched on date and
+        the "Other" record type.
+        """
+        date = normalize_form_value(
+            source_visit["form_values"].get(KEY_NAMES["JKMR"]["treatment_date"])
+        )
+        if not date:
+            return []
+
+        return self.get_entry_index(site_visit_record).get((date, OTHER_RECORD_TYPE), [])
+
+    def write_collisions(self):
+        """
+        Report the job IDs that matched more than one site visit record
+        """
+        if not self.collisions:
+            return
+
+        logger.warning(
+            f"{len(self.collisions)} JKMR records matched more than one site visit record, see job_id_collisions.txt"
+        )
+        with create_file("job_id_collisions.txt", "w") as f:
+            for job_id, record_ids in self.collisions.items():
+                f.write(f"{job_id} -> {', '.join(record_ids)}\n")
 
 
 def get_jkmr_other_site_visits(jkmr_record: Record) -> t.List[RepeatableValue]:
@@ -304,99 +412,6 @@ def get_site_visit_entries(site_visit_record: Record) -> t.List[FormValue]:
     return site_visit_entries
 
 
-def compare_comparissons(
-    comparissons: t.List[t.List[t.Any]], falsy_matches=True
-) -> bool:
-    """
-    Compare a list of comparissons and return whether they are the same or not
-    """
-
-    matches = True
-
-    for values in comparissons:
-        # Check whether we should match None values or just return False
-        if not falsy_matches:
-            # If any of the values are None, then don't match
-            if not values[0] or not values[1]:
-                logger.debug(
-                    f"One of the values is falsy, not matching: {values[0]}, {values[1]}"
-                )
-                matches = False
-                break
-
-        # If the values are not the same, then it does not match
-        if not do_form_values_match(values[0], values[1]):
-            logger.debug(f"Comparisson: {values[0]} != {values[1]}")
-            matches = False
-            break
-
-        logger.debug(f"Comparisson: {values[0]} == {values[1]}")
-
-    return matches
-
-
-def do_form_values_match(value1: t.Any, value2: t.Any) -> bool:
-    """
-    Check if two form values match
-    """
-    converted_value1 = (
-        deep_convert_fields(value1) if isinstance(value1, dict) else value1
-    )
-    converted_value2 = (
-        deep_convert_fields(value2) if isinstance(value2, dict) else value2
-    )
-
-    return converted_value1 == converted_value2
-
-
-def get_matching_site_visits(
-    source_visit: RepeatableValue, visits: t.List[RepeatableValue]
-) -> t.List[RepeatableValue]:
-    """
-    Get the matching site visit from the list of site visits
-    """
-
-    matching_visits = []
-
-    for visit in visits:
-        """
-        ? This should be passed into the function rather than defined here
-        because otherwise this function isn't pure
-        """
-        comparissons = [
-            [
-                source_visit["form_values"].get(
-                    KEY_NAMES["JKMR"]["treatment_date"], None
-                ),
-                visit["form_values"].get(
-                    KEY_NAMES["SITE_VISIT_RECORDS"]["site_visit_date"], None
-                ),
-            ],
-            [
-                # Create the "Other" object that we want to match on
-                # Simulate what the "Other" object would look like in the site visit record
-                # We are essentially matching on site visit type here since we already know that the
-                # source_visit will be of type "Other"
-                {
-                    "other_values": [],
-                    "choice_values": ["Other Treatments Inc. Excavation"],
-                },
-                visit["form_values"].get(
-                    KEY_NAMES["SITE_VISIT_RECORDS"]["record_type_japanese_knotweed"],
-                    None,
-                ),
-            ],
-        ]
-
-        # Check if all the comparissons match
-        matches = compare_comparissons(comparissons, False)
-
-        if matches:
-            matching_visits.append(visit)
-
-    return matching_visits
-
-
 def find_key_code(elements: t.List[AppElement], data_name: str) -> str | None:
     """
     Recursively search an app's elements to find the key
@@ -418,73 +433,130 @@ def find_key_code(elements: t.List[AppElement], data_name: str) -> str | None:
 
     return None
 
-def update_site_visit_record_with_entry(
-        parent_site_visit_record: Record, new_entry: RepeatableValue
-):
+class SiteVisitRecordUpdates:
     """
-    Update the site visit record with a new entry
+    Accumulates the new entries for each site visit record so that every
+    record is copied and updated once, no matter how many "Other" visits
+    are added to it.
     """
 
-    # Delete known keys that should not be set, Fulcrum will throw errors otherwise
-    delete_keys = [
+    # Known keys that should not be set, Fulcrum will throw errors otherwise
+    DELETE_KEYS = [
         "created_by_id",
         "updated_by_id",
         "version",
         "updated_at",
         "id",
     ]
-    for key in delete_keys:
-        if key in new_entry:
-            del new_entry[key]
 
-    global SITE_VISIT_RECORDS_APP
+    def __init__(self):
+        self.records = {}  # type: t.Dict[str, Record]
+        self.pending_entries = {}  # type: t.Dict[str, t.List[RepeatableValue]]
 
-    if not SITE_VISIT_RECORDS_APP:
-        logger.error("SITE VISIT RECORDS app is not defined")
-        exit(1)
+    def add(self, parent_site_visit_record: Record, new_entry: RepeatableValue):
+        """
+        Queue a new entry for a site visit record
+        """
+        for key in self.DELETE_KEYS:
+            if key in new_entry:
+                del new_entry[key]
 
-    updated_parent_site_visit_record = copy.deepcopy(parent_site_visit_record)
+        record_id = parent_site_visit_record["id"]
+        self.records[record_id] = parent_site_visit_record
+        self.pending_entries.setdefault(record_id, []).append(new_entry)
 
-    # Find the insertion point within the parent site visit record
-    site_visit_entries = get_site_visit_entries(parent_site_visit_record)
+        logger.debug(
+            f"Queued new entry for site visit record {record_id} ({len(self.pending_entries[record_id])} pending)"
+        )
 
-    updated_site_visit_entries = copy.deepcopy(site_visit_entries)
+    def build_updated_record(
+        self, record_id: str
+    ) -> t.Tuple[Record, t.List[RepeatableValue]]:
+        """
+        Build the updated record with all the pending entries and return it
+        with the entries that were actually added
+        """
+        parent_site_visit_record = self.records[record_id]
+        site_visit_entries = get_site_visit_entries(parent_site_visit_record)
+
+        # Entries identical to an existing entry would not change the record
+        existing_entries = {
+            normalize_form_value(entry["form_values"]) for entry in site_visit_entries
+        }
+        added_entries = []
+        for entry in self.pending_entries[record_id]:
+            entry_key = normalize_form_value(entry["form_values"])
+            if entry_key in existing_entries:
+                logger.debug(f"Entry already exists in site visit record {record_id}")
+                continue
 
-    # Add the new entry to the site visit record
-    updated_site_visit_entries.append(new_entry)
+            existing_entries.add(entry_key)
+            added_entries.append(entry)
 
-    # Sort the site visit entries by date and time on using SITE VISIT RECORDS keys
-    updated_site_visit_entries.sort(
-        key=lambda x: (
-            x["form_values"].get(KEY_NAMES["SITE_VISIT_RECORDS"]["site_visit_date"], ""),
-            x["form_values"].get(KEY_NAMES["SITE_VISIT_RECORDS"]["site_visit_time"], ""),
+        updated_site_visit_entries = site_visit_entries + added_entries
+
+        # Sort the site visit entries by date and time on using SITE VISIT RECORDS keys
+        updated_site_visit_entries.sort(
+            key=lambda x: (
+                x["form_values"].get(KEY_NAMES["SITE_VISIT_RECORDS"]["site_visit_date"], ""),
+                x["form_values"].get(KEY_NAMES["SITE_VISIT_RECORDS"]["site_visit_time"], ""),
+            )
         )
-    )
 
-    # Update the parent site visit record with the new entries
-    updated_parent_site_visit_record["form_values"][KEY_NAMES["SITE_VISIT_RECORDS"]["site_visit_entries"]] = updated_site_visit_entries
+        # Only the containers along the changed path are copied, the rest is shared
+        updated_parent_site_visit_record = {
+            **parent_site_visit_record,
+            "form_values": {
+                **parent_site_visit_record["form_values"],
+                KEY_NAMES["SITE_VISIT_RECORDS"]["site_visit_entries"]: updated_site_visit_entries,
+            },
+        }
 
-    # Log the changes to a file with the ID as the filename in the "changes" directory
-    if not os.path.exists(os.path.join(os.path.dirname(__file__), "changes")):
-        os.mkdir(os.path.join(os.path.dirname(__file__), "changes"))
+        return updated_parent_site_visit_record, added_entries
 
-    with open(f"changes/{parent_site_visit_record['id']}_before.txt", "w") as f:
-        json.dump(parent_site_visit_record, f, indent=4)
+    def apply(self):
+        """
+        Update every site visit record that has pending entries
+        """
+        global SITE_VISIT_RECORDS_APP
 
-    with open(f"changes/{parent_site_visit_record['id']}_after.txt", "w") as f:
-        json.dump(updated_parent_site_visit_record, f, indent=4)
+        if not SITE_VISIT_RECORDS_APP:
+            logger.error("SITE VISIT RECORDS app is not defined")
+            exit(1)
 
-    if not NO_CONFIRMATION:
-        user_input = input(
-            f"Update site visit record {parent_site_visit_record['id']} with new entry? (y/n):"
+        logger.info(
+            f"Updating {len(self.pending_entries)} site visit records with {sum(len(x) for x in self.pending_entries.values())} new entries"
         )
 
-        if user_input.lower() != "y":
-            logger.error("User chose not to update the site visit record, exiting...")
-            exit(1)
+        # Log the changes to a file with the ID as the filename in the "changes" directory
+        if not os.path.exists(os.path.join(os.path.dirname(__file__), "changes")):
+            os.mkdir(os.path.join(os.path.dirname(__file__), "changes"))
 
-    # Update the site visit record
-    update_fulcrum_record(parent_site_visit_record["id"], updated_parent_site_visit_record)
+        skipped = 0
+        for record_id in self.pending_entries:
+            updated_record, added_entries = self.build_updated_record(record_id)
+
+            if not added_entries:
+                logger.info(f"No changes for site visit record {record_id}, skipping")
+                skipped += 1
+                continue
+
+            with create_file(f"changes/{record_id}_added.json", "w") as f:
+                json.dump(added_entries, f)
+
+            if not NO_CONFIRMATION:
+                user_input = input(
+                    f"Update site visit record {record_id} with {len(added_entries)} new entries? (y/n):"
+                )
+
+                if user_input.lower() != "y":
+                    logger.error("User chose not to update the site visit record, exiting...")
+                    exit(1)
+
+            # Update the site visit record
+            update_fulcrum_record(record_id, updated_record)
+
+        logger.info(f"Skipped {skipped} site visit records with no changes")
 
 
 def rate_limited(max_per_second):
@@ -539,11 +611,13 @@ def update_fulcrum_record(record_id: str, record: Record):
         logger.error(updated_record)
         exit(1)
 
-    logger.info(f"Updated site visit record: {updated_record['record']['id']} with new entry")
+    logger.info(f"Updated site visit record: {updated_record['record']['id']} with new entries")
 
 
 def process_new_site_visit_entry(
-    parent_site_visit_record: Record, jkmr_other_visit: RepeatableValue
+    pending_updates: SiteVisitRecordUpdates,
+    parent_site_visit_record: Record,
+    jkmr_other_visit: RepeatableValue,
 ):
     """
     Process a new site visit entry
@@ -648,11 +722,11 @@ def process_new_site_visit_entry(
     if not os.path.exists(os.path.join(os.path.dirname(__file__), "changes")):
         os.mkdir(os.path.join(os.path.dirname(__file__), "changes"))
 
-    with open(f"changes/{parent_site_visit_record['id']}.txt", "w") as f:
+    with create_file(f"changes/{parent_site_visit_record['id']}.txt", "w") as f:
         json.dump(jkmr_other_visit, f, indent=4)
 
-    # Add the new entry to the site visit record
-    update_site_visit_record_with_entry(parent_site_visit_record, updated_jkmr_other_visit)
+    # Queue the new entry, the site visit record is updated once all entries are known
+    pending_updates.add(parent_site_visit_record, updated_jkmr_other_visit)
 
 
 def process_existing_site_visit_entry(
@@ -665,7 +739,7 @@ def process_existing_site_visit_entry(
     logger.info(f"Site visit already exists, manually added? {jkmr_other_visit}")
 
     # Just log it to a file for manual inspection
-    with open("existing_site_visit_entries.txt", "a") as f:
+    with create_file("existing_site_visit_entries.txt", "a") as f:
         f.write(f"{parent_site_visit_record['id']} -> {jkmr_other_visit["form_values"].get(KEY_NAMES["JKMR"]["treatment_date"], jkmr_other_visit["id"])}\n")
 
     # We don't do any processing here since the site visit entry already exists
@@ -673,18 +747,18 @@ def process_existing_site_visit_entry(
 
 
 def process_site_visit_record_update(
-    site_visit_record: Record, jkmr_other_visits: t.List[RepeatableValue]
+    match_index: SiteVisitMatchIndex,
+    pending_updates: SiteVisitRecordUpdates,
+    site_visit_record: Record,
+    jkmr_other_visits: t.List[RepeatableValue],
 ):
     """
     Processes the update of a site visit record
     """
     for jkmr_other_visit in jkmr_other_visits:
-        # Get the site visit entries
-        site_visit_other_vists = get_site_visit_entries(site_visit_record)
-
         # Find a matching site visit if there is one
-        matching_site_visits = get_matching_site_visits(
-            jkmr_other_visit, site_visit_other_vists
+        matching_site_visits = match_index.get_matching_site_visits(
+            site_visit_record, jkmr_other_visit
         )
 
         processing_type = (
@@ -730,7 +804,9 @@ def process_site_visit_record_update(
 
         # Process depending on process type
         if processing_type == "new_entry":
-            process_new_site_visit_entry(site_visit_record, jkmr_other_visit)
+            process_new_site_visit_entry(
+                pending_updates, site_visit_record, jkmr_other_visit
+            )
         elif processing_type == "existing_entry":
             process_existing_site_visit_entry(
                 jkmr_other_visit, site_visit_record
@@ -745,7 +821,7 @@ def prompt_user_for_record_mapping(record_id: str) -> t.Union[t.Literal["skip"],
     Prompt the user to skip a record or map it to another record ID
     """
     if os.path.exists(os.path.join(os.path.dirname(__file__), "record_mappings.txt")):
-        with open("record_mappings.txt", "r") as f:
+        with create_file("record_mappings.txt", "r") as f:
             record_mappings = f.readlines()
 
             for record_mapping in record_mappings:
@@ -757,7 +833,7 @@ def prompt_user_for_record_mapping(record_id: str) -> t.Union[t.Literal["skip"],
                     return mappings[1].strip()
 
     if os.path.exists(os.path.join(os.path.dirname(__file__), "skip_preferences.txt")):
-        with open("skip_preferences.txt", "r") as f:
+        with create_file("skip_preferences.txt", "r") as f:
             skip_preferences = f.readlines()
 
         if record_id in skip_preferences:
@@ -779,7 +855,7 @@ def prompt_user_for_record_mapping(record_id: str) -> t.Union[t.Literal["skip"],
         logger.info("Skipping record...")
         logger.info("Saving skip preference to file...")
         # Save the skip preference to a file so we can skip this record in future runs
-        with open("skip_preferences.txt", "a") as f:
+        with create_file("skip_preferences.txt", "a") as f:
             f.write(f"{record_id}\n")
 
         return "skip"
@@ -790,16 +866,18 @@ def prompt_user_for_record_mapping(record_id: str) -> t.Union[t.Literal["skip"],
         logger.info(f"Record ID entered: {user_input}")
 
         # Save record mapping to a file
-        with open("record_mappings.txt", "a") as f:
+        with create_file("record_mappings.txt", "a") as f:
             f.write(f"{record_id} -> {user_input}\n")
 
         return user_input
 
 
-def main():
+def main(argv=None):
     """
     Main function of the script.
     """
+    load_dotenv()
+    configure(parser.parse_args(argv))
 
     # Get the apps
     global JKMR_APP
@@ -820,6 +898,10 @@ def main():
     jkmr_records = get_app_records(JKMR_APP)
     site_visit_records = get_app_records(SITE_VISIT_RECORDS_APP)
 
+    # Index the site visit records once so each lookup is constant time
+    match_index = SiteVisitMatchIndex(site_visit_records)
+    pending_updates = SiteVisitRecordUpdates()
+
     for jkmr_record in jkmr_records:
         # Preliminary check to see if the record has any "Other" site visits
         # Get the "other" site visit entries
@@ -834,9 +916,7 @@ def main():
             continue
 
         # Attempt to find a matching record in the new app
-        matching_site_visit_record = find_matching_site_visit_record(
-            jkmr_record, site_visit_records
-        )
+        matching_site_visit_record = match_index.find_record(jkmr_record)
 
         # We should always have a match unless this record hasn't been imported
         # All records should've been transferred over even if there are no "other" site visit entries
@@ -851,10 +931,7 @@ def main():
                 continue
 
             # Get the matching site visit record
-            for site_visit_record in site_visit_records:
-                if site_visit_record["id"] == record_mapping:
-                    matching_site_visit_record = site_visit_record
-                    break
+            matching_site_visit_record = match_index.by_id.get(record_mapping)
 
             if not matching_site_visit_record:
                 logger.error(
@@ -868,9 +945,17 @@ def main():
         )
         logger.debug("Processing the site visit record update")
         process_site_visit_record_update(
-            matching_site_visit_record, jkmr_other_site_visits
+            match_index,
+            pending_updates,
+            matching_site_visit_record,
+            jkmr_other_site_visits,
         )
 
+    match_index.write_collisions()
+
+    # Send one update per site visit record
+    pending_updates.apply()
+
 
 if __name__ == "__main__":
     main()
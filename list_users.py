@@ -1,17 +1,25 @@
-import os
+import argparse
 
-from dotenv import load_dotenv
-from fulcrum import Fulcrum
 from tabulate import tabulate
 
-load_dotenv()
+from fulcrum_helpers.config import get_api_key
+from fulcrum_helpers.transport import Transport
 
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
+parser = argparse.ArgumentParser(description="List the users of the Fulcrum account.")
 
 
-def main():
-    memberships = FULCRUM.memberships.search()["memberships"]
+def main(argv=None):
+    parser.parse_args(argv)
+
+    # A single call, so the SDK isn't needed
+    transport = Transport(get_api_key())
+    resp = transport.request("get", "memberships.json")
+
+    if resp.status_code != 200:
+        print(f"Failed to get users: {resp.status_code}")
+        return
+
+    memberships = resp.json()["memberships"]
 
     rows = [
         [
@@ -3,19 +3,21 @@ Converts site plan PDF attachments in the SITE VISIT RECORDS app into images
 """
 
 import argparse
+import hashlib
 import json
 import logging
 import os
+import queue
 import shutil
+import threading
 import typing as t
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 
 import pymupdf
-import requests
-from dotenv import load_dotenv
 
+from fulcrum_helpers.config import configure_logging, load_env
 from fulcrum_helpers.helpers import FulcrumApp, find_key_code
-
-load_dotenv()
+from fulcrum_helpers.transport import Transport
 
 parser = argparse.ArgumentParser(description="Update records.")
 parser.add_argument(
@@ -27,53 +29,151 @@ parser.add_argument(
 parser.add_argument(
     "--debug", help="Whether we should run in debug mode or not", action="store_true"
 )
-
-args = parser.parse_args()
-
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-# Create the Fulcrum API object
-FULCRUM = FulcrumApp(FULCRUM_API_KEY)
-
-# Logging format of: [LEVEL]::[FUNCTION]::[HH:MM:SS] - [MESSAGE]
-# Where the level is colored based on the level and the rest except from the message is grey
-start = "\033["
-end = "\033[0m"
-colors = {
-    "GREEN": "32m",
-    "ORANGE": "33m",
-    "RED": "31m",
-    "GREY": "90m",
-}
-for color in colors:
-    # Add the start to the color
-    colors[color] = start + colors[color]
-
-logging.addLevelName(logging.DEBUG, f"{colors['GREEN']}DEBUG{colors['GREY']}")  # Green
-logging.addLevelName(logging.INFO, f"{colors['GREEN']}INFO{colors['GREY']}")  # Green
-logging.addLevelName(
-    logging.WARNING, f"{colors['ORANGE']}WARNING{colors['GREY']}"
-)  # Orange
-logging.addLevelName(logging.ERROR, f"{colors['RED']}ERROR{colors['GREY']}")  # Red
-logging.addLevelName(
-    logging.CRITICAL, f"{colors['RED']}CRITICAL{colors['GREY']}"
-)  # Red
-
-# Define the format of the logging
-logging.basicConfig(
-    format=f"%(levelname)s::%(funcName)s::%(asctime)s - {end}%(message)s",
-    datefmt="%H:%M:%S",
+parser.add_argument(
+    "--dpi", type=int, default=72, help="The resolution to render the PDF pages at."
+)
+parser.add_argument(
+    "--format",
+    default="png",
+    choices=["png", "jpg", "jpeg", "pnm", "ppm", "psd"],
+    help="The image format of the rendered pages.",
+)
+parser.add_argument(
+    "--download_workers",
+    type=int,
+    default=8,
+    help="The number of attachments to download at the same time.",
+)
+parser.add_argument(
+    "--render_workers",
+    type=int,
+    default=os.cpu_count(),
+    help="The number of processes used to render the PDF pages.",
+)
+parser.add_argument(
+    "--revalidate",
+    action="store_true",
+    help="Check cached attachments for changes (ETag/size) instead of trusting the attachment ID.",
 )
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
 
-DRY_RUN = args.dry_run
+# Set from the arguments by configure()
+
+FULCRUM_API_KEY = None  # type: str
+FULCRUM = None  # type: FulcrumApp
+
+DRY_RUN = False
+
+
+def configure(args):
+    """
+    Set the API client, the logging and the constants from the parsed arguments
+    """
+    global FULCRUM_API_KEY, FULCRUM, DRY_RUN
+
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    # Create the Fulcrum API object
+    FULCRUM = FulcrumApp(FULCRUM_API_KEY)
+
+    configure_logging()
+
+    logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
+
+    DRY_RUN = args.dry_run
+
+    if DRY_RUN:
+        logger.info("Running in dry run mode. No records will be updated.")
+
+
+# The number of items that can wait between two stages of the pipeline
+QUEUE_SIZE = 64
+# The number of attachment metadata requests that can be in flight at once
+METADATA_WORKERS = 4
+# Marks the end of a queue
+STOP = None
+# Downloaded PDFs and rendered pages are kept here between runs
+CACHE_DIR = "pdf_cache"
+# The number of new cache entries after which the index is saved
+SAVE_EVERY = 25
+
+
+class AttachmentCache:
+    """
+    A persistent cache of the downloaded PDFs and their rendered pages.
 
-if DRY_RUN:
-    logger.info("Running in dry run mode. No records will be updated.")
+    PDFs are stored by the SHA-256 of their content and the index maps each
+    attachment ID to its hash, ETag and size. Rendered pages are stored by
+    (hash, dpi, format) so the same PDF is never downloaded or rendered twice.
+    """
 
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.join(cache_dir, "pdfs"), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, "pages"), exist_ok=True)
+
+        self.index = {}  # type: t.Dict[str, t.Dict[str, t.Any]]
+        self.unsaved = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                self.index = json.load(f)
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        with open(self.index_path + ".part", "w") as f:
+            json.dump(self.index, f)
+        os.replace(self.index_path + ".part", self.index_path)
+        self.unsaved = 0
+
+    def pdf_path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, "pdfs", f"{content_hash}.pdf")
+
+    def pages_dir(self, content_hash: str, dpi: int, image_format: str) -> str:
+        return os.path.join(
+            self.cache_dir, "pages", content_hash, f"{dpi}_{image_format}"
+        )
+
+    def get(self, attachment_id: str) -> t.Optional[t.Dict[str, t.Any]]:
+        """
+        Get the cache entry of an attachment if its PDF is still on disk
+        """
+        with self.lock:
+            entry = self.index.get(attachment_id)
+
+        if entry and os.path.exists(self.pdf_path(entry["sha256"])):
+            return entry
+
+        return None
+
+    def put(self, attachment_id: str, content_hash: str, etag: str, size: int):
+        """
+        Add an attachment to the index, which is saved every SAVE_EVERY entries
+        so that a crash doesn't lose the PDFs downloaded so far
+        """
+        with self.lock:
+            self.index[attachment_id] = {"sha256": content_hash, "etag": etag, "size": size}
+            self.unsaved += 1
+            if self.unsaved >= SAVE_EVERY:
+                self._save()
+
+
+def main(argv=None):
+    load_env()
+    args = parser.parse_args(argv)
+    configure(args)
+
+    # Recreate the pdf_image directory, the cache is kept between runs
+    if os.path.exists("pdf_images"):
+        shutil.rmtree("pdf_images")
+    os.makedirs("pdf_images/original")
+    os.makedirs("pdf_images/processed")
 
-def main():
     # Get the key for the site plan attachments
     sv_app = FULCRUM.get_app("SITE VISIT RECORDS")
     site_plan_key = find_key_code(sv_app["elements"], "site_plans_attachments")
@@ -85,8 +185,8 @@ def main():
 
     logger.info(f"Found {len(sv_records)} records")
 
-    attachment_error_count = 0
-    attachment_urls = {}
+    # Every site plan attachment of every job
+    attachments = []  # type: t.List[t.Tuple[str, str]]
 
     for record in sv_records:
         # Get the site plan attachments
@@ -113,50 +213,288 @@ def main():
             info = {
                 "job_id": job_id,
                 "record_id": record["id"],
+                "attachment_ids": [
+                    sp_attachment["attachment_id"]
+                    for sp_attachment in site_plan_attachments
+                ],
             }
             f.write(json.dumps(info))
 
         for sp_attachment in site_plan_attachments:
+            attachments.append((job_id, sp_attachment["attachment_id"]))
+
+    logger.info(f"Found {len(attachments)} attachments")
+
+    convert_pdfs_to_images(
+        attachments,
+        dpi=args.dpi,
+        image_format=args.format,
+        download_workers=args.download_workers,
+        render_workers=args.render_workers,
+        revalidate=args.revalidate,
+    )
+
+
+def fetch_download_urls(
+    attachments: t.List[t.Tuple[str, str]],
+    cache: AttachmentCache,
+    download_queue: queue.Queue,
+    render_queue: queue.Queue,
+    revalidate: bool = False,
+) -> t.Tuple[int, int]:
+    """
+    Get the download URL of each attachment and queue it for download.
+    Cached attachments are queued for rendering straight away unless they
+    need revalidating.
+    Returns the number of cached attachments and the number of errors.
+    """
+    error_count = 0
+    cached_count = 0
+
+    def fetch(job_id: str, attachment_id: str):
+        attachment = FULCRUM.get_attachment(attachment_id)
+        download_url = attachment["download_url"]
+        logger.debug(f"Download URL: {download_url}")
+        download_queue.put(
+            (job_id, attachment_id, download_url, attachment.get("file_size"))
+        )
+
+    with ThreadPoolExecutor(max_workers=METADATA_WORKERS) as executor:
+        futures = []
+        for job_id, attachment_id in attachments:
+            entry = cache.get(attachment_id)
+
+            # Attachments can't be changed once uploaded so the ID is enough
+            if entry and not revalidate:
+                cached_count += 1
+                render_queue.put((job_id, attachment_id, entry["sha256"]))
+                continue
+
+            futures.append(executor.submit(fetch, job_id, attachment_id))
+
+        for future in futures:
             try:
-                attachment = FULCRUM.get_attachment(sp_attachment["attachment_id"])
-                download_url = attachment["download_url"]
-                logger.debug(f"Download URL: {download_url}")
-
-                attachment_urls[job_id] = download_url
+                future.result()
             except Exception as e:
                 logger.error(f"Error getting attachment: {e}")
-                attachment_error_count += 1
-
-    logger.info(f"Found {len(attachment_urls)} attachments")
-    logger.warning(f"Found {attachment_error_count} errors")
-    logger.debug(f"Attachment URLs: {attachment_urls}")
+                error_count += 1
 
-    convert_pdfs_to_images(attachment_urls)
+    return cached_count, error_count
 
 
-def convert_pdfs_to_images(entries: t.Dict[str, str]):
+def download_pdfs(
+    transport: Transport,
+    cache: AttachmentCache,
+    download_queue: queue.Queue,
+    render_queue: queue.Queue,
+    errors: t.List[str],
+):
     """
-    Convert the PDFs to images
+    Download the queued attachments in chunks and queue them for rendering.
+    Attachments whose ETag and size match the cache are not downloaded again.
     """
+    while True:
+        item = download_queue.get()
+        if item is STOP:
+            break
+
+        job_id, attachment_id, download_url, file_size = item
+
+        try:
+            entry = cache.get(attachment_id)
+
+            headers = {}
+            if entry and entry["etag"] and (file_size is None or file_size == entry["size"]):
+                headers["If-None-Match"] = entry["etag"]
+
+            with transport.request(
+                "get", download_url, headers=headers, stream=True
+            ) as response:
+                if response.status_code == 304:
+                    logger.debug(f"Attachment unchanged for job ID {job_id}")
+                    render_queue.put((job_id, attachment_id, entry["sha256"]))
+                    continue
+
+                response.raise_for_status()
+
+                logger.info(f"Downloading attachment for job ID {job_id}")
+                content_hash = hashlib.sha256()
+                size = 0
+                part_path = os.path.join(
+                    cache.cache_dir, "pdfs", f"{attachment_id}.{threading.get_ident()}.part"
+                )
+                with open(part_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        content_hash.update(chunk)
+                        size += len(chunk)
+                        f.write(chunk)
+
+                digest = content_hash.hexdigest()
+                os.replace(part_path, cache.pdf_path(digest))
+                cache.put(attachment_id, digest, response.headers.get("ETag"), size)
+        except Exception as e:
+            logger.error(f"Error downloading attachment for job ID {job_id}: {e}")
+            errors.append(job_id)
+            continue
 
-    # Recreate the pdf_image directory
-    if os.path.exists("pdf_images"):
-        shutil.rmtree("pdf_images")
-    os.makedirs("pdf_images/original")
-    os.makedirs("pdf_images/processed")
+        render_queue.put((job_id, attachment_id, digest))
 
-    for job_id, download_url in entries.items():
-        logger.info(f"Downloading attachment for job ID {job_id}")
-        response = requests.get(download_url)
-        with open(f"pdf_images/original/{job_id}.pdf", "wb") as f:
-            f.write(response.content)
 
-        # Convert the PDF to an image
-        pdf = pymupdf.open(f"pdf_images/original/{job_id}.pdf")
+def render_pdf(pdf_path: str, pages_dir: str, dpi: int, image_format: str) -> int:
+    """
+    Render each page of a PDF to an image, returns the number of pages.
+    Pages that have already been rendered are not rendered again.
+    """
+    done_path = os.path.join(pages_dir, "done.json")
+    if os.path.exists(done_path):
+        with open(done_path, "r") as f:
+            return json.load(f)["page_count"]
+
+    os.makedirs(pages_dir, exist_ok=True)
+    with pymupdf.open(pdf_path) as pdf:
         for page in pdf:
-            pix = page.get_pixmap()
-            pix.save(f"pdf_images/processed/{job_id}_{page.number}.png")
+            pix = page.get_pixmap(dpi=dpi)
+            pix.save(os.path.join(pages_dir, f"{page.number}.{image_format}"))
+
+        page_count = pdf.page_count
+
+    # Only mark the pages as rendered once they have all been written
+    with open(done_path, "w") as f:
+        json.dump({"page_count": page_count}, f)
+
+    return page_count
+
 
+def link_or_copy(source: str, destination: str):
+    """
+    Hard link a cached file into the output directory, copying it if linking fails
+    """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def convert_pdfs_to_images(
+    attachments: t.List[t.Tuple[str, str]],
+    dpi: int = 72,
+    image_format: str = "png",
+    download_workers: int = 8,
+    render_workers: int | None = None,
+    revalidate: bool = False,
+):
+    """
+    Convert the PDFs to images.
+
+    The attachment metadata is fetched, the PDFs are downloaded and the pages
+    are rendered in separate stages connected by bounded queues, so that all
+    three run at the same time without holding every PDF in memory. Only
+    attachments that are not in the cache are downloaded and rendered.
+    """
+    cache = AttachmentCache()
+    download_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    render_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    download_errors = []
+
+    # The download URLs are pre-signed so the API token is not sent with them
+    transport = Transport(FULCRUM_API_KEY, pool_size=download_workers)
+
+    downloaders = [
+        threading.Thread(
+            target=download_pdfs,
+            args=(transport, cache, download_queue, render_queue, download_errors),
+            daemon=True,
+        )
+        for _ in range(download_workers)
+    ]
+    for downloader in downloaders:
+        downloader.start()
+
+    def fetch():
+        try:
+            fetch_results[0] = fetch_download_urls(
+                attachments, cache, download_queue, render_queue, revalidate
+            )
+        except Exception as e:
+            fetch_errors.append(e)
+        finally:
+            # Always end the queues, otherwise the stages after this wait forever
+            for _ in downloaders:
+                download_queue.put(STOP)
+            for downloader in downloaders:
+                downloader.join()
+            render_queue.put(STOP)
+
+    fetch_results = [(0, 0)]
+    fetch_errors = []
+    fetcher = threading.Thread(target=fetch, daemon=True)
+    fetcher.start()
+
+    render_errors = 0
+    page_count = 0
+    with ProcessPoolExecutor(max_workers=render_workers) as executor:
+        # Limit the renders waiting in the pool so the render queue applies back pressure
+        in_flight = threading.BoundedSemaphore(QUEUE_SIZE)
+        # Each PDF is only rendered once, however many jobs it is attached to
+        renders = {}  # type: t.Dict[str, Future]
+        jobs = []  # type: t.List[t.Tuple[str, str, str]]
+
+        while True:
+            item = render_queue.get()
+            if item is STOP:
+                break
+
+            job_id, attachment_id, content_hash = item
+            jobs.append((job_id, attachment_id, content_hash))
+
+            if content_hash in renders:
+                continue
+
+            in_flight.acquire()
+            future = executor.submit(
+                render_pdf,
+                cache.pdf_path(content_hash),
+                cache.pages_dir(content_hash, dpi, image_format),
+                dpi,
+                image_format,
+            )
+            future.add_done_callback(lambda _: in_flight.release())
+            renders[content_hash] = future
+
+        for job_id, attachment_id, content_hash in jobs:
+            try:
+                pages = renders[content_hash].result()
+            except Exception as e:
+                logger.error(f"Error converting PDF for job ID {job_id}: {e}")
+                render_errors += 1
+                continue
+
+            # Put the PDF and its pages in the output directory
+            output_name = f"{job_id}_{attachment_id}"
+            link_or_copy(
+                cache.pdf_path(content_hash), f"pdf_images/original/{output_name}.pdf"
+            )
+            pages_dir = cache.pages_dir(content_hash, dpi, image_format)
+            for page_number in range(pages):
+                link_or_copy(
+                    os.path.join(pages_dir, f"{page_number}.{image_format}"),
+                    f"pdf_images/processed/{output_name}_{page_number}.{image_format}",
+                )
+            page_count += pages
+
+    fetcher.join()
+    cache.save()
+
+    if fetch_errors:
+        raise fetch_errors[0]
+
+    cached_count, metadata_errors = fetch_results[0]
+    logger.info(
+        f"Converted {len(jobs) - render_errors} PDFs ({page_count} pages, {cached_count} from the cache)"
+    )
+    logger.warning(
+        f"Found {metadata_errors} attachment errors, {len(download_errors)} download errors and {render_errors} conversion errors"
+    )
     logger.info("Finished downloading attachments")
 
 
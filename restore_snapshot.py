@@ -0,0 +1,113 @@
+import argparse
+import os
+
+from fulcrum import Fulcrum
+from tqdm import tqdm
+
+from fulcrum_helpers.config import configure_logging, load_env
+from fulcrum_helpers.schema import SchemaRegistry
+from fulcrum_helpers.snapshot import (Snapshot, SnapshotRestorer, snapshot_app,
+                                      snapshot_path)
+from fulcrum_helpers.transport import Transport, use_transport
+
+parser = argparse.ArgumentParser(
+    description="Snapshot the records of an app or restore records from a snapshot."
+)
+parser.add_argument(
+    "--form_name", "-n", help="The name of the form to snapshot."
+)
+parser.add_argument(
+    "--restore", "-r", help="The snapshot file to restore records from."
+)
+parser.add_argument(
+    "--record_id",
+    "-i",
+    action="append",
+    help="A record to restore, can be given more than once. Defaults to every record.",
+)
+parser.add_argument(
+    "--dry_run",
+    "-d",
+    action="store_true",
+    help="Whether to list the records to restore without restoring them.",
+)
+
+# Set from the arguments by configure()
+
+args = None  # type: argparse.Namespace
+
+FULCRUM_API_KEY = None  # type: str
+TRANSPORT = None  # type: Transport
+FULCRUM = None  # type: Fulcrum
+SCHEMAS = None  # type: SchemaRegistry
+
+
+def configure(parsed_args):
+    """
+    Set the arguments and the API clients
+    """
+    global args, FULCRUM_API_KEY, TRANSPORT, FULCRUM, SCHEMAS
+
+    args = parsed_args
+
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    TRANSPORT = Transport(FULCRUM_API_KEY)
+    FULCRUM = use_transport(Fulcrum(FULCRUM_API_KEY), TRANSPORT)
+    SCHEMAS = SchemaRegistry(TRANSPORT)
+
+
+def take_snapshot():
+    app = SCHEMAS.get_app(args.form_name)
+
+    if not app:
+        print("Form not found")
+        return
+
+    path = snapshot_app(TRANSPORT, app["id"], snapshot_path(app["name"]))
+    print(f"Snapshot written to {path}")
+
+
+def restore_snapshot():
+    snapshot = Snapshot(args.restore)
+    record_ids = args.record_id or snapshot.ids()
+
+    print(f"Records to restore: {len(record_ids)} of {len(snapshot)}")
+
+    if args.dry_run:
+        return
+
+    answer = input(f"Restore {len(record_ids)} records from {args.restore}? (y/n): ")
+    if answer.lower() != "y":
+        print("Exiting...")
+        return
+
+    restorer = SnapshotRestorer(FULCRUM, snapshot)
+    failed = 0
+
+    progress_bar = tqdm(record_ids, desc="Restoring records")
+    for record_id in progress_bar:
+        if restorer.restore(record_id):
+            progress_bar.set_description(f"Restored record: {record_id}")
+        else:
+            failed += 1
+            progress_bar.set_description(f"Failed to restore record: {record_id}")
+    progress_bar.close()
+
+    print(f"Restored {len(record_ids) - failed} records, {failed} failed")
+
+
+def main(argv=None):
+    load_env()
+    configure(parser.parse_args(argv))
+    configure_logging()
+
+    if args.restore:
+        restore_snapshot()
+    elif args.form_name:
+        take_snapshot()
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import logging
+import sys
+
+from fulcrum_helpers.benchmark import (DEFAULT_SIZES, DEFAULT_THRESHOLD,
+                                       DEFAULT_UPLOAD_LIMIT, STAGES,
+                                       PipelineBenchmark, append_history,
+                                       find_regressions, format_results,
+                                       load_baseline, save_baseline)
+from fulcrum_helpers.config import configure_logging
+
+parser = argparse.ArgumentParser(
+    description="Benchmark the pipeline against synthetic exports and a local fake API."
+)
+parser.add_argument(
+    "--sizes",
+    type=int,
+    nargs="+",
+    default=DEFAULT_SIZES,
+    help="The numbers of records to benchmark with.",
+)
+parser.add_argument(
+    "--stages",
+    nargs="+",
+    choices=STAGES,
+    help="The stages to benchmark, all of them by default.",
+)
+parser.add_argument(
+    "--seed", "-s", type=int, default=0, help="The seed of the synthetic exports."
+)
+parser.add_argument(
+    "--upload_limit",
+    type=int,
+    default=DEFAULT_UPLOAD_LIMIT,
+    help="The most records to upload (and scan) at each size.",
+)
+parser.add_argument(
+    "--history",
+    default="benchmark_history.json",
+    help="The file to add the results of each run to.",
+)
+parser.add_argument(
+    "--baseline",
+    default="benchmark_baseline.json",
+    help="The results to compare against.",
+)
+parser.add_argument(
+    "--save_baseline",
+    action="store_true",
+    help="Whether to save the results as the new baseline.",
+)
+parser.add_argument(
+    "--threshold",
+    type=float,
+    default=DEFAULT_THRESHOLD,
+    help="The fraction of extra time or memory over the baseline that is a regression.",
+)
+parser.add_argument(
+    "--work_dir",
+    help="The directory to generate the exports in, a temporary one by default.",
+)
+parser.add_argument(
+    "--keep", action="store_true", help="Whether to keep the exports and stage logs."
+)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+
+    # Only show the progress of fulcrum_helpers
+    configure_logging()
+    logging.getLogger("fulcrum_helpers").setLevel(logging.INFO)
+
+    benchmark = PipelineBenchmark(
+        sizes=args.sizes,
+        stages=args.stages,
+        seed=args.seed,
+        upload_limit=args.upload_limit,
+        work_dir=args.work_dir,
+        keep=args.keep,
+    )
+    run = benchmark.run()
+
+    baseline = load_baseline(args.baseline)
+    append_history(args.history, run)
+
+    print(format_results(run, baseline))
+
+    regressions = []
+    if baseline:
+        regressions = find_regressions(run, baseline, args.threshold)
+    elif not args.save_baseline:
+        print(f"No baseline found at {args.baseline}, run with --save_baseline to save one")
+
+    if args.save_baseline:
+        save_baseline(args.baseline, run)
+        print(f"Saved the results as the baseline in {args.baseline}")
+
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import json
+import logging
+
+from fulcrum_helpers.fake_api import (DEFAULT_RATE_LIMIT,
+                                      DEFAULT_RATE_LIMIT_WINDOW,
+                                      FakeFulcrumServer, FakeFulcrumStore)
+from fulcrum_helpers.transport import API_URL_VARIABLE
+
+parser = argparse.ArgumentParser(
+    description="Run a local stand-in for the Fulcrum API for benchmarks and offline runs."
+)
+parser.add_argument("--host", default="127.0.0.1", help="The host to listen on.")
+parser.add_argument(
+    "--port", "-p", type=int, default=8000, help="The port to listen on."
+)
+parser.add_argument(
+    "--db",
+    default=":memory:",
+    help="The SQLite file to keep the data in, kept in memory by default.",
+)
+parser.add_argument(
+    "--seed",
+    "-s",
+    help='A JSON file of {"forms": [...], "records": [...], "projects": [...], "memberships": [...]} to load.',
+)
+parser.add_argument(
+    "--api_key", help="The only API token to accept, any token is accepted by default."
+)
+parser.add_argument(
+    "--latency", type=float, default=0.0, help="The seconds to delay each request by."
+)
+parser.add_argument(
+    "--jitter",
+    type=float,
+    default=0.0,
+    help="The most seconds the latency varies by either way.",
+)
+parser.add_argument(
+    "--error_rate",
+    type=float,
+    default=0.0,
+    help="The fraction of requests that fail with a server error.",
+)
+parser.add_argument(
+    "--rate_limit",
+    type=int,
+    default=DEFAULT_RATE_LIMIT,
+    help="The calls allowed per API token in each window, 0 for no limit.",
+)
+parser.add_argument(
+    "--rate_limit_window",
+    type=float,
+    default=DEFAULT_RATE_LIMIT_WINDOW,
+    help="The rate limit window in seconds.",
+)
+parser.add_argument(
+    "--no_patch",
+    action="store_true",
+    help="Whether to reject record PATCH requests like an API without them.",
+)
+parser.add_argument(
+    "--random_seed", type=int, help="The seed of the latency and injected errors."
+)
+parser.add_argument(
+    "--verbose", "-v", action="store_true", help="Whether to log every request."
+)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s - %(message)s",
+        datefmt="%H:%M:%S",
+    )
+
+    store = FakeFulcrumStore(args.db)
+    if args.seed:
+        with open(args.seed, "r") as f:
+            store.load(json.load(f))
+
+    server = FakeFulcrumServer(
+        store,
+        host=args.host,
+        port=args.port,
+        api_key=args.api_key,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        rate_limit_window=args.rate_limit_window,
+        supports_patch=not args.no_patch,
+        seed=args.random_seed,
+    )
+
+    print(f"Fake Fulcrum API listening on {server.base_url}")
+    print(f"Point the scripts at it with: {API_URL_VARIABLE}={server.base_url}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    print("Calls:")
+    for call, count in sorted(server.calls.items()):
+        print(f"  {call}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,9 @@ import json
 import logging
 import os
 
-from dotenv import load_dotenv
 from fulcrum import Fulcrum
 
-load_dotenv()
+from fulcrum_helpers.config import configure_logging, load_env
 
 parser = argparse.ArgumentParser(description="Save a record to Fulcrum.")
 parser.add_argument("--record", "-r", help="The record file.")
@@ -15,55 +14,39 @@ parser.add_argument(
 )
 parser.add_argument("--debug", help="Print debug statements", action="store_true")
 
-args = parser.parse_args()
-
-start = "\033["
-end = "\033[0m"
-colors = {
-    "GREEN": "32m",
-    "ORANGE": "33m",
-    "RED": "31m",
-    "GREY": "90m",
-}
-for color in colors:
-    # Add the start to the color
-    colors[color] = start + colors[color]
-
-
-logging.addLevelName(logging.DEBUG, f"{colors['GREEN']}DEBUG{colors['GREY']}")  # Green
-logging.addLevelName(logging.INFO, f"{colors['GREEN']}INFO{colors['GREY']}")  # Green
-logging.addLevelName(
-    logging.WARNING, f"{colors['ORANGE']}WARNING{colors['GREY']}"
-)  # Orange
-logging.addLevelName(logging.ERROR, f"{colors['RED']}ERROR{colors['GREY']}")  # Red
-logging.addLevelName(
-    logging.CRITICAL, f"{colors['RED']}CRITICAL{colors['GREY']}"
-)  # Red
-
-# Define the format of the logging
-logging.basicConfig(
-    format=f"%(levelname)s::%(funcName)s::%(asctime)s - {end}%(message)s",
-    datefmt="%H:%M:%S",
-)
-
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
 
-# Constants
+# Constants, set from the arguments by configure()
+
+RECORD = None  # type: str
+FORM_NAME = None  # type: str
+
+FULCRUM_API_KEY = None  # type: str
+FULCRUM = None  # type: Fulcrum
+
 
-RECORD = args.record
-FORM_NAME = args.form_name
+def configure(args):
+    """
+    Set the constants and the API client from the parsed arguments
+    """
+    global RECORD, FORM_NAME, FULCRUM_API_KEY, FULCRUM
 
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
+    configure_logging()
+    logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
 
-if not RECORD or not os.path.exists(RECORD):
-    logger.info("No record file provided.")
-    exit(1)
+    RECORD = args.record
+    FORM_NAME = args.form_name
 
-if not FORM_NAME:
-    logger.info("No form ID provided.")
-    exit(1)
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    FULCRUM = Fulcrum(FULCRUM_API_KEY)
+
+    if not RECORD or not os.path.exists(RECORD):
+        logger.info("No record file provided.")
+        exit(1)
+
+    if not FORM_NAME:
+        logger.info("No form ID provided.")
+        exit(1)
 
 
 def list_apps():
@@ -79,7 +62,10 @@ def get_app(name: str):
             return app
 
 
-def main():
+def main(argv=None):
+    load_env()
+    configure(parser.parse_args(argv))
+
     record_json = None
 
     app = get_app(FORM_NAME)
@@ -88,7 +74,7 @@ def main():
         logger.error("App not found.")
         exit(1)
 
-    with open(args.record) as json_file:
+    with open(RECORD) as json_file:
         record_json = json.load(json_file)["record"]
 
     if not record_json:
@@ -29,32 +29,25 @@ parser.add_argument("--transform_type", type=str, help="Transform type", require
 parser.add_argument("--survey_dir", type=str, help="Survey directory")
 parser.add_argument("--survey_dir_prefix", type=str, help="Survey directory prefix")
 
-args = parser.parse_args()
 
+# Constants, set from the arguments by configure()
 
-# Constants
+PARENT_DIR = None  # type: str
+BASE_PARENT_DIR = None  # type: str
 
-PARENT_DIR = args.parent_dir
-BASE_PARENT_DIR = f"new_files\\{PARENT_DIR}"
+TARGET_DIR = None  # type: str
+TARGET_PREFIX = None  # type: str
 
-TARGET_DIR = args.target_dir
-TARGET_PREFIX = args.target_prefix
+SURVEY_DIR = None  # type: str | None
+SURVEY_DIR_PREFIX = None  # type: str | None
 
-SURVEY_DIR = args.survey_dir
-SURVEY_DIR_PREFIX = args.survey_dir_prefix
+CLIENT_NAME_COL = None  # type: str
+ACC_REF_COL = None  # type: str | None
+HAS_SITE_LOCATION_LINK = False
 
-CLIENT_NAME_COL = args.client_name_col
-ACC_REF_COL = args.acc_ref_col
-HAS_SITE_LOCATION_LINK = args.has_site_location_link
+SITE_LOCATION_FILE = None  # type: str
 
-if not HAS_SITE_LOCATION_LINK and not ACC_REF_COL:
-    raise Exception(
-        "Missing account reference column, please set --acc_ref_col or --has_site_location_link"
-    )
-
-SITE_LOCATION_FILE = args.site_location_file
-
-TRANSFORM_TYPE = args.transform_type
+TRANSFORM_TYPE = None  # type: str
 
 # Structure: Repeatble -> target field key in old app -> value: new value
 TRANSFORMATIONS = {
@@ -110,60 +103,99 @@ DEFAULT_BASE_COLS = {
     "job_type": lambda row: "Treatment",
 }
 
-DEFAULT_SV_SV_COLS = {
-    "visit_category": lambda row: "Japanese Knotweed Management Record"
-    if PARENT_DIR != "IPMR_SV"
-    else "Invasive Plants Management Record",
-    **(
-        {
-            "record_type_japanese_knotweed": lambda row: row[
-                "record_type_japanese_knotweed"
-            ]
-            if "record_type_japanese_knotweed" in row
-            else "Herbicide Application & Monitoring Record"
-        }
-        if PARENT_DIR != "IPMR_SV"
-        else {}
-    ),
-    **(
-        {
-            "record_type_invasive_plants": lambda row: row[
-                "record_type_invasive_plants"
-            ]
-            if "record_type_invasive_plants" in row
-            else "Herbicide Application"
-        }
-        if PARENT_DIR == "IPMR_SV"
-        else {}
-    ),
-    **(
-        {
-            "visit_type_japanese_knotweed_application_monitoring": lambda row: row[
-                "visit_type"
-            ]
-            if row["visit_type"] != "Site Monitoring Observations & Recommendations"
-            else "Scheduled Monitoring"
-        }
-        if PARENT_DIR != "IPMR_SV"
-        else {}
-    ),
-    **(
-        {
-            # This won't match up exactly but the data will still be there.
-            # This can be fixed on manual edits
-            "visit_type_invasive_plants_application": lambda row: row["service_type"]
-            if row["service_type"] != "Monitoring visit"
-            else "Scheduled Monitoring"
-        }
-        if PARENT_DIR == "IPMR_SV"
-        else {}
-    ),
-}
+# Depend on the parent directory, set by configure()
+DEFAULT_SV_SV_COLS = {}
+
+
+def get_default_sv_sv_cols(parent_dir):
+    """Get the default columns of the service visits of a parent directory"""
+    return {
+        "visit_category": lambda row: "Japanese Knotweed Management Record"
+        if parent_dir != "IPMR_SV"
+        else "Invasive Plants Management Record",
+        **(
+            {
+                "record_type_japanese_knotweed": lambda row: row[
+                    "record_type_japanese_knotweed"
+                ]
+                if "record_type_japanese_knotweed" in row
+                else "Herbicide Application & Monitoring Record"
+            }
+            if parent_dir != "IPMR_SV"
+            else {}
+        ),
+        **(
+            {
+                "record_type_invasive_plants": lambda row: row[
+                    "record_type_invasive_plants"
+                ]
+                if "record_type_invasive_plants" in row
+                else "Herbicide Application"
+            }
+            if parent_dir == "IPMR_SV"
+            else {}
+        ),
+        **(
+            {
+                "visit_type_japanese_knotweed_application_monitoring": lambda row: row[
+                    "visit_type"
+                ]
+                if row["visit_type"] != "Site Monitoring Observations & Recommendations"
+                else "Scheduled Monitoring"
+            }
+            if parent_dir != "IPMR_SV"
+            else {}
+        ),
+        **(
+            {
+                # This won't match up exactly but the data will still be there.
+                # This can be fixed on manual edits
+                "visit_type_invasive_plants_application": lambda row: row["service_type"]
+                if row["service_type"] != "Monitoring visit"
+                else "Scheduled Monitoring"
+            }
+            if parent_dir == "IPMR_SV"
+            else {}
+        ),
+    }
 
 
 # Functions
 
 
+def configure(args):
+    """
+    Set the constants from the parsed arguments
+    """
+    global PARENT_DIR, BASE_PARENT_DIR, TARGET_DIR, TARGET_PREFIX, SURVEY_DIR
+    global SURVEY_DIR_PREFIX, CLIENT_NAME_COL, ACC_REF_COL, HAS_SITE_LOCATION_LINK
+    global SITE_LOCATION_FILE, TRANSFORM_TYPE, DEFAULT_SV_SV_COLS
+
+    PARENT_DIR = args.parent_dir
+    BASE_PARENT_DIR = os.path.join("new_files", PARENT_DIR)
+
+    TARGET_DIR = args.target_dir
+    TARGET_PREFIX = args.target_prefix
+
+    SURVEY_DIR = args.survey_dir
+    SURVEY_DIR_PREFIX = args.survey_dir_prefix
+
+    CLIENT_NAME_COL = args.client_name_col
+    ACC_REF_COL = args.acc_ref_col
+    HAS_SITE_LOCATION_LINK = args.has_site_location_link
+
+    if not HAS_SITE_LOCATION_LINK and not ACC_REF_COL:
+        raise Exception(
+            "Missing account reference column, please set --acc_ref_col or --has_site_location_link"
+        )
+
+    SITE_LOCATION_FILE = args.site_location_file
+
+    TRANSFORM_TYPE = args.transform_type
+
+    DEFAULT_SV_SV_COLS = get_default_sv_sv_cols(PARENT_DIR)
+
+
 def read_csv(file_path):
     """Read a csv file and return a list of rows"""
     with open(file_path, "r") as f:
@@ -197,13 +229,15 @@ def transform(diff_dir_name, target_csv_name):
     is_survey_transform = TRANSFORM_TYPE == "survey"
     is_site_visits_transform = TRANSFORM_TYPE == "site_visits"
 
-    diff = read_csv(f"{BASE_PARENT_DIR}\\differences\\{diff_dir_name}\\differences.csv")
+    diff = read_csv(
+        os.path.join(BASE_PARENT_DIR, "differences", diff_dir_name, "differences.csv")
+    )
     cols = [f["Column"] for f in diff]
 
     data = read_csv(
-        f"{TARGET_DIR}\\{TARGET_PREFIX}_{target_csv_name}.csv"
+        os.path.join(TARGET_DIR, f"{TARGET_PREFIX}_{target_csv_name}.csv")
         if target_csv_name != "base"
-        else f"{TARGET_DIR}\\{TARGET_PREFIX}.csv"
+        else os.path.join(TARGET_DIR, f"{TARGET_PREFIX}.csv")
     )
 
     new_cols = list(data[0].keys() if len(data) > 0 else [])
@@ -298,7 +332,9 @@ def transform(diff_dir_name, target_csv_name):
                     row[k] = TRANSFORMATIONS[PARENT_DIR][diff_dir_name][k][v]
 
     with open(
-        f"{BASE_PARENT_DIR}\\new_records\\{diff_dir_name}.csv", "w", newline=""
+        os.path.join(BASE_PARENT_DIR, "new_records", f"{diff_dir_name}.csv"),
+        "w",
+        newline="",
     ) as f:
         headers = []
 
@@ -365,23 +401,28 @@ def get_file_mapping(dir_name):
     return dir_name
 
 
-# Main
+def main(argv=None):
+    configure(parser.parse_args(argv))
 
-if TRANSFORM_TYPE not in ["survey", "site_visits"]:
-    raise Exception("Invalid transform type")
+    if TRANSFORM_TYPE not in ["survey", "site_visits"]:
+        raise Exception("Invalid transform type")
 
-if TRANSFORM_TYPE == "site_visits" and not (SURVEY_DIR and SURVEY_DIR_PREFIX):
-    raise Exception(
-        "Missing survey export params, please set --survey_dir and --survey_dir_prefix"
-    )
+    if TRANSFORM_TYPE == "site_visits" and not (SURVEY_DIR and SURVEY_DIR_PREFIX):
+        raise Exception(
+            "Missing survey export params, please set --survey_dir and --survey_dir_prefix"
+        )
+
+    clear_and_create_dir(os.path.join(BASE_PARENT_DIR, "new_records"))
+
+    for diff_dir_name in get_dirs(os.path.join(BASE_PARENT_DIR, "differences")):
+        if diff_dir_name.startswith("NO_MATCH_"):
+            continue
 
-clear_and_create_dir(f"{BASE_PARENT_DIR}\\new_records")
+        target_csv_name = get_file_mapping(diff_dir_name)
+        transform(diff_dir_name, target_csv_name)
 
-for diff_dir_name in get_dirs(f"{BASE_PARENT_DIR}\\differences"):
-    if diff_dir_name.startswith("NO_MATCH_"):
-        continue
+    print("Success")
 
-    target_csv_name = get_file_mapping(diff_dir_name)
-    transform(diff_dir_name, target_csv_name)
 
-print("Success")
+if __name__ == "__main__":
+    main()
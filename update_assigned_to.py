@@ -1,12 +1,14 @@
 import argparse
 import os
-import time
 
-from dotenv import load_dotenv
 from fulcrum import Fulcrum
 from tqdm import tqdm
 
-load_dotenv()
+from fulcrum_helpers.config import load_env
+from fulcrum_helpers.patch import RecordPatcher
+from fulcrum_helpers.resilience import ResilientWriter
+from fulcrum_helpers.snapshot import snapshot_path, write_snapshot
+from fulcrum_helpers.transport import Transport
 
 parser = argparse.ArgumentParser(
     description="Update the 'assigned_to_id' field on all records in a Fulcrum app."
@@ -27,51 +29,55 @@ parser.add_argument(
     help="Preview changes without applying them.",
 )
 
-args = parser.parse_args()
+# Constants, set from the arguments by configure()
 
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
+FULCRUM_API_KEY = None  # type: str
+FULCRUM = None  # type: Fulcrum
+PATCHER = None  # type: RecordPatcher
 
-APP_ID = args.app_id
-USER_ID = args.user_id
-USER_NAME = args.user_name
-DRY_RUN = args.dry_run
+APP_ID = None  # type: str
+USER_ID = None  # type: str
+USER_NAME = None  # type: str
+DRY_RUN = False
 
 
-def rate_limited(max_per_second):
-    minimum_interval = 1.0 / float(max_per_second)
+def configure(args):
+    """
+    Set the constants and the API clients from the parsed arguments
+    """
+    global FULCRUM_API_KEY, FULCRUM, PATCHER, APP_ID, USER_ID, USER_NAME, DRY_RUN
 
-    def decorate(func):
-        last_time_called = [0.0]
-
-        def rate_limited_function(*args, **kargs):
-            elapsed = time.perf_counter() - last_time_called[0]
-            left_to_wait = minimum_interval - elapsed
-            if left_to_wait > 0:
-                time.sleep(left_to_wait)
-            ret = func(*args, **kargs)
-            last_time_called[0] = time.perf_counter()
-            return ret
-
-        return rate_limited_function
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    FULCRUM = Fulcrum(FULCRUM_API_KEY)
+    # Only the assignment is sent, not the whole record
+    PATCHER = RecordPatcher(
+        Transport(FULCRUM_API_KEY),
+        ResilientWriter(dead_letter_path="update_assigned_to_dead_letter.jsonl"),
+    )
 
-    return decorate
+    APP_ID = args.app_id
+    USER_ID = args.user_id
+    USER_NAME = args.user_name
+    DRY_RUN = args.dry_run
 
 
-def update_record(record_id: str, record: dict):
+def update_record(original: dict, record: dict):
     if DRY_RUN:
         return False
 
-    updated = FULCRUM.records.update(record_id, {"record": record})
+    updated = PATCHER.update(original, record)
 
-    if "errors" in updated.get("record", {}):
-        print(f"Error updating record {record_id}: {updated['record']['errors']}")
-        exit(1)
+    if updated is None:
+        print(f"Error updating record {original['id']}, see the dead letter file")
+        return False
 
     return True
 
 
-def main():
+def main(argv=None):
+    load_env()
+    configure(parser.parse_args(argv))
+
     if DRY_RUN:
         print("[DRY RUN] No changes will be made.\n")
 
@@ -91,16 +97,25 @@ def main():
         print("No records require updating.")
         return
 
+    if not DRY_RUN:
+        path = write_snapshot(
+            records_to_update, snapshot_path(f"assigned_to_{APP_ID}"), form_id=APP_ID
+        )
+        print(f"Snapshot of the records to update written to {path}")
+
     progress_bar = tqdm(
         records_to_update, total=len(records_to_update), desc="Updating records"
     )
 
     updated_count = 0
     for record in progress_bar:
-        record["assigned_to_id"] = USER_ID
-        record["assigned_to"] = USER_NAME
+        updated_record = {
+            **record,
+            "assigned_to_id": USER_ID,
+            "assigned_to": USER_NAME,
+        }
 
-        was_updated = update_record(record["id"], record)
+        was_updated = update_record(record, updated_record)
 
         if was_updated:
             updated_count += 1
@@ -1,14 +1,20 @@
 import argparse
 import copy
-import json
 import os
-import time
 
-from dotenv import load_dotenv
 from fulcrum import Fulcrum
 from tqdm import tqdm
 
-load_dotenv()
+from fulcrum_helpers.config import configure_logging, load_env
+from fulcrum_helpers.helpers import iter_record_pages
+from fulcrum_helpers.choices import ChoiceNormalizer, normalize_record
+from fulcrum_helpers.incremental import IncrementalState, ruleset_hash
+from fulcrum_helpers.patch import RecordPatcher
+from fulcrum_helpers.record_index import ID_MAPPING_PATTERN, RecordIndex
+from fulcrum_helpers.resilience import ResilientWriter
+from fulcrum_helpers.schema import SchemaRegistry
+from fulcrum_helpers.snapshot import snapshot_path, write_snapshot
+from fulcrum_helpers.transport import Transport, use_transport
 
 parser = argparse.ArgumentParser(description="Update records.")
 parser.add_argument(
@@ -20,22 +26,50 @@ parser.add_argument(
     action="store_true",
     help="Whether to run the script without updating records.",
 )
+parser.add_argument(
+    "--incremental",
+    "-i",
+    action="store_true",
+    help="Whether to only process the records that have changed since the last incremental run.",
+)
 
-args = parser.parse_args()
+# Set from the arguments by configure()
 
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
+FULCRUM_API_KEY = None  # type: str
+TRANSPORT = None  # type: Transport
+FULCRUM = None  # type: Fulcrum
+SCHEMAS = None  # type: SchemaRegistry
+WRITER = None  # type: ResilientWriter
+PATCHER = None  # type: RecordPatcher
 
-FORM_NAME = args.form_name
-DRY_RUN = args.dry_run
+FORM_NAME = None  # type: str
+DRY_RUN = False
+INCREMENTAL = False
 
 
-def update_name_mappings(existing_record: dict):
+def configure(args):
     """
-    UPDATE: "Personnel details & qualifications" (key: "385f")
-    Wihin repeatable "Service Visit Records" (key: "3bdb")
+    Set the API clients and the constants from the parsed arguments
     """
-    name_mappings = {
+    global FULCRUM_API_KEY, TRANSPORT, FULCRUM, SCHEMAS, WRITER, PATCHER
+    global SURVEY_RECORDS, FORM_NAME, DRY_RUN, INCREMENTAL
+
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    TRANSPORT = Transport(FULCRUM_API_KEY)
+    FULCRUM = use_transport(Fulcrum(FULCRUM_API_KEY), TRANSPORT)
+    SCHEMAS = SchemaRegistry(TRANSPORT)
+    WRITER = ResilientWriter(dead_letter_path="update_records_dead_letter.jsonl")
+    PATCHER = RecordPatcher(TRANSPORT, WRITER)
+    SURVEY_RECORDS = RecordIndex(TRANSPORT, "SURVEY", SCHEMAS)
+
+    FORM_NAME = args.form_name
+    DRY_RUN = args.dry_run
+    INCREMENTAL = args.incremental
+
+
+# "Personnel details & qualifications" aliases, a name of None removes the alias
+NAME_NORMALIZER = ChoiceNormalizer(
+    aliases={
         "Jon Barton. CSJK. PCAQT. NPTC 499877, PA1 PA6AW": [
             '"Jon Barton. CSJK. PCAQT. NPTC 499877 (PA1',
             "Jon Barton",
@@ -64,71 +98,27 @@ def update_name_mappings(existing_record: dict):
         "James Erlam PA1 PA6 NPTC 88233": ["James Erlam"],
         None: [' PA6A)"', ' PA6/AW)"', " PA1 PA6", " NPTC 88233"],
     }
+)
 
-    if (
-        "3bdb" not in existing_record["form_values"]
-        or not existing_record["form_values"]["3bdb"]
-    ):
-        return False, existing_record
-
-    repeatable = existing_record["form_values"]["3bdb"]
-
-    for entry in repeatable:
-        if "385f" not in entry["form_values"] or not entry["form_values"]["385f"]:
-            continue
-
-        selected_values_object = entry["form_values"]["385f"]
-        updated_selected_values_object = copy.deepcopy(selected_values_object)
-
-        for choice_value_object in [
-            updated_selected_values_object["choice_values"],
-            updated_selected_values_object["other_values"],
-        ]:
-            for i, choice in enumerate(choice_value_object):
-                for key, value in name_mappings.items():
-                    if choice in value:
-                        choice_value_object[i] = key
-                        break
-
-        # Delete all values that equal None
-        updated_selected_values_object["choice_values"] = [
-            value for value in updated_selected_values_object["choice_values"] if value
-        ]
-        updated_selected_values_object["other_values"] = [
-            value for value in updated_selected_values_object["other_values"] if value
-        ]
-        print(
-            "Changing: "
-            + str(selected_values_object)
-            + " to: "
-            + str(updated_selected_values_object)
-        )
-
-        # Replace the existing selected values object with the updated one
-        entry["form_values"]["385f"] = updated_selected_values_object
-
-    return True, existing_record
-
-
-SURVEY_RECORDS = []
 
+def update_name_mappings(existing_record: dict):
+    """
+    UPDATE: "Personnel details & qualifications" (key: "385f")
+    Wihin repeatable "Service Visit Records" (key: "3bdb")
+    """
+    change = normalize_record(existing_record, ["3bdb"], "385f", NAME_NORMALIZER)
 
-def get_record_from_survey_app(id: str):
-    global SURVEY_RECORDS
-    # Get the record from the "SURVEY" app (id: "8d430ae2-64cc-4b27-9b57-259afdbd8858")
-    if len(SURVEY_RECORDS) == 0:
-        SURVEY_RECORDS = FULCRUM.records.search(
-            url_params={"form_id": "8d430ae2-64cc-4b27-9b57-259afdbd8858"}
-        )["records"]
+    if not change:
+        return False, existing_record
 
-    for record in SURVEY_RECORDS:
-        if record["id"] == id:
-            return record
+    for before, after in change.changes:
+        print("Changing: " + str(before) + " to: " + str(after))
 
-    return None
+    return True, change.updated
 
 
-OLD_TO_NEW_MAPPING = None
+# The records of the "SURVEY" app, fetched on the first lookup
+SURVEY_RECORDS = None  # type: RecordIndex
 
 
 def update_survey_record_links(existing_record: dict):
@@ -140,12 +130,10 @@ def update_survey_record_links(existing_record: dict):
     1. Find the ID value for the "Survey Record Links"
     1. Check if the ID exists within the records for the "SURVEY" app
     1. If they do exist then don't perform any updates
-    1. If they don't exist then check the "old_to_new_maping_IPMR.json" file for an ID mapping
+    1. If they don't exist then check the "old_to_new_id_mapping_*.json" files for an ID mapping
     1. If there is not a mapping, then throw an error
     1. If there is a mapping, then update the ID value
     """
-    global OLD_TO_NEW_MAPPING
-
     # Get the ID value for the "Survey Record Links" field
     survey_record_links_id = None
     if "96e4" in existing_record["form_values"]:
@@ -166,26 +154,16 @@ def update_survey_record_links(existing_record: dict):
 
     survey_record_link_id = survey_record_links_id[0]["record_id"]
 
-    does_record_exist_in_survey_app = bool(
-        get_record_from_survey_app(survey_record_link_id)
-    )
+    resolution = SURVEY_RECORDS.resolve([survey_record_link_id])
 
-    if does_record_exist_in_survey_app:
+    if resolution.existing:
         print("Record already exists in survey app")
         # No update required
         return False, existing_record
 
-    # Check if there is a mapping for this ID
-    if OLD_TO_NEW_MAPPING is None:
-        with open("old_to_new_id_mapping_IPMR.json") as f:
-            OLD_TO_NEW_MAPPING = json.load(f)
-
-        with open("old_to_new_id_mapping_S.json") as f:
-            OLD_TO_NEW_MAPPING.update(json.load(f))
-
-    if survey_record_link_id not in OLD_TO_NEW_MAPPING:
+    if resolution.missing:
         print(
-            f"Could not find a mapping for ID: {survey_record_link_id} in 'old_to_new_id_mapping_IPMR.json' or 'old_to_new_id_mapping_S.json'"
+            f"Could not find a mapping for ID: {survey_record_link_id} in '{ID_MAPPING_PATTERN}'"
         )
         with open("missing_mapping.txt", "a") as f:
             f.write(f"{survey_record_link_id}\n")
@@ -193,7 +171,7 @@ def update_survey_record_links(existing_record: dict):
 
     # Update the ID value
     print("Updating survey record link ID value")
-    existing_record["form_values"]["96e4"][0]["record_id"] = OLD_TO_NEW_MAPPING[
+    existing_record["form_values"]["96e4"][0]["record_id"] = resolution.remapped[
         survey_record_link_id
     ]
 
@@ -264,49 +242,34 @@ def get_app_records_by_app_name(app_name: str):
     return FULCRUM.records.search(url_params={"form_id": app["id"]})["records"]
 
 
+# =====================
+# The rules applied to each record, in order
+# Add your custom logic here
+# =====================
+RULES = [
+    # update_name_mappings,
+    # update_survey_record_links,
+    # update_repeatable_titles,
+]
+
+
 def get_updated_record(existing_record: dict):
-    # =====================
-    # This function is where you can update the record mappings
-    # Provide your custom logic here
-    # =====================
     updated = False
 
-    # updated, existing_record = update_name_mappings(existing_record)
-    # updated, existing_record = update_survey_record_links(existing_record)
-    # updated, existing_record = update_repeatable_titles(existing_record)
+    for rule in RULES:
+        rule_updated, existing_record = rule(existing_record)
+        updated = updated or rule_updated
 
     return updated, existing_record
 
 
-def rate_limited(max_per_second):
+def update_record(original: dict, record: dict):
     """
-    Decorator to limit the rate of function calls.
+    Send the changes made to a record, the patcher is rate limited
     """
-    minimum_interval = 1.0 / float(max_per_second)
-
-    def decorate(func):
-        last_time_called = [0.0]
-
-        def rate_limited_function(*args, **kargs):
-            elapsed = time.perf_counter() - last_time_called[0]
-            left_to_wait = minimum_interval - elapsed
-            if left_to_wait > 0:
-                time.sleep(left_to_wait)
-            ret = func(*args, **kargs)
-            last_time_called[0] = time.perf_counter()
-            return ret
-
-        return rate_limited_function
-
-    return decorate
-
-
-# Rate limited for 4000 calls per hour (actual limit is 5000/h but we want to be safe)
-@rate_limited(4000 / 3600)
-def update_record(id: str, record: dict):
     if not DRY_RUN:
-        FULCRUM.records.update(id, record)
-        return True
+        # The updated record, or None if the update failed
+        return PATCHER.update(original, record)
     else:
         return False
 
@@ -342,7 +305,25 @@ def get_app(name: str):
             return app
 
 
-def main():
+def fetch_record(record_id: str):
+    """
+    Get a record by ID, None if it has been deleted
+    """
+    resp = TRANSPORT.request("get", f"records/{record_id}.json")
+
+    if resp.status_code == 404:
+        return None
+
+    resp.raise_for_status()
+    return resp.json()["record"]
+
+
+def main(argv=None):
+    load_env()
+    configure(parser.parse_args(argv))
+
+    configure_logging()
+
     # If the app name is not passed, list all apps and get the user to select one
     app = None
     if not FORM_NAME:
@@ -354,8 +335,42 @@ def main():
     # Get the form ID
     form_id = app["id"]
 
+    state = None
+    params = {}
+    if INCREMENTAL:
+        state = IncrementalState(
+            f".update_records_state_{form_id}.json", ruleset_hash(RULES)
+        )
+        if state.updated_since() is not None:
+            params["updated_since"] = state.updated_since()
+
     # Get the records for the form
-    records = FULCRUM.records.search(url_params={"form_id": form_id})["records"]
+    records = [
+        record
+        for page in iter_record_pages(TRANSPORT, form_id, **params)
+        for record in page
+    ]
+
+    if state:
+        # Failed records are processed again even if they haven't changed
+        for record_id in state.failed_since_last_run(
+            record["id"] for record in records
+        ):
+            record = fetch_record(record_id)
+            if record:
+                records.append(record)
+            else:
+                state.failed.discard(record_id)
+
+        fetched_count = len(records)
+        records = [record for record in records if not state.is_processed(record)]
+        print(
+            f"Processing {len(records)} changed records ({fetched_count - len(records)} already processed)"
+        )
+
+    if not DRY_RUN:
+        path = write_snapshot(records, snapshot_path(app["name"]), form_id=form_id)
+        print(f"Snapshot of the records written to {path}")
 
     progress_bar = tqdm(
         records,
@@ -365,23 +380,37 @@ def main():
 
     # Loop for each key/value pair in the record mappings
     for record in progress_bar:
+        version = record["version"]
+        # The rules change the record in place
+        original = copy.deepcopy(record) if RULES else record
         updated, updated_record = get_updated_record(record)
         if not updated:
+            if state:
+                state.mark(record["id"], version)
             continue
 
-        update_made = update_record(updated_record["id"], {"record": updated_record})
+        update_made = update_record(original, updated_record)
         if update_made:
+            if state:
+                # The update creates a new version which doesn't need processing
+                state.mark(updated_record["id"], update_made["record"]["version"])
             progress_bar.set_description(f"Updated record: {updated_record['id']}")
         elif DRY_RUN and not update_made:
             progress_bar.set_description(
                 f"Would have updated record: {updated_record['id']}"
             )
         else:
+            if state:
+                state.mark_failed(updated_record["id"])
             progress_bar.set_description(
                 f"Failed to update record: {updated_record['id']}"
             )
 
     progress_bar.close()
+
+    if state and not DRY_RUN:
+        state.save()
+
     print("Finished updating records")
 
 
@@ -6,21 +6,12 @@ import os
 import re
 import time
 
-from deepdiff import DeepDiff
 from dotenv import load_dotenv
 from fulcrum import Fulcrum
 from tqdm import tqdm
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)-8s %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
-
 logger = logging.getLogger(__name__)
 
-load_dotenv()
-
 parser = argparse.ArgumentParser(description="Update records.")
 parser.add_argument(
     "--dry_run",
@@ -28,16 +19,40 @@ parser.add_argument(
     action="store_true",
     help="Whether to run the script without updating records.",
 )
+parser.add_argument(
+    "--replay",
+    "-r",
+    help="Apply the confirmed patches from a record_patches.jsonl file to the current records instead of matching the legacy records.",
+)
+
+# Set from the arguments by configure()
+
+FULCRUM_API_KEY = None  # type: str
+FULCRUM = None  # type: Fulcrum
+
+DRY_RUN = False
 
-args = parser.parse_args()
 
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
+def configure(args):
+    """
+    Set up the logging, the API client and the constants from the parsed
+    arguments
+    """
+    global FULCRUM_API_KEY, FULCRUM, DRY_RUN
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)-8s %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
 
-DRY_RUN = args.dry_run
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    FULCRUM = Fulcrum(FULCRUM_API_KEY)
 
-if DRY_RUN:
-    logger.info("Running in dry run mode. No records will be updated.")
+    DRY_RUN = args.dry_run
+
+    if DRY_RUN:
+        logger.info("Running in dry run mode. No records will be updated.")
 
 
 def get_records(form_name: str):
@@ -65,95 +80,126 @@ def do_values_match(val_1, val_2):
         return False
 
 
-def does_site_address_match(site_address_1, site_address_2):
-    """Check if two site addresses match."""
-    keys_to_check = [
-        "sub_thoroughfare",
-        "thoroughfare",
-        "postal_code",
-        "locality",
-        "country",
-        "sub_admin_area",
-        "suite",
-    ]
+# The address fields that have to match for two site addresses to be the same
+SITE_ADDRESS_KEYS = [
+    "sub_thoroughfare",
+    "thoroughfare",
+    "postal_code",
+    "locality",
+    "country",
+    "sub_admin_area",
+    "suite",
+]
 
-    if not site_address_1 and not site_address_2:
-        return True
-    elif not site_address_1 or not site_address_2:
-        return False
 
-    for key in keys_to_check:
-        if not do_values_match(site_address_1[key], site_address_2[key]):
-            return False
+def get_site_address_key(site_address):
+    """Get a hashable key for a site address, falsy values are treated as equal."""
+    if not site_address:
+        return None
 
-    return True
+    return tuple(site_address.get(key) or None for key in SITE_ADDRESS_KEYS)
 
 
-def load_user_mapping():
-    """Load the user mapping file."""
-    if not os.path.exists("user_mapping.json"):
-        with open("user_mapping.json", "w") as f:
-            f.write("{}")
+def get_record_match_key(pba_ref, site_address):
+    """Get the key that a legacy and current record are matched on."""
+    return (pba_ref or None, get_site_address_key(site_address))
 
-    user_mapping = {}
-    with open("user_mapping.json", "r") as f:
-        # Mappings are a dict where a legacy record ID points to a
-        # current record ID
-        user_mapping = json.load(f)
 
-    return user_mapping
+class RecordMatcher:
+    """
+    Matches legacy records to current records.
 
+    The current records are indexed by ID and by (pba ref, site address) so
+    each legacy record is matched in constant time. The user mapping is loaded
+    once and new decisions are appended to a journal so that they are never
+    lost by rewriting the mapping file.
+    """
 
-def get_single_matching_record(id: str, current_records: list):
-    matching_records = [r for r in current_records if r["id"] == id]
-    if len(matching_records) == 0:
-        raise Exception(f"Could not find matching record in the new app: {id}")
-    elif len(matching_records) > 1:
-        raise Exception(f"More than one matching record found: {id}.")
-    else:
-        return matching_records[0]
+    def __init__(
+        self,
+        current_records: list,
+        user_mapping_path: str = "user_mapping.json",
+        journal_path: str = "user_mapping_journal.jsonl",
+    ):
+        self.user_mapping_path = user_mapping_path
+        self.journal_path = journal_path
+        self.user_mapping = self.load_user_mapping()
+
+        self.records_by_id = {}
+        self.records_by_match_key = {}
+        for current_record in current_records:
+            self.records_by_id[current_record["id"]] = current_record
+
+            match_key = get_record_match_key(
+                current_record["form_values"].get("c4ee", None),
+                current_record["form_values"].get("48ca", None),
+            )
+            self.records_by_match_key.setdefault(match_key, []).append(current_record)
 
+        logger.info(
+            f"Indexed {len(self.records_by_id)} current records ({len(self.user_mapping)} user mappings)"
+        )
 
-def get_matching_current_record(legacy_record: dict, current_records: list):
-    """Get the current record that matches the legacy record."""
+    def load_user_mapping(self):
+        """Load the user mapping file and replay the journal on top of it."""
+        user_mapping = {}
 
-    legacy_record_id = legacy_record["id"]
+        # Mappings are a dict where a legacy record ID points to a
+        # current record ID
+        if os.path.exists(self.user_mapping_path):
+            with open(self.user_mapping_path, "r") as f:
+                user_mapping = json.load(f)
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    user_mapping[entry["legacy_id"]] = entry["current_id"]
+
+        return user_mapping
+
+    def save_user_mapping(self, legacy_record_id: str, current_record_id: str):
+        """Record a user decision in the journal."""
+        self.user_mapping[legacy_record_id] = current_record_id
+
+        with open(self.journal_path, "a") as f:
+            f.write(
+                json.dumps(
+                    {"legacy_id": legacy_record_id, "current_id": current_record_id}
+                )
+                + "\n"
+            )
 
-    # If the user mapping file exists, load it
-    # If the user mapping file does not exist, create it
-    user_mapping = load_user_mapping()
+    def get_single_matching_record(self, id: str):
+        if id not in self.records_by_id:
+            raise Exception(f"Could not find matching record in the new app: {id}")
 
-    # Check if the legacy record ID is in the user mapping
-    if legacy_record_id in user_mapping:
-        # Return the current record that matches the user mapping
-        return get_single_matching_record(
-            user_mapping[legacy_record_id], current_records
-        )
+        return self.records_by_id[id]
 
-    # Get the pba ref from the legacy record
-    legacy_pba_ref = legacy_record["form_values"].get("c4ee", None)
+    def get_matching_current_record(self, legacy_record: dict):
+        """Get the current record that matches the legacy record."""
 
-    # Get the site address from the legacy record
-    legacy_site_address = legacy_record["form_values"].get("1b4b", None)
+        legacy_record_id = legacy_record["id"]
 
-    # Loop through all the current records
-    matching_records = []
-    for current_record in current_records:
-        # Check if the pba ref matches
-        current_pba_ref = current_record["form_values"].get("c4ee", None)
-        if not do_values_match(legacy_pba_ref, current_pba_ref):
-            continue
+        # Check if the legacy record ID is in the user mapping
+        if legacy_record_id in self.user_mapping:
+            # Return the current record that matches the user mapping
+            return self.get_single_matching_record(self.user_mapping[legacy_record_id])
 
-        # Check if the site address matches
-        current_site_address = current_record["form_values"].get("48ca", None)
-        if not does_site_address_match(legacy_site_address, current_site_address):
-            continue
+        # Match on the pba ref and site address of the legacy record
+        matching_records = self.records_by_match_key.get(
+            get_record_match_key(
+                legacy_record["form_values"].get("c4ee", None),
+                legacy_record["form_values"].get("1b4b", None),
+            ),
+            [],
+        )
 
-        # If we get here, the record matches
-        matching_records.append(current_record)
+        if len(matching_records) == 1:
+            return matching_records[0]
 
-    # If there are no matching records, return None
-    if not matching_records or len(matching_records) > 1:
         hint = ""
         if not matching_records:
             hint = "(no matching records found)"
@@ -170,23 +216,10 @@ def get_matching_current_record(legacy_record: dict, current_records: list):
         if user_input_record_id == "n":
             return None
 
-        # Save this user mapping to a file so we can use it in the future
-        user_mapping[legacy_record_id] = user_input_record_id
-
-        with open("user_mapping.json", "w") as f:
-            json.dump(user_mapping, f, indent=2)
-
-        return get_single_matching_record(user_input_record_id, current_records)
+        # Save this user mapping so we can use it in the future
+        self.save_user_mapping(legacy_record_id, user_input_record_id)
 
-    # If there is more than one matching record then there is a problem
-    if len(matching_records) > 1:
-        confirm_or_fail(
-            f"More than one matching record found: {', '.join([r['id'] for r in matching_records])}"
-        )
-        return matching_records
-
-    # Return the matching record
-    return matching_records[0]
+        return self.get_single_matching_record(user_input_record_id)
 
 
 def merge_choice_values(choice_values_1: dict, choice_values_2: dict):
@@ -435,10 +468,6 @@ def update_service_visit(legacy_service_visit: dict, current_service_visit: dict
     return did_update_take_place, current_service_visit
 
 
-if os.path.exists("missing_site_visits.txt"):
-    os.remove("missing_site_visits.txt")
-
-
 def log_missing_site_visit(
     parent_record_id: str, legacy_service_visit_id: str, *args, **kwargs
 ):
@@ -448,13 +477,6 @@ def log_missing_site_visit(
         )
 
 
-if os.path.exists("missing_records.txt"):
-    os.remove("missing_records.txt")
-
-if os.path.exists("multiple_record_matches.txt"):
-    os.remove("multiple_record_matches.txt")
-
-
 def rate_limited(max_per_second):
     """
     Decorator to limit the rate of function calls.
@@ -488,50 +510,252 @@ def update_fulcrum_record(id: str, record: dict):
         return False
 
 
-def are_changes_okay_confirm(dict_1: dict, dict_2: dict):
-    # Deep compare the dicts, log ALL the keys that are modified
-    # and ask the user to confirm the changes
-    # If the user does not confirm the changes, return False
-    # If the user confirms the changes, return True
-    # If there are no changes, return True
+def is_choice_value(value):
+    """Check if a form value is a choice field value."""
+    return isinstance(value, dict) and (
+        "choice_values" in value or "other_values" in value
+    )
 
-    # Deep compare using deepdiff
-    diff = DeepDiff(dict_1, dict_2, ignore_order=True)
 
-    # Get the keys that are modified
-    keys_modified = diff.affected_paths.items
+def is_repeatable_value(value):
+    """Check if a form value is a list of repeatable entries."""
+    return (
+        isinstance(value, list)
+        and len(value) > 0
+        and all(isinstance(entry, dict) and "id" in entry for entry in value)
+    )
 
-    # Common translations for readability
-    translations_regex = {
-        r"root\['form_values'\]\['3bdb'\]\[\d+\]\['version'\]": "Service visit entry version",
-        r"root\['form_values'\]\['3bdb'\]\[\d+\]\['form_values'\]\['e77c'\]": "Service visit entry photos",
-        r"root\['form_values'\]\['3bdb'\]\[\d+\]\['form_values'\]\['2d29'\]": "Service visit entry notes",
-        r"root\['form_values'\]\['3bdb'\]\[\d+\]\['form_values'\]\['8fb1'\]": "Service visit entry video",
-        r"root\['form_values'\]\['3bdb'\]\[\d+\]\['form_values'\]\['8eaf'\]": "Service visit entry date",
-    }
 
-    keys_modified_readable = []
-    for key in keys_modified:
-        has_translation_matched = False
-        for regex, readable in translations_regex.items():
-            if re.match(regex, key):
-                # Get the index of the service visit
-                service_visit_index = "N/A"
-                try:
-                    service_visit_index = (
-                        int(re.sub(r"[\[\]]", "", (re.findall(r"\[\d+\]", key)[0]))) + 1
-                    )
-                except:
-                    pass
+def do_choice_values_match(choice_value_1: dict, choice_value_2: dict):
+    """Compare two choice values ignoring the order of the choices."""
+    for key in ["choice_values", "other_values"]:
+        if set(choice_value_1.get(key) or []) != set(choice_value_2.get(key) or []):
+            return False
+
+    return True
+
 
-                keys_modified_readable.append(
-                    f"Visit {service_visit_index} => {readable}"
+def diff_form_values(before: dict, after: dict, path: list, patch: list):
+    """
+    Diff two form_values dicts by field key.
+    Repeatables are matched by entry ID and choice values are compared as sets.
+    """
+    before = before or {}
+    after = after or {}
+
+    for key, after_value in after.items():
+        if key not in before:
+            patch.append({"op": "add", "path": path + [key], "value": after_value})
+            continue
+
+        before_value = before[key]
+
+        if is_repeatable_value(before_value) or is_repeatable_value(after_value):
+            diff_repeatable_entries(
+                before_value or [], after_value or [], path + [key], patch
+            )
+        elif is_choice_value(before_value) and is_choice_value(after_value):
+            if not do_choice_values_match(before_value, after_value):
+                patch.append(
+                    {"op": "replace", "path": path + [key], "value": after_value}
                 )
-                has_translation_matched = True
+        elif before_value != after_value:
+            patch.append({"op": "replace", "path": path + [key], "value": after_value})
+
+    for key in before:
+        if key not in after:
+            patch.append({"op": "remove", "path": path + [key]})
+
+
+def diff_repeatable_entries(before: list, after: list, path: list, patch: list):
+    """Diff two lists of repeatable entries, matching the entries by ID."""
+    before_by_id = {entry["id"]: entry for entry in before}
+    after_ids = set()
+
+    for entry in after:
+        entry_id = entry["id"]
+        after_ids.add(entry_id)
+        entry_path = path + [entry_id]
+
+        if entry_id not in before_by_id:
+            patch.append({"op": "add", "path": entry_path, "value": entry})
+            continue
+
+        diff_record_values(before_by_id[entry_id], entry, entry_path, patch)
+
+    for entry_id in before_by_id:
+        if entry_id not in after_ids:
+            patch.append({"op": "remove", "path": path + [entry_id]})
+
+
+def diff_record_values(before: dict, after: dict, path: list, patch: list):
+    """Diff a record or repeatable entry, descending into its form values."""
+    for key, after_value in after.items():
+        if key == "form_values":
+            diff_form_values(
+                before.get("form_values"), after_value, path + [key], patch
+            )
+        elif key not in before:
+            patch.append({"op": "add", "path": path + [key], "value": after_value})
+        elif before[key] != after_value:
+            patch.append({"op": "replace", "path": path + [key], "value": after_value})
+
+    for key in before:
+        if key not in after:
+            patch.append({"op": "remove", "path": path + [key]})
+
+
+def diff_records(before: dict, after: dict):
+    """Get the patch that turns one record into another."""
+    patch = []
+    diff_record_values(before, after, [], patch)
+    return patch
+
+
+def find_patch_target(container, key):
+    """Get a repeatable entry by ID or a value by key, None if it is missing."""
+    if isinstance(container, list):
+        return next((entry for entry in container if entry["id"] == key), None)
+
+    if isinstance(container, dict):
+        return container.get(key)
+
+    return None
+
+
+def apply_record_patch(record: dict, patch: list):
+    """
+    Apply a patch from diff_records to a record (in place).
+    Operations whose target is no longer in the record are skipped and
+    returned.
+    """
+    skipped = []
+    for operation in patch:
+        container = record
+        for key in operation["path"][:-1]:
+            container = find_patch_target(container, key)
+            if container is None:
                 break
 
-        if not has_translation_matched:
-            keys_modified_readable.append(key)
+        if container is None:
+            logger.warning(
+                f"Skipping {operation['op']} of {operation['path']}, the path is not in the record"
+            )
+            skipped.append(operation)
+            continue
+
+        key = operation["path"][-1]
+        if isinstance(container, list):
+            index = next(
+                (i for i, entry in enumerate(container) if entry["id"] == key), None
+            )
+            if operation["op"] == "remove":
+                if index is None:
+                    logger.warning(
+                        f"Skipping remove of {operation['path']}, the entry is not in the record"
+                    )
+                    skipped.append(operation)
+                else:
+                    container.pop(index)
+            elif index is None:
+                container.append(operation["value"])
+            else:
+                container[index] = operation["value"]
+        elif operation["op"] == "remove":
+            container.pop(key, None)
+        else:
+            container[key] = operation["value"]
+
+    return skipped
+
+
+# Common translations for readability, keyed on the repeatable key and the
+# path within a repeatable entry
+PATCH_PATH_TRANSLATIONS = {
+    ("3bdb", "version"): "Service visit entry version",
+    ("3bdb", "form_values", "e77c"): "Service visit entry photos",
+    ("3bdb", "form_values", "2d29"): "Service visit entry notes",
+    ("3bdb", "form_values", "8fb1"): "Service visit entry video",
+    ("3bdb", "form_values", "8eaf"): "Service visit entry date",
+}
+
+
+def summarize_record_patch(patch: list, record: dict):
+    """Get a readable line for each change in a patch."""
+    # The position of each repeatable entry in the updated record
+    entry_positions = {}
+    for value in record.get("form_values", {}).values():
+        if is_repeatable_value(value):
+            for i, entry in enumerate(value):
+                entry_positions[entry["id"]] = i + 1
+
+    summary = []
+    for operation in patch:
+        path = operation["path"]
+
+        readable = None
+        if len(path) > 3 and path[0] == "form_values":
+            readable = PATCH_PATH_TRANSLATIONS.get((path[1], *path[3:]))
+
+        if readable:
+            summary.append(
+                f"Visit {entry_positions.get(path[2], 'N/A')} => {readable}"
+            )
+        else:
+            summary.append(
+                f"{operation['op']} root" + "".join(f"['{key}']" for key in path)
+            )
+
+    return summary
+
+
+def write_record_patch(record_id: str, patch: list, confirmed: bool):
+    """Append a record patch to the audit file so it can be reviewed or replayed."""
+    with open("record_patches.jsonl", "a") as f:
+        f.write(
+            json.dumps({"record_id": record_id, "confirmed": confirmed, "patch": patch})
+            + "\n"
+        )
+
+
+def replay_record_patches(path: str):
+    """
+    Apply the confirmed patches from an audit file to the records as they are
+    now in Fulcrum. Patches that were not confirmed are ignored.
+    """
+    with open(path, "r") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+
+    confirmed_entries = [entry for entry in entries if entry["confirmed"]]
+    logger.info(
+        f"Replaying {len(confirmed_entries)} of {len(entries)} patches from {path}"
+    )
+
+    updated_records = 0
+    for entry in tqdm(confirmed_entries, desc="Replaying patches"):
+        record = FULCRUM.records.find(entry["record_id"])["record"]
+
+        skipped = apply_record_patch(record, entry["patch"])
+        if skipped:
+            with open("skipped_patch_operations.jsonl", "a") as f:
+                f.write(
+                    json.dumps({"record_id": entry["record_id"], "patch": skipped})
+                    + "\n"
+                )
+
+        if update_fulcrum_record(entry["record_id"], record):
+            updated_records += 1
+
+    logger.info(f"Updated {updated_records} records")
+
+
+def are_changes_okay_confirm(before: dict, after: dict):
+    # Compare the records, log ALL the keys that are modified
+    # and ask the user to confirm the changes
+    # If the user does not confirm the changes, return False
+    # If the user confirms the changes, return True
+    patch = diff_records(before, after)
+    keys_modified_readable = summarize_record_patch(patch, after)
 
     # Ask the user to confirm the changes
     user_input = input(
@@ -540,18 +764,31 @@ def are_changes_okay_confirm(dict_1: dict, dict_2: dict):
         + "\x1b[0m\nContinue? (y/n): "
     )
 
-    if user_input.lower() not in ["y", "yes"]:
-        return False, keys_modified_readable
+    confirmed = user_input.lower() in ["y", "yes"]
+    write_record_patch(after["id"], patch, confirmed)
+
+    return confirmed, keys_modified_readable
+
 
-    return True, keys_modified_readable
+def main(argv=None):
+    load_dotenv()
+    args = parser.parse_args(argv)
+    configure(args)
 
+    if args.replay:
+        replay_record_patches(args.replay)
+        return
+
+    for path in ["missing_records.txt", "missing_site_visits.txt"]:
+        if os.path.exists(path):
+            os.remove(path)
 
-def main():
     # Get all the legacy records
     legacy_records = get_records("Invasive Plants Management Records (LEGACY)")
 
     # Get all the current records
     current_records = get_records("SITE VISIT RECORDS")
+    record_matcher = RecordMatcher(current_records)
 
     # Find the matching data entries
     current_record, copy_of_current_record = None, None
@@ -573,7 +810,7 @@ def main():
         )
 
         # Get matching current record
-        current_record = get_matching_current_record(legacy_record, current_records)
+        current_record = record_matcher.get_matching_current_record(legacy_record)
         copy_of_current_record = copy.deepcopy(current_record)
 
         if not current_record:
@@ -586,16 +823,6 @@ def main():
                 )
             continue
 
-        if isinstance(current_record, list) and len(current_record) > 1:
-            confirm_or_fail(
-                f"More than one matching record found: {legacy_record['id']} -> {legacy_record['form_values'].get('c4ee', 'No ID')}."
-            )
-            with open("multiple_record_matches.txt", "a") as f:
-                f.write(
-                    f"{legacy_record['id']} -> {legacy_record['form_values'].get('c4ee', 'No ID')}\n"
-                )
-            continue
-
         current_record_id = current_record["id"]
 
         if current_record_id == "b4ff5cfa-9e1a-4a7f-8732-a2a5b31f07d5":
@@ -659,7 +886,7 @@ def main():
 
             # Perform the update
             have_changes_been_confirmed, updated_key_paths = are_changes_okay_confirm(
-                current_record, copy_of_current_record
+                copy_of_current_record, current_record
             )
             if have_changes_been_confirmed:
                 with open("updated_key_paths.txt", "a") as f:
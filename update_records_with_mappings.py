@@ -1,149 +1,127 @@
 import argparse
 import json
 import os
-import time
 
-from dotenv import load_dotenv
 from fulcrum import Fulcrum
 from tqdm import tqdm
 
-load_dotenv()
+from fulcrum_helpers.config import configure_logging, load_env
+from fulcrum_helpers.helpers import get_records_by_id
+from fulcrum_helpers.migrations import (MATCH_POSITION, FieldMigration,
+                                        MigrationPlan)
+from fulcrum_helpers.patch import RecordPatcher
+from fulcrum_helpers.resilience import ResilientWriter
+from fulcrum_helpers.transport import Transport, use_transport
 
 parser = argparse.ArgumentParser(description="Update records.")
 parser.add_argument(
     "--record_mappings_file", "-r", help="The file containing the record mappings."
 )
 
-args = parser.parse_args()
+# Set from the arguments by configure()
 
-FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
-FULCRUM = Fulcrum(FULCRUM_API_KEY)
+RECORD_MAPPINGS_FILE = None  # type: str
 
+FULCRUM_API_KEY = None  # type: str
+TRANSPORT = None  # type: Transport
+FULCRUM = None  # type: Fulcrum
+WRITER = None  # type: ResilientWriter
+PATCHER = None  # type: RecordPatcher
 
-def traverse_search_record_for_key(record: dict, key: str):
+
+def configure(args):
     """
-    Recursively search a record for a key
+    Set the constants and the API clients from the parsed arguments
     """
+    global RECORD_MAPPINGS_FILE, FULCRUM_API_KEY, TRANSPORT, FULCRUM, WRITER, PATCHER
 
-    found_record = None
-
-    # If the record is a list, iterate over it
-    if isinstance(record, list):
-        for item in record:
-            found_record = traverse_search_record_for_key(item, key)
-            if found_record:
-                break
-    # If the record is a dict, check if it has the key
-    elif isinstance(record, dict):
-        if key in record:
-            return record[key]
-        else:
-            for v in record.values():
-                found_record = traverse_search_record_for_key(v, key)
-                if found_record:
-                    break
-    return found_record
-
-
-def get_updated_record(old_record: dict, new_record: dict):
-    # =====================
-    # Update the "Plant Name" field (old key: "6008", new key: "4361")
-    # This can be found within the repeatable section "Stand Details" (old key: "d93c", new key: "562d")
-
-    # Find this repeatable section (by key) within the old record
-    # Loop through each repeatable and match to the new record equivalent
-    # Do this by comparing all the values for each field in the repeatable
-    # If there is no match, throw an error
-    # If there is a match, we update the repeatable to include an key/value pair
-    # of { "6008": {old_record_6008_object} }
-
-    # If the "Plant Name" field (key: "6008") cannot be found within the old record
-    # we can skip this. This is because, there will not be a key if there was no
-    # value set for this field.
-
-    old_d93c_value = traverse_search_record_for_key(old_record, "d93c")
-    if not old_d93c_value:
-        print(f"No d93c value found for old record ID: {old_record['id']}")
-        print("Skipping this record")
-        return new_record
-
-    new_562d_value = traverse_search_record_for_key(new_record, "562d")
-    if not new_562d_value:
-        print(f"No 562d value found for new record ID: {new_record['id']}")
-        raise Exception("This section should always exist")
-
-    # Loop through each repeatable in the new record
-    for i, new_repeatable in enumerate(new_562d_value):
-        old_6008_value = traverse_search_record_for_key(
-            old_d93c_value[i]["form_values"], "6008"
-        )
+    RECORD_MAPPINGS_FILE = args.record_mappings_file
 
-        if not old_6008_value:
-            print(f"No 6008 value found for old record ID: {old_record['id']}")
-            print("Skipping this repeatable")
-            continue
+    FULCRUM_API_KEY = os.getenv("FULCRUM_API_KEY")
+    TRANSPORT = Transport(FULCRUM_API_KEY)
+    FULCRUM = use_transport(Fulcrum(FULCRUM_API_KEY), TRANSPORT)
+    WRITER = ResilientWriter(
+        dead_letter_path="update_records_with_mappings_dead_letter.jsonl"
+    )
+    PATCHER = RecordPatcher(TRANSPORT, WRITER)
 
-        # Add the "4361" new key equivalent to the repeatable
-        # Set it to the old "6008" value
-        new_repeatable["form_values"]["4361"] = old_6008_value
-    # =====================
 
-    return new_record
+# =====================
+# The fields to migrate from the old records to the new records
+# Add your migrations here
+# =====================
+MIGRATIONS = [
+    # "Plant Name" (old key: "6008", new key: "4361") within the repeatable
+    # "Stand Details" (old key: "d93c", new key: "562d")
+    FieldMigration(["d93c", "6008"], ["562d", "4361"], match=MATCH_POSITION),
+]
 
 
-def rate_limited(max_per_second):
+def prefetch_records(record_mappings: dict) -> dict:
     """
-    Decorator to limit the rate of function calls.
+    Get every record of the old and new apps in bulk, indexed by ID.
+    The apps are found from the first pair of records in the mappings.
     """
-    minimum_interval = 1.0 / float(max_per_second)
+    if not record_mappings:
+        return {}
 
-    def decorate(func):
-        last_time_called = [0.0]
+    old_record_id, new_record_id = next(iter(record_mappings.items()))
+    form_ids = {
+        FULCRUM.records.find(old_record_id)["record"]["form_id"],
+        FULCRUM.records.find(new_record_id)["record"]["form_id"],
+    }
 
-        def rate_limited_function(*args, **kargs):
-            elapsed = time.perf_counter() - last_time_called[0]
-            left_to_wait = minimum_interval - elapsed
-            if left_to_wait > 0:
-                time.sleep(left_to_wait)
-            ret = func(*args, **kargs)
-            last_time_called[0] = time.perf_counter()
-            return ret
+    records_by_id = {}
+    for form_id in form_ids:
+        records_by_id.update(get_records_by_id(TRANSPORT, form_id))
 
-        return rate_limited_function
+    print(f"Prefetched {len(records_by_id)} records from {len(form_ids)} apps")
+    return records_by_id
 
-    return decorate
 
+def get_record(records_by_id: dict, record_id: str) -> dict:
+    """
+    Get a prefetched record, records from other apps are fetched on their own
+    """
+    if record_id not in records_by_id:
+        records_by_id[record_id] = FULCRUM.records.find(record_id)["record"]
 
-# Rate limited for 4000 calls per hour (actual limit is 5000/h but we want to be safe)
-@rate_limited(4000 / 3600)
-def update_record(id: str, record: dict):
-    FULCRUM.records.update(id, record)
-    print(f"Updated record: {record['record']['id']}")
+    return records_by_id[record_id]
 
 
-def main():
+def main(argv=None):
+    load_env()
+    configure(parser.parse_args(argv))
+
+    configure_logging()
+
     record_mappings = {}
 
-    with open(args.record_mappings_file) as f:
+    with open(RECORD_MAPPINGS_FILE) as f:
         record_mappings = json.load(f)
 
-    progress_bar = tqdm(
-        record_mappings.items(),
-        total=len(record_mappings),
-        desc="Updating records",
+    records_by_id = prefetch_records(record_mappings)
+
+    # Every migration is applied in one pass over the record pairs
+    plan = MigrationPlan(MIGRATIONS)
+    results = plan.apply_all(
+        (
+            get_record(records_by_id, old_record_id),
+            get_record(records_by_id, new_record_id),
+        )
+        for old_record_id, new_record_id in record_mappings.items()
     )
 
-    # Loop for each key/value pair in the record mappings
-    for old_record_id, new_record_id in progress_bar:
-        old_record = FULCRUM.records.find(old_record_id)["record"]
-        new_record = FULCRUM.records.find(new_record_id)["record"]
+    progress_bar = tqdm(results, total=len(results), desc="Updating records")
 
-        progress_bar.set_description(f"Updating record: {old_record_id}")
-        updated_record = get_updated_record(old_record, new_record)
-        update_record(updated_record["id"], {"record": updated_record})
+    updated_count = 0
+    for result in progress_bar:
+        progress_bar.set_description(f"Updating record: {result.original['id']}")
+        if PATCHER.update(result.original, result.updated):
+            updated_count += 1
 
     progress_bar.close()
-    print("Finished updating records")
+    print(f"Finished updating {updated_count} of {len(results)} records")
 
 
 if __name__ == "__main__":